@@ -0,0 +1,60 @@
+"""
+Production settings for bizapp: the development settings minus what a
+deployed API doesn't use. Selected with
+DJANGO_SETTINGS_MODULE=bizapp.settings_production, which gunicorn.conf.py
+sets by default.
+"""
+import os
+
+from .settings import *  # noqa: F401,F403
+from .settings import INSTALLED_APPS, MIDDLEWARE, REST_FRAMEWORK, SECRET_KEY, TEMPLATES
+
+DEBUG = os.getenv('DEBUG', '0') == '1'
+SECRET_KEY = os.getenv('SECRET_KEY', SECRET_KEY)
+
+# Requests arrive through Render's router, which appends the client address to
+# X-Forwarded-For; trust only that entry.
+REST_FRAMEWORK = {**REST_FRAMEWORK, 'NUM_PROXIES': int(os.getenv('NUM_PROXIES', 1))}
+
+# The browsable API is for development (settings.py only adds it because DEBUG is on there).
+if not DEBUG:
+    REST_FRAMEWORK = {
+        **REST_FRAMEWORK,
+        'DEFAULT_RENDERER_CLASSES': tuple(
+            renderer for renderer in REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES']
+            if renderer != 'rest_framework.renderers.BrowsableAPIRenderer'
+        ),
+    }
+
+# Clients authenticate with tokens, so sessions, messages, CSRF and the
+# session-based auth middleware only serve the admin site. Leave them out
+# unless ADMIN_ENABLED=1: less to import in each worker, and fewer
+# middleware layers on every request.
+ADMIN_ENABLED = os.getenv('ADMIN_ENABLED', '0') == '1'
+if not ADMIN_ENABLED:
+    ADMIN_ONLY_APPS = {
+        'django.contrib.admin',
+        'django.contrib.sessions',
+        'django.contrib.messages',
+    }
+    ADMIN_ONLY_MIDDLEWARE = {
+        'django.contrib.sessions.middleware.SessionMiddleware',
+        'django.middleware.csrf.CsrfViewMiddleware',
+        'django.contrib.auth.middleware.AuthenticationMiddleware',
+        'django.contrib.messages.middleware.MessageMiddleware',
+    }
+    INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in ADMIN_ONLY_APPS]
+    MIDDLEWARE = [middleware for middleware in MIDDLEWARE if middleware not in ADMIN_ONLY_MIDDLEWARE]
+    TEMPLATES = [
+        {
+            **template,
+            'OPTIONS': {
+                **template['OPTIONS'],
+                'context_processors': [
+                    processor for processor in template['OPTIONS']['context_processors']
+                    if processor != 'django.contrib.messages.context_processors.messages'
+                ],
+            },
+        }
+        for template in TEMPLATES
+    ]
@@ -1,15 +1,26 @@
-from django.urls import path, include
-from django.contrib import admin
+from django.apps import apps
+from django.urls import path, include, re_path
 from django.conf import settings
-from django.conf.urls.static import static
+from residences.views import metrics, serve_media, serve_media_async
 
 urlpatterns = [
-    path('admin/', admin.site.urls),
     path('api/', include('residences.urls')),
+    path('metrics', metrics, name='metrics'),
 ]
 
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# Production settings leave the admin out unless ADMIN_ENABLED=1.
+if apps.is_installed('django.contrib.admin'):
+    from django.contrib import admin
+    urlpatterns.insert(0, path('admin/', admin.site.urls))
+
+# Filesystem media is served by the app in every mode, not just DEBUG; object
+# storage URLs point at the bucket (or CDN) instead.
+if settings.MEDIA_STORAGE == 'filesystem':
+    urlpatterns.append(re_path(
+        rf'^{settings.MEDIA_URL.lstrip("/")}(?P<name>.+)$',
+        serve_media_async if settings.SERVER_MODE == 'asgi' else serve_media,
+        name='serve_media',
+    ))
 
 
 
@@ -0,0 +1,113 @@
+"""
+Gunicorn settings for bizapp, read from the working directory (see procfile).
+
+The app is imported once in the master and workers are forked from it, so
+Django, DRF, Pillow and the project's modules are shared copy-on-write
+instead of being imported and held once per worker. Everything here can be
+tuned from the environment:
+
+  GUNICORN_WORKERS (or WEB_CONCURRENCY)  processes; default 2 x CPUs + 1 (counting the
+                                         container's CPU quota), capped so the workers'
+                                         database connections fit in DB_MAX_CONNECTIONS
+  GUNICORN_THREADS                       threads per sync worker; default 1
+  GUNICORN_WORKER_CLASS                  default sync; uvicorn.workers.UvicornWorker for SERVER_MODE=asgi
+  GUNICORN_MAX_REQUESTS                  recycle a worker after this many requests; default 0 (never),
+                                         since image variant and transcode jobs run in the worker
+  GUNICORN_MAX_REQUESTS_JITTER           random extra requests, so workers don't recycle together
+  GUNICORN_TIMEOUT, GUNICORN_KEEPALIVE   seconds
+  GUNICORN_PRELOAD                       0 to import the app in each worker instead
+"""
+import gc
+import math
+import os
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bizapp.settings_production')
+
+from django.conf import settings  # noqa: E402  (reads the settings module only, not the apps)
+
+
+def available_cpus():
+    """CPUs this process may use: the cgroup quota when one is set, else the affinity mask."""
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count() or 1
+    for quota_file, period_file in (('/sys/fs/cgroup/cpu.max', None),
+                                    ('/sys/fs/cgroup/cpu/cpu.cfs_quota_us', '/sys/fs/cgroup/cpu/cpu.cfs_period_us')):
+        try:
+            with open(quota_file) as f:
+                quota, _, period = f.read().partition(' ')
+            if period_file:
+                with open(period_file) as f:
+                    period = f.read()
+        except OSError:
+            continue
+        if quota.strip() not in ('max', '-1'):
+            return max(1, min(cpus, math.ceil(int(quota) / int(period))))
+        break
+    return cpus
+
+
+def connections_per_worker():
+    # A pool caps the process; otherwise each request thread and background job thread holds its own.
+    pool = settings.DATABASES['default'].get('OPTIONS', {}).get('pool')
+    if pool:
+        return pool.get('max_size', 4)
+    background = settings.IMAGE_VARIANTS_WORKERS if settings.IMAGE_VARIANTS_ASYNC else 0
+    if settings.VIDEO_TRANSCODE_ENABLED and settings.VIDEO_TRANSCODE_ASYNC:
+        background += settings.VIDEO_TRANSCODE_WORKERS
+    return threads + background
+
+
+wsgi_app = f"bizapp.{os.getenv('SERVER_MODE', 'wsgi')}:application"
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'sync')
+threads = int(os.getenv('GUNICORN_THREADS', 1))
+workers = int(os.getenv('GUNICORN_WORKERS') or os.getenv('WEB_CONCURRENCY') or max(1, min(
+    available_cpus() * 2 + 1, settings.DB_MAX_CONNECTIONS // connections_per_worker(),
+)))
+# Off by default: recycling a worker drops its queued image variant and
+# transcode jobs (requeue_transcodes picks up lost transcodes).
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', max_requests // 10))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') == '1'
+# Heartbeat files on tmpfs, so a slow disk can't stall workers into timeouts.
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+accesslog = os.getenv('GUNICORN_ACCESS_LOG') or None
+
+if preload_app:
+    # No collections in the master while the app loads: freeing objects there
+    # leaves holes in pages that would then be copied into every worker.
+    gc.disable()
+
+
+def when_ready(server):
+    if not preload_app:
+        return
+    from django.core.files.storage import storages
+    from django.db import connections
+    from django.urls import get_resolver
+
+    # Import the views and build the media storage now, so workers share them
+    # rather than each doing it on its first request.
+    get_resolver().url_patterns
+    storages['default']
+    # A connection opened by an import mustn't be inherited by every worker.
+    connections.close_all()
+    # Move everything loaded so far out of the collector's reach: collections in
+    # the workers then never write to (and so never copy) the shared pages.
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    if preload_app:
+        gc.enable()
+
+
+def worker_exit(server, worker):
+    # Let queued background jobs finish on a graceful stop, until the arbiter's
+    # timeout kills the worker.
+    from residences.tasks import wait_for_background_jobs
+
+    wait_for_background_jobs()
@@ -1,7 +1,10 @@
 from django.contrib import admin
-from .models import CustomUser, Residence, Image, Video
+from .models import Plan, CustomUser, Residence, Image, Video, VideoUpload, MediaBlob
 
+admin.site.register(Plan)
 admin.site.register(CustomUser)
 admin.site.register(Residence)
 admin.site.register(Image)
 admin.site.register(Video)
+admin.site.register(VideoUpload)
+admin.site.register(MediaBlob)
@@ -0,0 +1,114 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import router
+from django.db.models.fields.files import FieldFile
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import TokenAuthentication, get_authorization_header
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+from .cache import get_cache
+
+
+def token_key(key):
+    return f'residences:auth-token:{key}'
+
+
+def user_key(user_id):
+    return f'residences:auth-user-fields:{user_id}'
+
+
+# Never copied into the cache, which may be shared and isn't a secret store.
+SECRET_FIELDS = {'password'}
+
+
+def cached_fields(user):
+    """The user's column values minus SECRET_FIELDS, with files as their names."""
+    values = {}
+    for field in user._meta.concrete_fields:
+        if field.attname not in SECRET_FIELDS:
+            value = getattr(user, field.attname)
+            values[field.attname] = value.name if isinstance(value, FieldFile) else value
+    return values
+
+
+def cached_user(values):
+    # Rebuilt as if loaded from the database, with the secret fields deferred:
+    # reading one (say, to check a password) fetches it then.
+    model = get_user_model()
+    return model.from_db(router.db_for_read(model), list(values), list(values.values()))
+
+
+def remember_token(token, user):
+    get_cache().set_many(
+        {token_key(token.key): user.pk, user_key(user.pk): cached_fields(user)},
+        settings.AUTH_TOKEN_CACHE_TIMEOUT,
+    )
+
+
+def forget_token(key):
+    get_cache().delete(token_key(key))
+
+
+def forget_user(user_id):
+    get_cache().delete(user_key(user_id))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication with the token -> user lookup served from the cache.
+
+    Entries expire after AUTH_TOKEN_CACHE_TIMEOUT and are evicted when the
+    token is deleted (logout) or the user row changes (see signals.py), so
+    revocation and deactivation take effect immediately.
+    """
+
+    def authenticate_credentials(self, key):
+        cache = get_cache()
+        user_id = cache.get(token_key(key))
+        values = cache.get(user_key(user_id)) if user_id is not None else None
+        if values is None:
+            user, token = super().authenticate_credentials(key)
+            remember_token(token, user)
+            return (user, token)
+        user = cached_user(values)
+        if not user.is_active:
+            raise AuthenticationFailed(_('User inactive or deleted.'))
+        return (user, Token(key=key, user=user))
+
+
+async def aauthenticate(request):
+    """
+    Async counterpart of CachedTokenAuthentication for plain Django async views.
+
+    Returns the user for a valid ``Authorization: Token ...`` header, ``None``
+    when no token was sent, and raises AuthenticationFailed otherwise.
+    """
+    auth = get_authorization_header(request).split()
+    if not auth or auth[0].lower() != b'token':
+        return None
+    if len(auth) != 2:
+        raise AuthenticationFailed(_('Invalid token header.'))
+    try:
+        key = auth[1].decode()
+    except UnicodeError:
+        raise AuthenticationFailed(_('Invalid token header. Token string should not contain invalid characters.'))
+
+    cache = get_cache()
+    user_id = await cache.aget(token_key(key))
+    values = await cache.aget(user_key(user_id)) if user_id is not None else None
+    if values is None:
+        try:
+            token = await Token.objects.select_related('user').aget(key=key)
+        except Token.DoesNotExist:
+            raise AuthenticationFailed(_('Invalid token.'))
+        user = token.user
+        await cache.aset_many(
+            {token_key(key): user.pk, user_key(user.pk): cached_fields(user)},
+            settings.AUTH_TOKEN_CACHE_TIMEOUT,
+        )
+    else:
+        user = cached_user(values)
+    if not user.is_active:
+        raise AuthenticationFailed(_('User inactive or deleted.'))
+    return user
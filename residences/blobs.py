@@ -0,0 +1,63 @@
+import os
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import MediaBlob
+
+
+def blob_name(field, digest, filename):
+    """Content-addressed storage name: ``<upload_to><2 hex digits>/<sha256><extension>``."""
+    extension = os.path.splitext(filename)[1].lower()[:10]
+    return f'{field.upload_to}{digest[:2]}/{digest}{extension}'
+
+
+def delete_files(storage, names):
+    for name in names:
+        storage.delete(name)
+
+
+def acquire_blob(field, upload, digest):
+    """
+    Take a reference on the stored copy of ``upload``, storing it if it's new.
+
+    Content that is already stored isn't written again. Returns ``(name,
+    written)``: the storage name for the row, and whether the file was
+    written by this call (so the caller can delete it on rollback).
+    """
+    for attempt in range(2):
+        with transaction.atomic():
+            blob = MediaBlob.objects.select_for_update().filter(pk=digest).first()
+            if blob is not None:
+                MediaBlob.objects.filter(pk=digest).update(ref_count=F('ref_count') + 1)
+                return blob.name, False
+
+        name = field.storage.save(blob_name(field, digest, upload.name), upload)
+        try:
+            with transaction.atomic():
+                MediaBlob.objects.create(content_hash=digest, name=name, size=upload.size, ref_count=1)
+            return name, True
+        except IntegrityError:
+            # Another request stored the same content first; use its copy.
+            field.storage.delete(name)
+            if attempt:
+                raise
+
+
+def release_blob(name):
+    """
+    Drop one reference to the stored file ``name``.
+
+    Returns True when nothing refers to the file any more and it should be
+    deleted: this was the blob's last reference, or the file was never
+    content-addressed (stored before blobs, or a direct upload).
+    """
+    with transaction.atomic():
+        blob = MediaBlob.objects.select_for_update().filter(name=name).first()
+        if blob is None:
+            return True
+        if blob.ref_count > 1:
+            MediaBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') - 1)
+            return False
+        blob.delete()
+        return True
@@ -0,0 +1,140 @@
+import codecs
+import csv
+import datetime
+import decimal
+import itertools
+import json
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+
+from .authentication import forget_user
+from .cache import bump_list_generation
+from .geo import location_geohash
+from .models import Residence
+from .quotas import reserve_residences
+from .serializers import ResidenceSerializer
+
+CSV_TYPES = ('text/csv', 'application/csv')
+NDJSON_TYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl')
+EXPORT_FIELDS = [
+    'id', 'user', 'name', 'address', 'residence_type', 'room_price', 'rooms_include', 'description',
+    'cover_image', 'rooms_available', 'number_of_rooms_available', 'room_available_date', 'last_updated',
+    'business_contacts', 'business_email', 'latitude', 'longitude',
+]
+# Media can't travel in a CSV/NDJSON row; attach it afterwards through the media endpoint.
+IGNORED_IMPORT_FIELDS = ('id', 'user', 'cover_image', 'cover_image_variants', 'images', 'videos', 'last_updated')
+
+
+class RowError(Exception):
+    pass
+
+
+def read_rows(stream, content_type):
+    """
+    Yield ``(row_number, dict or RowError)`` from a CSV or NDJSON body, reading
+    it a line at a time.
+    """
+    lines = codecs.iterdecode(stream, 'utf-8-sig')
+    if content_type in CSV_TYPES:
+        for number, row in enumerate(csv.DictReader(lines), start=1):
+            if None in row:
+                yield number, RowError('Row has more columns than the header.')
+            else:
+                # Blank CSV cells mean "not provided".
+                yield number, {key: value for key, value in row.items() if value != ''}
+    else:
+        for number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                yield number, RowError('Invalid JSON.')
+                continue
+            yield number, row if isinstance(row, dict) else RowError('Each line must be a JSON object.')
+
+
+def import_residences(user, rows):
+    """
+    Validate and insert residences for ``user`` from ``(row_number, row)`` pairs.
+
+    Rows are validated with ResidenceSerializer and inserted with bulk_create,
+    one transaction per BULK_IMPORT_BATCH_SIZE rows. bulk_create skips the
+    post_save signals, so each batch reserves its residence quota itself and
+    retires the cached list pages on commit. Returns the number created and
+    the per-row errors.
+    """
+    created = 0
+    errors = []
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, settings.BULK_IMPORT_BATCH_SIZE))
+        if not batch:
+            break
+
+        valid = []
+        for number, row in batch:
+            if isinstance(row, RowError):
+                errors.append({'row': number, 'errors': {'non_field_errors': [str(row)]}})
+                continue
+            data = {key: value for key, value in row.items() if key not in IGNORED_IMPORT_FIELDS}
+            data['user'] = user.pk
+            serializer = ResidenceSerializer(data=data)
+            if serializer.is_valid():
+                residence = Residence(**serializer.validated_data)
+                # bulk_create skips Residence.save(), which derives the geohash.
+                residence.geohash = location_geohash(residence.latitude, residence.longitude)
+                valid.append((number, residence))
+            else:
+                errors.append({'row': number, 'errors': serializer.errors})
+        if not valid:
+            continue
+
+        with transaction.atomic():
+            granted = reserve_residences(user, len(valid))
+            for number, _ in valid[granted:]:
+                errors.append({'row': number, 'errors': {'non_field_errors': ['Residence limit for your plan reached.']}})
+            if granted:
+                Residence.objects.bulk_create([residence for _, residence in valid[:granted]])
+                created += granted
+                transaction.on_commit(bump_list_generation)
+                transaction.on_commit(lambda: forget_user(user.pk))
+
+    errors.sort(key=lambda error: error['row'])
+    return created, errors
+
+
+def export_value(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    return value
+
+
+class Echo:
+    # csv.writer target that hands each formatted line straight back.
+    def write(self, value):
+        return value
+
+
+def export_rows(queryset, media_url):
+    """Yield export rows as dicts, fetching BULK_EXPORT_CHUNK_SIZE rows at a time."""
+    for values in queryset.values_list(*EXPORT_FIELDS).iterator(chunk_size=settings.BULK_EXPORT_CHUNK_SIZE):
+        row = dict(zip(EXPORT_FIELDS, map(export_value, values)))
+        row['cover_image'] = media_url(row['cover_image']) if row['cover_image'] else None
+        yield row
+
+
+def export_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        yield writer.writerow(['' if row[field] is None else row[field] for field in EXPORT_FIELDS])
+
+
+def export_ndjson(rows):
+    for row in rows:
+        yield json.dumps(row) + '\n'
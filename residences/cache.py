@@ -0,0 +1,103 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from rest_framework.response import Response
+
+LIST_GENERATION_KEY = 'residences:list-generation'
+
+
+def get_cache():
+    return caches[settings.RESIDENCE_CACHE_ALIAS]
+
+
+def residence_key(pk):
+    return f'residences:residence:{pk}'
+
+
+def payload_etag(data):
+    digest = hashlib.sha256(json.dumps(data, sort_keys=True, default=str, separators=(',', ':')).encode())
+    return f'"{digest.hexdigest()[:32]}"'
+
+
+def list_generation():
+    cache = get_cache()
+    generation = cache.get(LIST_GENERATION_KEY)
+    if generation is None:
+        cache.add(LIST_GENERATION_KEY, 1, None)
+        generation = cache.get(LIST_GENERATION_KEY, 1)
+    return generation
+
+
+def bump_list_generation():
+    cache = get_cache()
+    try:
+        cache.incr(LIST_GENERATION_KEY)
+    except ValueError:
+        cache.add(LIST_GENERATION_KEY, 1, None)
+
+
+def list_page_key(request):
+    location = request.build_absolute_uri()
+    return f'residences:list:{list_generation()}:{hashlib.sha256(location.encode()).hexdigest()}'
+
+
+def evict_residence(pk):
+    """
+    Drop the cached payload for one residence and retire all cached list pages.
+    """
+    get_cache().delete(residence_key(pk))
+    bump_list_generation()
+
+
+def residence_payloads(residences, base_url, serialize):
+    """
+    Return serialized payloads for ``residences`` in order, serializing only
+    the ones missing from the cache.
+
+    Entries are keyed per residence and hold one payload per ``base_url`` since
+    media URLs are absolute, so a single delete evicts every variant.
+    """
+    cache = get_cache()
+    keys = [residence_key(residence.pk) for residence in residences]
+    cached = cache.get_many(keys)
+
+    missing = [residence for residence, key in zip(residences, keys) if base_url not in cached.get(key, {})]
+    if missing:
+        updates = {}
+        for residence, data in zip(missing, serialize(missing)):
+            key = residence_key(residence.pk)
+            entry = updates.get(key) or dict(cached.get(key, {}))
+            entry[base_url] = data
+            updates[key] = entry
+        cache.set_many(updates, settings.RESIDENCE_CACHE_TIMEOUT)
+        cached.update(updates)
+
+    return [cached[key][base_url] for key in keys]
+
+
+def conditional_response(request, data, etag=None):
+    etag = etag or payload_etag(data)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = Response(data)
+    response['ETag'] = etag
+    # JSON and MessagePack renderings share the payload's ETag.
+    patch_vary_headers(response, ('Accept',))
+    return response
+
+
+def cached_list_response(request, build, cacheable=None):
+    # ``cacheable``, if given, is called after ``build`` and may veto caching the page.
+    cache = get_cache()
+    key = list_page_key(request)
+    entry = cache.get(key)
+    if entry is None:
+        data = build()
+        entry = (data, payload_etag(data))
+        if cacheable is None or cacheable():
+            cache.set(key, entry, settings.RESIDENCE_CACHE_TIMEOUT)
+    data, etag = entry
+    return conditional_response(request, data, etag)
@@ -0,0 +1,186 @@
+import asyncio
+import json
+import time
+import uuid
+from datetime import timedelta, timezone as dt_timezone
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+
+from .cache import get_cache, list_generation
+from .filters import parse_param
+from .models import ResidenceTombstone
+
+PRUNE_KEY = 'residences:tombstone-prune'
+# Expired tombstones are pruned at most once per this many seconds.
+PRUNE_INTERVAL = 3600
+
+
+def parse_timestamp(value):
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(value)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed
+
+
+def format_timestamp(value):
+    return value.astimezone(dt_timezone.utc).isoformat().replace('+00:00', 'Z')
+
+
+def feed_position(params):
+    """
+    The ``(since, after)`` position a change feed request starts from: an
+    ISO timestamp, and optionally the id of the last event seen at exactly
+    that time (as in a ``next`` link).
+    """
+    since = parse_param(params, 'since', parse_timestamp)
+    after = parse_param(params, 'after', uuid.UUID)
+    if after is not None and since is None:
+        raise ValidationError({'after': 'after needs since.'})
+    return since, after
+
+
+def format_cursor(since, after):
+    # SSE event id; sent back by EventSource as Last-Event-ID on reconnect.
+    return f'{format_timestamp(since)}_{after}' if after else format_timestamp(since)
+
+
+def parse_cursor(value):
+    since, _, after = value.partition('_')
+    return parse_timestamp(since), uuid.UUID(after) if after else None
+
+
+def tombstone_horizon():
+    # Deletions before this have been forgotten; a feed position older than it is incomplete.
+    return timezone.now() - timedelta(days=settings.CHANGES_TOMBSTONE_DAYS)
+
+
+def record_deletion(residence_id):
+    ResidenceTombstone.objects.create(residence_id=residence_id)
+    if get_cache().add(PRUNE_KEY, True, PRUNE_INTERVAL):
+        ResidenceTombstone.objects.filter(deleted_at__lt=tombstone_horizon()).delete()
+
+
+def after_position(queryset, field, id_field, since, after):
+    # Rows ordered after (since, after) on (field, id_field): a range scan of the (field, id) index.
+    if since is None:
+        return queryset
+    queryset = queryset.filter(**{f'{field}__gte': since})
+    if after is None:
+        return queryset
+    return queryset.exclude(**{field: since, f'{id_field}__lte': after})
+
+
+def change_feed(queryset, since, after, limit):
+    """
+    Residences from ``queryset`` changed after the position ``(since, after)``,
+    and residences deleted after it, merged into one timeline, oldest first.
+
+    Returns ``(events, since, after, more)``. ``events`` holds up to ``limit``
+    ``(timestamp, id, kind, object)`` tuples, ``kind`` being 'change' (with the
+    Residence) or 'delete' (with its ResidenceTombstone). The returned position
+    continues the feed; it never passes events younger than
+    CHANGES_SETTLE_SECONDS, since a transaction committing late may still add
+    rows before them, so those events are returned again next time.
+    """
+    residences = after_position(queryset, 'last_updated', 'id', since, after).order_by('last_updated', 'id')
+    tombstones = after_position(ResidenceTombstone.objects.all(), 'deleted_at', 'residence_id', since, after)
+    timeline = sorted(
+        [(residence.last_updated, residence.pk, 'change', residence) for residence in residences[:limit + 1]]
+        + [(tombstone.deleted_at, tombstone.residence_id, 'delete', tombstone)
+           for tombstone in tombstones.order_by('deleted_at', 'residence_id')[:limit + 1]],
+        key=lambda event: event[:2],
+    )
+    more = len(timeline) > limit
+    events = timeline[:limit]
+    horizon = timezone.now() - timedelta(seconds=settings.CHANGES_SETTLE_SECONDS)
+    settled = [event for event in events if event[0] <= horizon]
+    if settled:
+        since, after = settled[-1][:2]
+    return events, since, after, more and bool(settled)
+
+
+def availability(residence):
+    return {
+        'id': str(residence.pk),
+        'rooms_available': residence.rooms_available,
+        'number_of_rooms_available': residence.number_of_rooms_available,
+        'room_available_date': residence.room_available_date.isoformat() if residence.room_available_date else None,
+        'last_updated': format_timestamp(residence.last_updated),
+    }
+
+
+class ChangeStream:
+    """
+    One server-sent events connection pushing availability changes and
+    deletions after ``(since, after)``; served in ASGI mode only.
+
+    The database is only read when the list generation shows something
+    changed (or every CHANGES_STREAM_KEEPALIVE seconds, in case the cache
+    isn't shared), so idle streams cost a cache read per interval. Each event's
+    id is a feed position to resume from after a reconnect.
+    """
+
+    def __init__(self, queryset, since, after):
+        self.queryset = queryset
+        self.since, self.after = since, after
+        # Events sent but not yet passed by the position, so they aren't repeated.
+        self.sent = set()
+        self.generation = None
+        self.last_read = self.last_write = time.monotonic()
+        self.deadline = self.last_read + settings.CHANGES_STREAM_MAX_SECONDS
+
+    def read(self):
+        chunks = []
+        more = True
+        while more:
+            events, self.since, self.after, more = change_feed(
+                self.queryset, self.since, self.after, settings.CHANGES_MAX_RESULTS
+            )
+            position = (self.since, self.after)
+            for timestamp, pk, kind, obj in events:
+                key = (timestamp, pk)
+                if key in self.sent:
+                    continue
+                if self.after is not None and key <= position:
+                    event_id = format_cursor(timestamp, pk)
+                else:
+                    self.sent.add(key)
+                    event_id = format_cursor(*position) if self.since else ''
+                data = availability(obj) if kind == 'change' else {
+                    'id': str(pk), 'deleted_at': format_timestamp(timestamp),
+                }
+                chunks.append(f'event: {kind}\nid: {event_id}\ndata: {json.dumps(data)}\n\n')
+            if self.after is not None:
+                self.sent = {key for key in self.sent if key > position}
+        return ''.join(chunks)
+
+    def tick(self):
+        """Check for changes once; returns the text to send, if any."""
+        now = time.monotonic()
+        generation = list_generation()
+        text = ''
+        if generation != self.generation or self.sent or now - self.last_read >= settings.CHANGES_STREAM_KEEPALIVE:
+            self.generation, self.last_read = generation, now
+            text = self.read()
+        if not text and now - self.last_write >= settings.CHANGES_STREAM_KEEPALIVE:
+            text = ': keepalive\n\n'
+        if text:
+            self.last_write = now
+        return text
+
+    async def aevents(self):
+        yield f'retry: {int(settings.CHANGES_STREAM_INTERVAL * 1000)}\n\n'
+        tick = sync_to_async(self.tick)
+        while True:
+            text = await tick()
+            if text:
+                yield text
+            if time.monotonic() >= self.deadline:
+                return
+            await asyncio.sleep(settings.CHANGES_STREAM_INTERVAL)
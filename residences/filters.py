@@ -0,0 +1,133 @@
+import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+
+from .models import Residence
+
+SEARCH_CONFIG = 'english'
+SEARCH_FIELDS = ('name', 'address', 'description')
+
+
+def search_vector():
+    from django.contrib.postgres.search import SearchVector
+    # Must match the expression indexed by residence_search_gin_idx.
+    return SearchVector(*SEARCH_FIELDS, config=SEARCH_CONFIG)
+
+
+def parse_param(params, name, parse):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return parse(value)
+    except (ValueError, InvalidOperation):
+        raise ValidationError({name: f'Invalid value: {value!r}'})
+
+
+def parse_bool(value):
+    value = value.lower()
+    if value in ('1', 'true', 'yes'):
+        return True
+    if value in ('0', 'false', 'no'):
+        return False
+    raise ValueError(value)
+
+
+def parse_price(value):
+    value = Decimal(value)
+    # Decimal also parses NaN and Infinity, which the price filters can't compare against.
+    if not value.is_finite():
+        raise ValueError(value)
+    return value
+
+
+def parse_residence_type(value):
+    if value not in dict(Residence.RESIDENCE_TYPE_CHOICES):
+        raise ValueError(value)
+    return value
+
+
+def search_residences(queryset, text):
+    if connections[queryset.db].vendor == 'postgresql':
+        from django.contrib.postgres.search import SearchQuery
+        return queryset.annotate(search=search_vector()).filter(
+            search=SearchQuery(text, config=SEARCH_CONFIG, search_type='websearch')
+        )
+    # Fallback for SQLite and other local databases: unindexed substring match.
+    match = Q()
+    for field in SEARCH_FIELDS:
+        match |= Q(**{f'{field}__icontains': text})
+    return queryset.filter(match)
+
+
+def filter_residences(queryset, params):
+    """
+    Apply the residence list query parameters to ``queryset``.
+
+    Supported: min_price, max_price, residence_type, rooms_available,
+    min_rooms_available, available_by (YYYY-MM-DD) and search.
+    """
+    min_price = parse_param(params, 'min_price', parse_price)
+    max_price = parse_param(params, 'max_price', parse_price)
+    residence_type = parse_param(params, 'residence_type', parse_residence_type)
+    rooms_available = parse_param(params, 'rooms_available', parse_bool)
+    min_rooms = parse_param(params, 'min_rooms_available', int)
+    available_by = parse_param(params, 'available_by', datetime.date.fromisoformat)
+    search = params.get('search', '').strip()
+
+    if residence_type is not None:
+        queryset = queryset.filter(residence_type=residence_type)
+    if rooms_available is not None:
+        queryset = queryset.filter(rooms_available=rooms_available)
+    if min_price is not None:
+        queryset = queryset.filter(room_price__gte=min_price)
+    if max_price is not None:
+        queryset = queryset.filter(room_price__lte=max_price)
+    if min_rooms is not None:
+        queryset = queryset.filter(number_of_rooms_available__gte=min_rooms)
+    if available_by is not None:
+        queryset = queryset.filter(room_available_date__lte=available_by)
+    if search:
+        queryset = search_residences(queryset, search)
+    return queryset
+
+
+def parse_latitude(value):
+    value = float(value)
+    if not -90 <= value <= 90:
+        raise ValueError(value)
+    return value
+
+
+def parse_longitude(value):
+    value = float(value)
+    if not -180 <= value <= 180:
+        raise ValueError(value)
+    return value
+
+
+def parse_positive(parse, maximum):
+    def parse_bounded(value):
+        value = parse(value)
+        if not 0 < value <= maximum:
+            raise ValueError(value)
+        return value
+    return parse_bounded
+
+
+def nearby_params(params):
+    """
+    Parse the nearby search parameters: lat and lng (required), radius_km and
+    limit. Returns ``(lat, lng, radius_km, limit)``.
+    """
+    lat = parse_param(params, 'lat', parse_latitude)
+    lng = parse_param(params, 'lng', parse_longitude)
+    if lat is None or lng is None:
+        raise ValidationError({'lat': 'lat and lng are required.'})
+    radius = parse_param(params, 'radius_km', parse_positive(float, settings.NEARBY_MAX_RADIUS_KM))
+    limit = parse_param(params, 'limit', parse_positive(int, settings.NEARBY_MAX_RESULTS))
+    return lat, lng, radius or settings.NEARBY_DEFAULT_RADIUS_KM, limit or 20
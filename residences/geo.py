@@ -0,0 +1,147 @@
+import math
+
+from django.db.models import Q
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_LENGTH = 12
+
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_LENGTH):
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, bit_count, even = [], 0, 0, True
+    while len(chars) < precision:
+        value, interval = (longitude, lng_range) if even else (latitude, lat_range)
+        middle = (interval[0] + interval[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits, bit_count = 0, 0
+    return ''.join(chars)
+
+
+def location_geohash(latitude, longitude):
+    """The value stored in ``Residence.geohash``; blank when there are no coordinates."""
+    if latitude is None or longitude is None:
+        return ''
+    return encode_geohash(latitude, longitude)
+
+
+def cell_size(precision):
+    """Height and width in degrees of a geohash cell of ``precision`` characters."""
+    bits = 5 * precision
+    return 180 / 2 ** (bits // 2), 360 / 2 ** (bits - bits // 2)
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(latitude, longitude, radius_km):
+    """
+    ``(min_lat, max_lat, min_lng, max_lng)`` enclosing the circle. The
+    longitude bounds are None when the box reaches a pole or wraps the
+    antimeridian, where a simple range can't express it.
+    """
+    lat_delta = radius_km / KM_PER_DEGREE
+    min_lat, max_lat = latitude - lat_delta, latitude + lat_delta
+    if min_lat <= -90 or max_lat >= 90:
+        return max(min_lat, -90), min(max_lat, 90), None, None
+    lng_delta = lat_delta / math.cos(math.radians(max(abs(min_lat), abs(max_lat))))
+    min_lng, max_lng = longitude - lng_delta, longitude + lng_delta
+    if min_lng < -180 or max_lng > 180:
+        return min_lat, max_lat, None, None
+    return min_lat, max_lat, min_lng, max_lng
+
+
+def covering_cells(latitude, longitude, radius_km):
+    """
+    Geohash prefixes whose cells together cover the circle: the cell holding
+    the centre and its eight neighbours, at the finest precision where a cell
+    is still at least ``radius_km`` across. Empty when the circle is too big
+    for cells to narrow anything down.
+    """
+    min_lat, max_lat, _, _ = bounding_box(latitude, longitude, radius_km)
+    widest_lat = max(abs(min_lat), abs(max_lat))
+    for precision in range(GEOHASH_LENGTH, 0, -1):
+        height, width = cell_size(precision)
+        if height * KM_PER_DEGREE >= radius_km and width * KM_PER_DEGREE * math.cos(math.radians(widest_lat)) >= radius_km:
+            break
+    else:
+        return []
+    cells = set()
+    for lat_step in (-1, 0, 1):
+        for lng_step in (-1, 0, 1):
+            lat = min(max(latitude + lat_step * height, -90), 90)
+            lng = (longitude + lng_step * width + 180) % 360 - 180
+            cells.add(encode_geohash(lat, lng, precision))
+    return sorted(cells)
+
+
+def prefix_end(prefix):
+    """
+    The smallest geohash after every geohash starting with ``prefix`` (None
+    past the last cell): the prefix with its last character advanced in
+    BASE32. Geohashes are lowercase letters and digits, so this bound holds
+    under any collation, not just byte order.
+    """
+    while prefix:
+        position = BASE32.index(prefix[-1]) + 1
+        if position < len(BASE32):
+            return prefix[:-1] + BASE32[position]
+        prefix = prefix[:-1]
+    return None
+
+
+def within_radius(latitude, longitude, radius_km):
+    """
+    Filter matching residences that may lie within ``radius_km``: a union of
+    geohash-prefix ranges (each served by the geohash index) narrowed by the
+    bounding box. Exact distances are computed afterwards with haversine_km.
+    """
+    match = Q()
+    for cell in covering_cells(latitude, longitude, radius_km):
+        # A range rather than startswith, so the plain b-tree index applies on every backend.
+        end = prefix_end(cell)
+        match |= Q(geohash__gte=cell, geohash__lt=end) if end else Q(geohash__gte=cell)
+    if not match:
+        match = Q(latitude__isnull=False, longitude__isnull=False)
+
+    min_lat, max_lat, min_lng, max_lng = bounding_box(latitude, longitude, radius_km)
+    match &= Q(latitude__gte=min_lat, latitude__lte=max_lat)
+    if min_lng is not None:
+        match &= Q(longitude__gte=min_lng, longitude__lte=max_lng)
+    return match
+
+
+def nearest(queryset, latitude, longitude, radius_km, limit):
+    """
+    Ids of up to ``limit`` residences from ``queryset`` within ``radius_km``,
+    nearest first, as ``(distance_km, pk)`` pairs.
+
+    Searches a small circle first and doubles it until ``limit`` residences
+    are found or ``radius_km`` is reached, so a dense area only reads the
+    index entries around the point.
+    """
+    radius = min(radius_km, 1.0)
+    while True:
+        candidates = queryset.filter(within_radius(latitude, longitude, radius)).values_list('pk', 'latitude', 'longitude')
+        found = []
+        for pk, lat, lng in candidates:
+            distance = haversine_km(latitude, longitude, lat, lng)
+            if distance <= radius:
+                found.append((distance, pk))
+        if len(found) >= limit or radius >= radius_km:
+            found.sort(key=lambda pair: pair[0])
+            return found[:limit]
+        radius = min(radius * 2, radius_km)
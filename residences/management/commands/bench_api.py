@@ -0,0 +1,230 @@
+import io
+import itertools
+import json
+import math
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.client import MULTIPART_CONTENT, encode_multipart, BOUNDARY
+from django.test.utils import CaptureQueriesContext, override_settings, setup_test_environment, teardown_test_environment
+from PIL import Image as PILImage
+from rest_framework.authtoken.models import Token
+
+from residences.cache import get_cache
+from residences.models import CustomUser, Plan, Residence, Video
+from residences.seed import SEED_CENTRE, SEED_SPREAD, seed_residences
+from residences.tasks import wait_for_background_jobs
+
+ENDPOINTS = ['list', 'detail', 'nearby', 'submit', 'update', 'stream', 'stream-range']
+STREAM_NAME = 'residence_videos/bench.mp4'
+RANGE_BYTES = 256 * 1024
+
+
+def cover_image():
+    buffer = io.BytesIO()
+    PILImage.new('RGB', (64, 64), (200, 120, 40)).save(buffer, 'PNG')
+    return SimpleUploadedFile('cover.png', buffer.getvalue(), content_type='image/png')
+
+
+def residence_form(rng, actor):
+    return {
+        'user': actor['user'],
+        'name': f'Bench residence {rng.randrange(10 ** 6)}',
+        'address': '1 Jorissen Street, Braamfontein',
+        'residence_type': rng.choice(['standard', 'bachelor']),
+        'room_price': rng.randint(1500, 9000),
+        'rooms_include': 'Bed, desk, wifi',
+        'description': 'Created by the API benchmark.',
+        'rooms_available': 'true',
+        'number_of_rooms_available': rng.randint(0, 20),
+        'cover_image': cover_image(),
+    }
+
+
+def percentile(ordered, pct):
+    return ordered[max(math.ceil(pct / 100 * len(ordered)) - 1, 0)]
+
+
+class Command(BaseCommand):
+    help = ('Seed a throwaway test database and drive the residences API routes with concurrent clients, '
+            'reporting latency percentiles, throughput and query counts per endpoint as JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--residences', type=int, default=1000)
+        parser.add_argument('--endpoints', nargs='+', choices=ENDPOINTS, default=ENDPOINTS)
+        parser.add_argument('--requests', type=int, default=200, help='Measured requests per endpoint.')
+        parser.add_argument('--warmup', type=int, default=10, help='Unmeasured requests per endpoint.')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--stream-bytes', type=int, default=4 * 1024 * 1024)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the JSON report here instead of stdout.')
+        parser.add_argument('--baseline', help='JSON report to compare against; regressions fail the command.')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Allowed relative p95 increase or requests/sec drop against the baseline.')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        if connection.vendor == 'sqlite':
+            # The default in-memory test database can't be shared between client threads,
+            # and deferred transactions fail rather than wait when two writers collide.
+            connection.settings_dict['TEST']['NAME'] = os.path.join(tempfile.mkdtemp(), 'bench-api.sqlite3')
+            connection.settings_dict['OPTIONS'] = {
+                **connection.settings_dict['OPTIONS'], 'transaction_mode': 'IMMEDIATE', 'timeout': 30,
+            }
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        media_root = tempfile.mkdtemp()
+        try:
+            with override_settings(MEDIA_ROOT=media_root):
+                report = self.run(options, media_root)
+                wait_for_background_jobs()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            shutil.rmtree(media_root, ignore_errors=True)
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                regressions = self.compare(report, json.load(f), options['tolerance'])
+            if regressions:
+                raise CommandError('Regressions against baseline:\n' + '\n'.join(regressions))
+            self.stderr.write(self.style.SUCCESS('No regressions against baseline.'))
+
+    def run(self, options, media_root):
+        rng = random.Random(options['seed'])
+        random.seed(options['seed'])
+        residence_ids = [residence.pk for residence in seed_residences(options['residences'])]
+
+        plan = Plan.objects.create(code='bench', name='Benchmark', max_residences=10 ** 9, max_images=100,
+                                   max_videos=100)
+        actors = []
+        for index in range(options['concurrency']):
+            user = CustomUser.objects.create_user(username=f'bench-{index}', password=None, plan=plan)
+            owned = rng.sample(residence_ids, min(5, len(residence_ids)))
+            Residence.objects.filter(pk__in=owned).update(user=user)
+            actors.append({'user': str(user.pk), 'token': Token.objects.create(user=user).key, 'owned': owned})
+
+        os.makedirs(os.path.join(media_root, os.path.dirname(STREAM_NAME)))
+        with open(os.path.join(media_root, STREAM_NAME), 'wb') as f:
+            f.write(os.urandom(options['stream_bytes']))
+        video_id = Video.objects.values_list('pk', flat=True).first()
+        Video.objects.filter(pk=video_id).update(video=STREAM_NAME)
+        # Seeding uses bulk_create and update(), which bypass cache invalidation.
+        get_cache().clear()
+
+        def auth(actor):
+            return {'HTTP_AUTHORIZATION': f'Token {actor["token"]}'}
+
+        calls = {
+            'list': lambda client, rng, actor: client.get('/api/residences/'),
+            'detail': lambda client, rng, actor: client.get(f'/api/residences/{rng.choice(residence_ids)}/'),
+            'nearby': lambda client, rng, actor: client.get('/api/residences/nearby/', {
+                'lat': SEED_CENTRE[0] + rng.uniform(-SEED_SPREAD, SEED_SPREAD),
+                'lng': SEED_CENTRE[1] + rng.uniform(-SEED_SPREAD, SEED_SPREAD),
+                'radius_km': 5,
+            }),
+            'submit': lambda client, rng, actor: client.post(
+                '/api/submit-residence/', residence_form(rng, actor), **auth(actor)),
+            'update': lambda client, rng, actor: client.generic(
+                'PUT', f'/api/residences/{rng.choice(actor["owned"])}/',
+                encode_multipart(BOUNDARY, residence_form(rng, actor)), content_type=MULTIPART_CONTENT, **auth(actor)),
+            'stream': lambda client, rng, actor: client.get(f'/api/stream_video/{video_id}/'),
+            'stream-range': lambda client, rng, actor: client.get(
+                f'/api/stream_video/{video_id}/', HTTP_RANGE=self.random_range(rng, options['stream_bytes'])),
+        }
+
+        endpoints = {}
+        for name in options['endpoints']:
+            self.drive(calls[name], options['warmup'], options['concurrency'], options['seed'], actors)
+            started = time.perf_counter()
+            samples = self.drive(calls[name], options['requests'], options['concurrency'], options['seed'], actors)
+            elapsed = time.perf_counter() - started
+            latencies = sorted(latency for latency, _, _ in samples)
+            endpoints[name] = {
+                'requests': len(samples),
+                'errors': sum(status >= 400 for _, _, status in samples),
+                'requests_per_sec': round(len(samples) / elapsed, 2),
+                'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+                'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+                'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+                'queries_per_request': round(sum(queries for _, queries, _ in samples) / len(samples), 2),
+            }
+            self.stderr.write(f'{name:<13} {endpoints[name]}')
+
+        return {
+            'settings': {
+                'residences': options['residences'],
+                'requests': options['requests'],
+                'concurrency': options['concurrency'],
+                'stream_bytes': options['stream_bytes'],
+                'database': connection.vendor,
+            },
+            'endpoints': endpoints,
+        }
+
+    def random_range(self, rng, size):
+        start = rng.randrange(max(size - RANGE_BYTES, 1))
+        return f'bytes={start}-{start + RANGE_BYTES - 1}'
+
+    def drive(self, call, requests, concurrency, seed, actors):
+        counter = itertools.count()
+        lock = threading.Lock()
+
+        def client_loop(index):
+            client = Client(raise_request_exception=False)
+            rng = random.Random(seed + index)
+            samples = []
+            try:
+                while True:
+                    with lock:
+                        if next(counter) >= requests:
+                            break
+                    with CaptureQueriesContext(connection) as queries:
+                        started = time.perf_counter()
+                        response = call(client, rng, actors[index])
+                        if response.streaming:
+                            for _ in response.streaming_content:
+                                pass
+                        latency = time.perf_counter() - started
+                    response.close()
+                    samples.append((latency, len(queries), response.status_code))
+            finally:
+                # Each client thread opened its own connection; close it before teardown.
+                connection.close()
+            return samples
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            return [sample for samples in pool.map(client_loop, range(concurrency)) for sample in samples]
+
+    def compare(self, report, baseline, tolerance):
+        regressions = []
+        for name, current in report['endpoints'].items():
+            previous = baseline.get('endpoints', {}).get(name)
+            if previous is None:
+                continue
+            if current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+                regressions.append(f'{name}: p95 {previous["p95_ms"]}ms -> {current["p95_ms"]}ms')
+            if current['requests_per_sec'] < previous['requests_per_sec'] * (1 - tolerance):
+                regressions.append(f'{name}: {previous["requests_per_sec"]} -> {current["requests_per_sec"]} req/s')
+            if current['queries_per_request'] > previous['queries_per_request']:
+                regressions.append(f'{name}: queries/request {previous["queries_per_request"]} -> '
+                                   f'{current["queries_per_request"]}')
+            if current['errors'] > previous['errors']:
+                regressions.append(f'{name}: errors {previous["errors"]} -> {current["errors"]}')
+        return regressions
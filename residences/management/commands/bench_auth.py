@@ -0,0 +1,55 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils.module_loading import import_string
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from residences.cache import get_cache
+from residences.models import CustomUser
+
+AUTH_CLASSES = {
+    'token': 'rest_framework.authentication.TokenAuthentication',
+    'cached-token': 'residences.authentication.CachedTokenAuthentication',
+}
+
+
+class Command(BaseCommand):
+    help = 'Measure per-request authentication overhead (time and queries) for each token authentication class.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            user = CustomUser.objects.create_user(username='bench-auth', password=None)
+            token = Token.objects.create(user=user)
+            django_request = APIRequestFactory().get('/api/user/me/', HTTP_AUTHORIZATION=f'Token {token.key}')
+            get_cache().clear()
+
+            for name, path in AUTH_CLASSES.items():
+                authenticator = import_string(path)()
+                authenticator.authenticate(Request(django_request))  # warm up
+                timings = []
+                query_count = 0
+                for _ in range(options['requests']):
+                    request = Request(django_request)
+                    with CaptureQueriesContext(connection) as queries:
+                        started = time.perf_counter()
+                        authenticator.authenticate(request)
+                        timings.append((time.perf_counter() - started) * 1_000_000)
+                    query_count += len(queries)
+                timings.sort()
+                self.stdout.write(
+                    f'{name:<13} mean={statistics.fmean(timings):.1f}us '
+                    f'p95={timings[int(len(timings) * 0.95) - 1]:.1f}us '
+                    f'queries/request={query_count / options["requests"]:.2f}'
+                )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
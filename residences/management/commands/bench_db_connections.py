@@ -0,0 +1,106 @@
+import copy
+import itertools
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import dj_database_url
+from django.core.management.base import BaseCommand, CommandError
+from django.core.signals import request_finished, request_started
+from django.db import connections
+
+MODES = ['none', 'persistent', 'pool', 'pgbouncer']
+
+
+def percentile(ordered, pct):
+    return ordered[max(math.ceil(pct / 100 * len(ordered)) - 1, 0)]
+
+
+def mode_settings(database, mode, pool_size):
+    """Copy of ``database`` configured for a DB_CONNECTION_MODE, as settings.py does."""
+    database = copy.deepcopy(database)
+    options = database.setdefault('OPTIONS', {})
+    options.pop('pool', None)
+    database['CONN_MAX_AGE'] = 0
+    database['CONN_HEALTH_CHECKS'] = False
+    database['DISABLE_SERVER_SIDE_CURSORS'] = mode == 'pgbouncer'
+    if mode in ('persistent', 'pgbouncer'):
+        database['CONN_MAX_AGE'] = 600
+        database['CONN_HEALTH_CHECKS'] = True
+    elif mode == 'pool':
+        options['pool'] = {'min_size': 1, 'max_size': pool_size, 'timeout': 30}
+    return database
+
+
+class Command(BaseCommand):
+    help = ('Simulate request cycles against PostgreSQL in each DB_CONNECTION_MODE and report per-request '
+            'latency. Run it against the production database to include its real connect and TLS cost.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', nargs='+', choices=MODES, default=['none', 'persistent', 'pool'])
+        parser.add_argument('--pgbouncer-url', help='Database URL of a PgBouncer in front of the same database; '
+                                                    'required for the pgbouncer mode.')
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--concurrency', type=int, default=4, help='Threads issuing requests, as in one worker.')
+        parser.add_argument('--queries', type=int, default=3, help='Queries per simulated request.')
+        parser.add_argument('--pool-size', type=int, default=4)
+
+    def handle(self, *args, **options):
+        database = connections.settings['default']
+        if database['ENGINE'] != 'django.db.backends.postgresql':
+            raise CommandError('Connection modes only apply to PostgreSQL; point DATABASE_URL at one.')
+        if 'pgbouncer' in options['modes'] and not options['pgbouncer_url']:
+            raise CommandError('The pgbouncer mode needs --pgbouncer-url.')
+
+        for mode in options['modes']:
+            base = database
+            if mode == 'pgbouncer':
+                base = {**copy.deepcopy(database), **dj_database_url.parse(options['pgbouncer_url'])}
+            alias = f'bench_{mode}'
+            connections.settings[alias] = mode_settings(base, mode, options['pool_size'])
+            try:
+                latencies, elapsed = self.drive(alias, options)
+            except Exception as exc:
+                raise CommandError(f'{mode}: {exc}')
+            finally:
+                if mode == 'pool':
+                    connections[alias].close_pool()
+                del connections.settings[alias]
+
+            latencies.sort()
+            self.stdout.write(
+                f'{mode:<10} p50={percentile(latencies, 50) * 1000:.2f}ms '
+                f'p95={percentile(latencies, 95) * 1000:.2f}ms p99={percentile(latencies, 99) * 1000:.2f}ms '
+                f'{len(latencies) / elapsed:.0f} requests/s'
+            )
+
+    def drive(self, alias, options):
+        counter = itertools.count()
+        lock = threading.Lock()
+
+        def client_loop(_):
+            samples = []
+            try:
+                while True:
+                    with lock:
+                        if next(counter) >= options['requests']:
+                            break
+                    started = time.perf_counter()
+                    # The same signals a real request sends; request_finished closes or
+                    # returns the connection according to the mode.
+                    request_started.send(sender=self.__class__)
+                    with connections[alias].cursor() as cursor:
+                        for _ in range(options['queries']):
+                            cursor.execute('SELECT 1')
+                            cursor.fetchone()
+                    request_finished.send(sender=self.__class__)
+                    samples.append(time.perf_counter() - started)
+            finally:
+                connections[alias].close()
+            return samples
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            latencies = [sample for samples in pool.map(client_loop, range(options['concurrency'])) for sample in samples]
+        return latencies, time.perf_counter() - started
@@ -0,0 +1,139 @@
+import itertools
+import math
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from residences.cache import get_cache
+from residences.models import CustomUser
+from residences.seed import seed_residences
+
+PASSWORD = 'bench-login-password'
+
+
+def percentile(ordered, pct):
+    if not ordered:
+        return float('nan')
+    return ordered[max(math.ceil(pct / 100 * len(ordered)) - 1, 0)]
+
+
+class Command(BaseCommand):
+    help = ('Measure login throughput for each password hasher and hashing concurrency limit, and the latency '
+            'other API requests see while logins are running.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hashers', nargs='+', choices=sorted(settings.PASSWORD_HASHER_CLASSES),
+                            default=sorted(settings.PASSWORD_HASHER_CLASSES))
+        parser.add_argument('--limits', nargs='+', type=int, default=[0, 2],
+                            help='HASHING_CONCURRENCY values to compare; 0 is unlimited.')
+        parser.add_argument('--logins', type=int, default=100, help='Login requests per configuration.')
+        parser.add_argument('--concurrency', type=int, default=8, help='Clients logging in at once.')
+        parser.add_argument('--api-clients', type=int, default=2,
+                            help='Clients fetching a residence meanwhile, to show the effect on other endpoints.')
+        parser.add_argument('--users', type=int, default=20)
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        if connection.vendor == 'sqlite':
+            # Shared between client threads, and waiting rather than failing on concurrent writes.
+            connection.settings_dict['TEST']['NAME'] = os.path.join(tempfile.mkdtemp(), 'bench-login.sqlite3')
+            connection.settings_dict['OPTIONS'] = {
+                **connection.settings_dict['OPTIONS'], 'transaction_mode': 'IMMEDIATE', 'timeout': 30,
+            }
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            residence = seed_residences(1)[0]
+            usernames = [f'bench-login-{index}' for index in range(options['users'])]
+            CustomUser.objects.bulk_create([CustomUser(username=username) for username in usernames])
+            rest_framework = {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {}}
+            get_cache().clear()
+
+            detail_url = f'/api/residences/{residence.pk}/'
+            Client().get(detail_url)  # cache the payload
+            idle = self.fetch_while(detail_url, options['api_clients'], lambda: False, 200)
+            self.stdout.write(f'api alone:  p50={percentile(idle, 50) * 1000:.1f}ms '
+                              f'p95={percentile(idle, 95) * 1000:.1f}ms')
+
+            for hasher in options['hashers']:
+                preferred = settings.PASSWORD_HASHER_CLASSES[hasher]
+                hashers = [preferred] + [path for path in settings.PASSWORD_HASHERS if path != preferred]
+                with override_settings(PASSWORD_HASHERS=hashers, REST_FRAMEWORK=rest_framework):
+                    # Every user gets the same hash, made once, in the hasher under test.
+                    CustomUser.objects.filter(username__in=usernames).update(password=make_password(PASSWORD))
+                    for limit in options['limits']:
+                        with override_settings(HASHING_CONCURRENCY=limit):
+                            self.stdout.write(self.run(hasher, limit, usernames, detail_url, options))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+    def run(self, hasher, limit, usernames, detail_url, options):
+        counter = itertools.count()
+        lock = threading.Lock()
+        done = threading.Event()
+
+        def login_loop(index):
+            client = Client(raise_request_exception=False)
+            samples = []
+            try:
+                while True:
+                    with lock:
+                        number = next(counter)
+                    if number >= options['logins']:
+                        break
+                    started = time.perf_counter()
+                    response = client.post('/api/login/', {
+                        'username': usernames[number % len(usernames)], 'password': PASSWORD,
+                    })
+                    samples.append((time.perf_counter() - started, response.status_code))
+            finally:
+                connection.close()
+            return samples
+
+        with ThreadPoolExecutor(max_workers=1) as background:
+            api = background.submit(self.fetch_while, detail_url, options['api_clients'], done.is_set)
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+                samples = [sample for samples in pool.map(login_loop, range(options['concurrency']))
+                           for sample in samples]
+            elapsed = time.perf_counter() - started
+            done.set()
+            api_latencies = api.result()
+
+        ok = sorted(latency for latency, status in samples if status == 200)
+        rejected = sum(status == 503 for _, status in samples)
+        failed = len(samples) - len(ok) - rejected
+        return (
+            f'{hasher:<7} limit={limit or "none":<4} {len(ok) / elapsed:6.1f} logins/s '
+            f'p50={percentile(ok, 50) * 1000:.0f}ms p95={percentile(ok, 95) * 1000:.0f}ms '
+            f'503s={rejected} errors={failed} | '
+            f'api meanwhile p50={percentile(api_latencies, 50) * 1000:.1f}ms '
+            f'p95={percentile(api_latencies, 95) * 1000:.1f}ms'
+        )
+
+    def fetch_while(self, url, clients, stop, limit=None):
+        # Fetch ``url`` from ``clients`` threads until ``stop()`` (or ``limit`` requests each).
+        def fetch_loop(_):
+            client = Client()
+            latencies = []
+            try:
+                while not stop() and (limit is None or len(latencies) < limit):
+                    started = time.perf_counter()
+                    client.get(url)
+                    latencies.append(time.perf_counter() - started)
+            finally:
+                connection.close()
+            return latencies
+
+        with ThreadPoolExecutor(max_workers=clients) as pool:
+            return sorted(latency for latencies in pool.map(fetch_loop, range(clients)) for latency in latencies)
@@ -0,0 +1,73 @@
+import gzip
+import statistics
+import time
+
+import brotli
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from residences.models import Residence
+from residences.renderers import MessagePackRenderer, ORJSONRenderer
+from residences.seed import seed_residences
+from residences.serializers import ResidenceSerializer
+
+RENDERERS = {
+    'json': JSONRenderer,
+    'orjson': ORJSONRenderer,
+    'msgpack': MessagePackRenderer,
+}
+
+
+def timed(function, repeat):
+    # Median wall time of ``repeat`` calls, in milliseconds, and the last result.
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), result
+
+
+class Command(BaseCommand):
+    help = ('Serialize seeded residences with ResidenceSerializer, then compare encoding time and size for each '
+            'renderer, raw and with gzip and brotli.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--residences', nargs='+', type=int, default=[20, 100, 1000],
+                            help='Payload sizes; 20 is one list page.')
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            seed_residences(max(options['residences']))
+            request = Request(APIRequestFactory().get('/api/residences/'))
+            for size in options['residences']:
+                residences = list(Residence.objects.select_related('user').prefetch_related('images', 'videos')[:size])
+                serialize_ms, data = timed(
+                    lambda: ResidenceSerializer(residences, many=True, context={'request': request}).data,
+                    options['repeat'],
+                )
+                self.stdout.write(f'{size} residences: ResidenceSerializer {serialize_ms:.2f}ms')
+                for name, renderer_class in RENDERERS.items():
+                    renderer = renderer_class()
+                    render_ms, body = timed(lambda: renderer.render(data, renderer.media_type, {}), options['repeat'])
+                    gzip_ms, gzipped = timed(lambda: gzip.compress(body, 6), options['repeat'])
+                    brotli_ms, brotlied = timed(
+                        lambda: brotli.compress(body, quality=settings.COMPRESSION_BROTLI_QUALITY), options['repeat']
+                    )
+                    self.stdout.write(
+                        f'  {name:<8} render={render_ms:7.2f}ms size={len(body):>9} | '
+                        f'gzip {gzip_ms:6.2f}ms {len(gzipped):>8} | '
+                        f'brotli q{settings.COMPRESSION_BROTLI_QUALITY} {brotli_ms:6.2f}ms {len(brotlied):>8}'
+                    )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
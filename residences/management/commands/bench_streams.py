@@ -0,0 +1,115 @@
+import http.client
+import os
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from residences.models import Video
+
+SERVERS = {
+    'wsgi': ['bizapp.wsgi:application', '--worker-class', 'sync'],
+    'asgi': ['bizapp.asgi:application', '--worker-class', 'uvicorn.workers.UvicornWorker'],
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(mode, port, workers):
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', *SERVERS[mode], '--workers', str(workers),
+         '--bind', f'127.0.0.1:{port}', '--log-level', 'warning'],
+        cwd=settings.BASE_DIR, env={**os.environ, 'SERVER_MODE': mode},
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise CommandError(f'{mode} server exited with status {process.returncode}.')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise CommandError(f'{mode} server did not start listening on port {port}.')
+
+
+def watch(port, path, rate, deadline, started):
+    # One viewer: request the video and read it at ``rate`` bytes/s, as a
+    # player buffering ahead would, until the deadline.
+    ttfb, received = None, 0
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=max(deadline - time.monotonic(), 0.1))
+    try:
+        connection.request('GET', path, headers={'Range': 'bytes=0-'})
+        response = connection.getresponse()
+        while time.monotonic() < deadline:
+            chunk = response.read1(64 * 1024)
+            if not chunk:
+                break
+            if ttfb is None:
+                ttfb = time.monotonic() - started
+            received += len(chunk)
+            time.sleep(max(received / rate - (time.monotonic() - started - ttfb), 0))
+    except OSError:
+        pass
+    finally:
+        connection.close()
+    return ttfb, received
+
+
+class Command(BaseCommand):
+    help = 'Compare how many slow concurrent video streams one server process sustains in WSGI and ASGI modes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--video', help='Video id to stream (defaults to the first video whose file exists).')
+        parser.add_argument('--modes', nargs='+', choices=sorted(SERVERS), default=['wsgi', 'asgi'])
+        parser.add_argument('--streams', type=int, default=50)
+        parser.add_argument('--workers', type=int, default=1)
+        parser.add_argument('--rate', type=int, default=256 * 1024, help='Bytes per second each viewer reads.')
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds each run lasts.')
+        parser.add_argument('--patience', type=float, default=2.0,
+                            help='A stream counts as served if its first byte arrives within this many seconds.')
+
+    def handle(self, *args, **options):
+        videos = Video.objects.filter(pk=options['video']) if options['video'] else Video.objects.all()
+        video = next((video for video in videos if video.video and os.path.exists(video.video.path)), None)
+        if video is None:
+            raise CommandError('No video with a file on disk to stream; upload one or pass --video.')
+        size = os.path.getsize(video.video.path)
+        if size < options['rate'] * options['duration']:
+            self.stderr.write(f'Warning: the video ({size} bytes) is shorter than one run; '
+                              f'viewers finish early and WSGI workers are freed sooner than in practice.')
+
+        path = f'/api/stream_video/{video.pk}/'
+        for mode in options['modes']:
+            port = free_port()
+            server = start_server(mode, port, options['workers'])
+            try:
+                started = time.monotonic()
+                deadline = started + options['duration']
+                with ThreadPoolExecutor(max_workers=options['streams']) as pool:
+                    results = list(pool.map(
+                        lambda _: watch(port, path, options['rate'], deadline, started), range(options['streams'])
+                    ))
+            finally:
+                server.terminate()
+                server.wait()
+
+            ttfbs = sorted(ttfb for ttfb, _ in results if ttfb is not None)
+            served = sum(ttfb <= options['patience'] for ttfb in ttfbs)
+            received = sum(received for _, received in results)
+            self.stdout.write(
+                f'{mode}: {served}/{options["streams"]} streams started within {options["patience"]:g}s '
+                f'on {options["workers"]} worker(s); '
+                f'ttfb p50={ttfbs[len(ttfbs) // 2] if ttfbs else float("nan"):.2f}s '
+                f'max={ttfbs[-1] if ttfbs else float("nan"):.2f}s; '
+                f'{received / options["duration"] / 1024 / 1024:.1f} MiB/s total'
+            )
@@ -0,0 +1,45 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from residences.models import VideoUpload
+from residences.uploads import discard_expired, expired
+
+
+class Command(BaseCommand):
+    help = ('Delete resumable video uploads that have had no chunk for VIDEO_UPLOAD_EXPIRE_HOURS, and part files '
+            'left in VIDEO_UPLOAD_TEMP_DIR without an upload. Run it from cron.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be deleted.')
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            uploads = expired(VideoUpload.objects.all()).count()
+        else:
+            uploads = discard_expired(VideoUpload.objects.all())
+
+        # Parts of uploads that were completed, cancelled or expired but whose
+        # file outlived the row (a crash between the two).
+        strays = 0
+        cutoff = time.time() - settings.VIDEO_UPLOAD_EXPIRE_HOURS * 3600
+        live = {str(pk) for pk in VideoUpload.objects.filter(status='uploading').values_list('pk', flat=True)}
+        try:
+            entries = list(os.scandir(settings.VIDEO_UPLOAD_TEMP_DIR))
+        except FileNotFoundError:
+            entries = []
+        for entry in entries:
+            name, extension = os.path.splitext(entry.name)
+            if extension != '.part' or name in live or entry.stat().st_mtime >= cutoff:
+                continue
+            strays += 1
+            if not options['dry_run']:
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(f'{verb} {uploads} expired upload(s) and {strays} stray part file(s).')
@@ -0,0 +1,378 @@
+import heapq
+import json
+import os
+from datetime import timedelta
+from itertools import groupby, islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count, F, Min, TextField
+from django.db.models.fields.json import KT
+from django.db.models.functions import Cast, Collate
+from django.utils import timezone
+
+from residences.blobs import delete_files
+from residences.media import content_hash
+from residences.models import CustomUser, Image, MediaBlob, Residence, Video
+from residences.signals import schedule_eviction
+from residences.storage import walk_storage
+from residences.thumbnails import VARIANT_FIELDS, VARIANT_SIZES, delete_variants
+
+# Every model field holding a storage name.
+FILE_FIELDS = [
+    (Residence, 'cover_image'),
+    (CustomUser, 'profile_image'),
+    (Image, 'image'),
+    (Video, 'video'),
+    (Video, 'poster'),
+]
+# Rows that share content through MediaBlob.
+CONTENT_FIELDS = [(Image, 'image'), (Video, 'video')]
+PHASES = ['hash', 'dedupe', 'orphans']
+
+
+def ordered(expression):
+    # Storage lists names in code point order; make the database sort them the same way.
+    return Collate(expression, 'C') if connection.vendor == 'postgresql' else expression
+
+
+def unique(values):
+    return (value for value, _ in groupby(values))
+
+
+def chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def name_stream(queryset, expression, after, batch_size):
+    # Non-empty values of ``expression`` after ``after``, sorted, read in chunks from one query.
+    return (
+        queryset.annotate(ref=ordered(expression)).filter(ref__gt=after).order_by('ref')
+        .values_list('ref', flat=True).iterator(chunk_size=batch_size)
+    )
+
+
+def referenced_names(after, batch_size):
+    """
+    Every storage name the database refers to, after ``after``, in order.
+
+    Each field is read as its own sorted stream and the streams are merged,
+    so memory stays flat however many rows there are. A Video's HLS ladder
+    is referenced as a whole, by its ``hls/<pk>/`` directory.
+    """
+    streams = [name_stream(model.objects.all(), F(field), after, batch_size) for model, field in FILE_FIELDS]
+    streams.append(name_stream(MediaBlob.objects.all(), F('name'), after, batch_size))
+    for label, (_, variants_field) in VARIANT_FIELDS.items():
+        model = next(model for model in (Residence, CustomUser, Image) if model._meta.label == label)
+        for size in VARIANT_SIZES:
+            for fmt in ('webp', 'jpeg'):
+                path = Cast(KT(f'{variants_field}__{size}__{fmt}'), TextField())
+                streams.append(name_stream(model.objects.all(), path, after, batch_size))
+    streams.append(f'hls/{pk}/' for pk in Video.objects.order_by('pk').values_list('pk', flat=True)
+                   .iterator(chunk_size=batch_size))
+    return unique(heapq.merge(*streams))
+
+
+def hash_stream(after, batch_size):
+    streams = [
+        model.objects.exclude(content_hash='').filter(content_hash__gt=after).order_by('content_hash')
+        .values_list('content_hash', flat=True).distinct().iterator(chunk_size=batch_size)
+        for model, _ in CONTENT_FIELDS
+    ]
+    return unique(heapq.merge(*streams))
+
+
+def file_size(storage, name):
+    try:
+        return storage.size(name)
+    except (FileNotFoundError, OSError):
+        return 0
+
+
+class Command(BaseCommand):
+    help = ('Find and remove media files nothing refers to, and merge rows storing the same content into one '
+            'content-addressed file. Runs in phases: hash (fill in missing content hashes), dedupe and orphans '
+            '(a sorted walk of storage joined against the database). Progress is checkpointed, so a large '
+            'store can be processed a --limit at a time.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--phase', nargs='+', choices=PHASES, default=PHASES)
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report what would be merged and deleted without changing anything.')
+        parser.add_argument('--min-age', type=float, default=settings.MEDIA_GC_MIN_AGE_HOURS,
+                            help='Hours a file must have existed before it can be collected.')
+        parser.add_argument('--limit', type=int, default=0,
+                            help='Stop after examining this many rows, hashes or files per phase; 0 runs to the end.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--checkpoint', default=settings.MEDIA_GC_CHECKPOINT,
+                            help='JSON file recording where each phase got to; dry runs keep their own progress.')
+        parser.add_argument('--reset', action='store_true', help='Ignore saved progress and start from the beginning.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1.')
+        self.options = options
+        self.dry_run = options['dry_run']
+        self.storage = Image._meta.get_field('image').storage
+        self.checkpoint = self.load_checkpoint()
+        section = 'dry-run' if self.dry_run else 'delete'
+        if options['reset']:
+            self.checkpoint.pop(section, None)
+        self.progress = self.checkpoint.setdefault(section, {})
+
+        for phase in PHASES:
+            if phase in options['phase']:
+                getattr(self, f'run_{phase}')()
+        if self.dry_run:
+            self.stdout.write('Dry run: nothing was changed.')
+
+    def load_checkpoint(self):
+        try:
+            with open(self.options['checkpoint']) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as exc:
+            raise CommandError(f'Cannot read the checkpoint: {exc}')
+
+    def save_checkpoint(self):
+        path = self.options['checkpoint']
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump(self.checkpoint, f, indent=2)
+        os.replace(f'{path}.tmp', path)
+
+    def resume(self, phase):
+        """Saved position and running totals of ``phase``'s current pass."""
+        state = self.progress.setdefault(phase, {'after': '', 'totals': {}})
+        if state['after']:
+            self.stdout.write(f'{phase}: resuming after {state["after"]!r}')
+        return state
+
+    def finish(self, phase, state, complete):
+        totals = ', '.join(f'{key}={value}' for key, value in state['totals'].items()) or 'nothing to do'
+        if complete:
+            del self.progress[phase]
+            self.stdout.write(f'{phase}: pass complete: {totals}')
+        else:
+            self.stdout.write(f'{phase}: stopped at {state["after"]!r} (limit reached): {totals}')
+        self.save_checkpoint()
+
+    def count(self, state, key, amount=1):
+        state['totals'][key] = state['totals'].get(key, 0) + amount
+
+    # Phase 1: content hashes for rows stored before hashing, and direct uploads.
+
+    def run_hash(self):
+        state = self.resume('hash')
+        limit = self.options['limit']
+        examined = 0
+        # The position is "<model label> <pk>", so rows whose file is missing aren't retried within a pass.
+        done_label, _, after = state['after'].partition(' ')
+        labels = [model._meta.label for model, _ in CONTENT_FIELDS]
+        for model, field in CONTENT_FIELDS:
+            label = model._meta.label
+            if done_label and labels.index(label) < labels.index(done_label):
+                continue
+            rows = model.objects.filter(content_hash='').exclude(**{field: ''}).order_by('pk')
+            if label != done_label:
+                after = None
+            while not limit or examined < limit:
+                size = min(self.options['batch_size'], limit - examined) if limit else self.options['batch_size']
+                batch = rows if after is None else rows.filter(pk__gt=after)
+                batch = list(batch.values_list('pk', field)[:size])
+                if not batch:
+                    break
+                after = batch[-1][0]
+                examined += len(batch)
+                for pk, name in batch:
+                    if self.dry_run:
+                        self.count(state, 'rows')
+                        continue
+                    try:
+                        with self.storage.open(name, 'rb') as file:
+                            digest = content_hash(file)
+                    except (FileNotFoundError, OSError):
+                        self.count(state, 'missing')
+                        continue
+                    model.objects.filter(pk=pk).update(content_hash=digest)
+                    self.count(state, 'rows')
+                state['after'] = f'{label} {after}'
+                self.save_checkpoint()
+        self.finish('hash', state, not limit or examined < limit)
+
+    # Phase 2: one content-addressed file per distinct content.
+
+    def run_dedupe(self):
+        state = self.resume('dedupe')
+        limit = self.options['limit']
+        examined = 0
+        for digests in chunks(hash_stream(state['after'], self.options['batch_size']), self.options['batch_size']):
+            if limit:
+                digests = digests[:limit - examined]
+            for digest in self.inconsistent(digests):
+                self.merge(digest, state)
+            examined += len(digests)
+            state['after'] = digests[-1]
+            self.save_checkpoint()
+            if limit and examined >= limit:
+                return self.finish('dedupe', state, False)
+        self.finish('dedupe', state, True)
+
+    def inconsistent(self, digests):
+        # Hashes whose rows don't all point at their blob, or whose blob's count is off.
+        blobs = MediaBlob.objects.in_bulk(digests)
+        groups = {}
+        for model, field in CONTENT_FIELDS:
+            summary = (
+                model.objects.filter(content_hash__in=digests).order_by().values('content_hash')
+                .annotate(rows=Count('pk'), files=Count(field, distinct=True), name=Min(field))
+            )
+            for group in summary:
+                rows, names = groups.get(group['content_hash'], (0, set()))
+                if group['files'] > 1:
+                    names = names | {None}
+                groups[group['content_hash']] = (rows + group['rows'], names | {group['name']})
+        for digest in digests:
+            blob = blobs.get(digest)
+            rows, names = groups.get(digest, (0, set()))
+            if blob is None or names != {blob.name} or blob.ref_count != rows:
+                yield digest
+
+    def merge(self, digest, state):
+        with transaction.atomic():
+            blob = MediaBlob.objects.select_for_update().filter(pk=digest).first()
+            rows = [
+                (model, field, row)
+                for model, field in CONTENT_FIELDS
+                for row in model.objects.select_for_update().filter(content_hash=digest).order_by('pk')
+            ]
+            if not rows:
+                return
+            names = sorted({getattr(row, field).name for _, field, row in rows})
+            candidates = ([blob.name] if blob else []) + names
+            canonical = next((name for name in candidates if self.storage.exists(name)), None)
+            if canonical is None:
+                self.count(state, 'unrecoverable')
+                self.stderr.write(f'No stored copy of {digest} exists ({", ".join(names)}).')
+                return
+
+            freed = [name for name in names if name != canonical]
+            variants = next(
+                (row.variants for _, field, row in rows
+                 if isinstance(row, Image) and row.image.name == canonical and row.variants.get('source') == canonical),
+                None,
+            )
+            moved = [(model, field, row) for model, field, row in rows if getattr(row, field).name != canonical]
+            if freed:
+                self.count(state, 'duplicate_files', len(freed))
+                self.count(state, 'duplicate_bytes', sum(file_size(self.storage, name) for name in freed))
+            if moved:
+                self.count(state, 'rows_repointed', len(moved))
+            if blob is None:
+                self.count(state, 'blobs_created')
+            if self.options['verbosity'] >= 2 and freed:
+                self.stdout.write(f'  {digest}: keep {canonical}, merge {", ".join(freed)}')
+            if self.dry_run:
+                return
+
+            old_variants = []
+            for model, field, row in moved:
+                setattr(row, field, canonical)
+                update_fields = [field]
+                if isinstance(row, Image) and variants is not None:
+                    old_variants.append(row.variants)
+                    row.variants = variants
+                    update_fields.append('variants')
+                model.objects.filter(pk=row.pk).update(**{name: getattr(row, name) for name in update_fields})
+                schedule_eviction(row.residence_id)
+
+            size = file_size(self.storage, canonical)
+            if blob is None:
+                MediaBlob.objects.create(content_hash=digest, name=canonical, size=size, ref_count=len(rows))
+            else:
+                MediaBlob.objects.filter(pk=digest).update(name=canonical, size=size, ref_count=len(rows))
+
+            # Files no row refers to any more; a name some other blob holds is left alone.
+            freed = [name for name in freed if not MediaBlob.objects.filter(name=name).exclude(pk=digest).exists()]
+            kept = {
+                path for variant in (variants or {}).values() if isinstance(variant, dict) for path in variant.values()
+            }
+            storage = self.storage
+
+            def delete():
+                delete_files(storage, freed)
+                for old in old_variants:
+                    delete_variants(storage, {
+                        variant_name: {fmt: path for fmt, path in variant.items() if path not in kept}
+                        for variant_name, variant in old.items() if isinstance(variant, dict)
+                    })
+
+            transaction.on_commit(delete)
+
+    # Phase 3: stored files nothing refers to.
+
+    def run_orphans(self):
+        state = self.resume('orphans')
+        limit = self.options['limit']
+        batch_size = self.options['batch_size']
+        after = state['after']
+        cutoff = timezone.now() - timedelta(hours=self.options['min_age'])
+        prefixes = sorted({field.upload_to for model, name in FILE_FIELDS for field in [model._meta.get_field(name)]}
+                          | {'variants/', 'hls/'})
+        managed = tuple(prefixes)
+
+        refs = referenced_names(after, batch_size)
+        ref = next(refs, None)
+        examined = 0
+        doomed = []
+        for prefix in prefixes:
+            if after > prefix and not after.startswith(prefix):
+                continue  # finished in an earlier run
+            for name, size, modified in walk_storage(self.storage, prefix, after):
+                while ref is not None and ref < name and not (ref.endswith('/') and name.startswith(ref)):
+                    if not ref.endswith('/') and ref.startswith(managed):
+                        self.missing(state, ref)
+                    ref = next(refs, None)
+                examined += 1
+                self.count(state, 'files')
+                self.count(state, 'bytes', size)
+                if ref is not None and (ref == name or (ref.endswith('/') and name.startswith(ref))):
+                    if ref == name:
+                        ref = next(refs, None)
+                elif modified > cutoff:
+                    self.count(state, 'recent_unreferenced')
+                else:
+                    self.count(state, 'orphans')
+                    self.count(state, 'orphan_bytes', size)
+                    if self.options['verbosity'] >= 2:
+                        self.stdout.write(f'  orphan: {name} ({size} bytes)')
+                    doomed.append(name)
+
+                state['after'] = name
+                if examined % batch_size == 0:
+                    self.collect(doomed)
+                    self.save_checkpoint()
+                if limit and examined >= limit:
+                    self.collect(doomed)
+                    return self.finish('orphans', state, False)
+
+        self.collect(doomed)
+        while ref is not None:
+            if not ref.endswith('/') and ref.startswith(managed):
+                self.missing(state, ref)
+            ref = next(refs, None)
+        self.finish('orphans', state, True)
+
+    def missing(self, state, name):
+        self.count(state, 'missing_files')
+        if self.options['verbosity'] >= 2:
+            self.stdout.write(f'  missing: {name}')
+
+    def collect(self, doomed):
+        if not self.dry_run:
+            delete_files(self.storage, doomed)
+        doomed.clear()
@@ -0,0 +1,119 @@
+import csv
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from residences.cache import bump_list_generation, get_cache, residence_key
+from residences.geo import location_geohash
+from residences.models import Residence
+
+
+def words(text):
+    return tuple(re.findall(r'[a-z0-9]+', text.lower()))
+
+
+def load_gazetteer(path):
+    """Map each place name, as a tuple of words, to its ``(latitude, longitude)``."""
+    places = {}
+    try:
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            reader = csv.DictReader(f)
+            missing = {'name', 'latitude', 'longitude'} - set(reader.fieldnames or ())
+            if missing:
+                raise CommandError(f'{path} is missing the column(s): {", ".join(sorted(missing))}.')
+            for line, row in enumerate(reader, start=2):
+                try:
+                    location = (float(row['latitude']), float(row['longitude']))
+                except (TypeError, ValueError):
+                    raise CommandError(f'{path}:{line}: invalid coordinates.')
+                if not (-90 <= location[0] <= 90 and -180 <= location[1] <= 180):
+                    raise CommandError(f'{path}:{line}: coordinates out of range.')
+                if words(row['name']):
+                    places[words(row['name'])] = location
+    except OSError as exc:
+        raise CommandError(f'Cannot read the gazetteer: {exc}')
+    return places
+
+
+def geocode(address, places, longest):
+    """
+    Coordinates of the longest gazetteer name appearing in ``address``, as
+    whole words; the earliest one wins a tie, since addresses run from the
+    most to the least specific part.
+    """
+    tokens = words(address)
+    for size in range(min(longest, len(tokens)), 0, -1):
+        for start in range(len(tokens) - size + 1):
+            location = places.get(tokens[start:start + size])
+            if location is not None:
+                return location
+    return None
+
+
+class Command(BaseCommand):
+    help = ('Fill in residence coordinates offline by matching addresses against a gazetteer CSV '
+            '(name,latitude,longitude columns), or rebuild the geohash index with --reindex.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--gazetteer', help='CSV file of place names with latitude and longitude columns.')
+        parser.add_argument('--overwrite', action='store_true',
+                            help='Also geocode residences that already have coordinates.')
+        parser.add_argument('--reindex', action='store_true',
+                            help='Recompute the geohash of every residence with coordinates; no gazetteer needed.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='Report what would change without saving.')
+
+    def handle(self, *args, **options):
+        if options['reindex']:
+            queryset = Residence.objects.filter(latitude__isnull=False, longitude__isnull=False)
+            locate = lambda residence: (residence.latitude, residence.longitude)
+        elif options['gazetteer']:
+            places = load_gazetteer(options['gazetteer'])
+            if not places:
+                raise CommandError('The gazetteer has no places.')
+            longest = max(map(len, places))
+            queryset = Residence.objects.all()
+            if not options['overwrite']:
+                queryset = queryset.filter(latitude__isnull=True)
+            locate = lambda residence: geocode(residence.address, places, longest)
+        else:
+            raise CommandError('Pass --gazetteer, or --reindex to rebuild the geohash index.')
+
+        queryset = queryset.only('pk', 'address', 'latitude', 'longitude', 'geohash').order_by('pk')
+        seen = updated = unmatched = 0
+        last = None
+        while True:
+            batch = list((queryset.filter(pk__gt=last) if last else queryset)[:options['batch_size']])
+            if not batch:
+                break
+            last = batch[-1].pk
+            seen += len(batch)
+
+            changed = []
+            for residence in batch:
+                location = locate(residence)
+                if location is None:
+                    unmatched += 1
+                    continue
+                geohash = location_geohash(*location)
+                if (residence.latitude, residence.longitude, residence.geohash) != (*location, geohash):
+                    residence.latitude, residence.longitude = location
+                    residence.geohash = geohash
+                    changed.append(residence)
+            updated += len(changed)
+            if changed and not options['dry_run']:
+                # bulk_update skips the post_save signals that evict cached payloads.
+                with transaction.atomic():
+                    Residence.objects.bulk_update(changed, ['latitude', 'longitude', 'geohash'])
+                    keys = [residence_key(residence.pk) for residence in changed]
+                    transaction.on_commit(lambda keys=keys: get_cache().delete_many(keys))
+                    transaction.on_commit(bump_list_generation)
+            self.stderr.write(f'{seen} residences checked, {updated} updated', ending='\r')
+
+        self.stderr.write('')
+        verb = 'would be updated' if options['dry_run'] else 'updated'
+        summary = f'{seen} residences checked, {updated} {verb}'
+        if not options['reindex']:
+            summary += f', {unmatched} addresses not found in the gazetteer'
+        self.stdout.write(self.style.SUCCESS(summary + '.'))
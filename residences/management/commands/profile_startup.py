@@ -0,0 +1,208 @@
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Loads the app in a fresh interpreter the way a worker does, then reports the
+# time that took and the process's resident memory.
+LOAD_APP = '''
+import importlib, json, os, time
+started = time.perf_counter()
+importlib.import_module(os.environ['PROFILE_APP_MODULE']).application
+from django.urls import get_resolver
+get_resolver().url_patterns
+loaded = time.perf_counter() - started
+with open('/proc/self/status') as f:
+    rss = next(int(line.split()[1]) for line in f if line.startswith('VmRSS:'))
+print(json.dumps({'load': loaded, 'rss_kb': rss}))
+'''
+
+
+def memory(pid):
+    """Resident, proportional (shared pages split between their users) and unique memory of a process, in kB."""
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            name, _, value = line.partition(':')
+            if value.strip().endswith('kB'):
+                fields[name] = int(value.split()[0])
+    return {
+        'rss_kb': fields.get('Rss', 0),
+        'pss_kb': fields.get('Pss', 0),
+        'uss_kb': fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0),
+    }
+
+
+def children(pid):
+    found = []
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    # The command name may contain spaces; the parent pid follows its closing paren.
+                    if int(f.read().rpartition(')')[2].split()[1]) == pid:
+                        found.append(int(entry))
+            except (OSError, ValueError, IndexError):
+                continue
+    return sorted(found)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def fetch(url):
+    try:
+        with urllib.request.urlopen(url, timeout=10) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as exc:
+        return exc.code
+
+
+def mb(kb):
+    return f'{kb / 1024:.1f}MB'
+
+
+class Command(BaseCommand):
+    help = ('Report cold-start time, the slowest imports by package and per-worker memory under gunicorn '
+            '(with and without --preload), for the settings module in use. Linux only (reads /proc).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help='Fresh interpreters to time the app load in.')
+        parser.add_argument('--top', type=int, default=15, help='Packages to list by import time.')
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--requests', type=int, default=50, help='Requests sent before measuring memory.')
+        parser.add_argument('--url', default='/api/residences/', help='Path requested to warm the workers up.')
+        parser.add_argument('--compare', action='store_true', help='Also run gunicorn without --preload.')
+        parser.add_argument('--skip-workers', action='store_true', help="Only measure the cold start; don't run gunicorn.")
+        parser.add_argument('--json', help='Also write the results to this file, to compare releases.')
+
+    def handle(self, *args, **options):
+        if not os.path.exists('/proc/self/smaps_rollup'):
+            raise CommandError('profile_startup reads /proc and needs Linux 4.14 or later.')
+        self.env = {
+            **os.environ,
+            'DJANGO_SETTINGS_MODULE': os.environ['DJANGO_SETTINGS_MODULE'],
+            'PROFILE_APP_MODULE': f'bizapp.{settings.SERVER_MODE}',
+        }
+        results = {
+            'measured_at': datetime.now(timezone.utc).isoformat(),
+            'settings': self.env['DJANGO_SETTINGS_MODULE'],
+            'python': platform.python_version(),
+            'cold_start': self.cold_start(options['runs']),
+            'imports': self.imports(options['top']),
+        }
+        if not options['skip_workers']:
+            results['gunicorn'] = [self.gunicorn(True, options)]
+            if options['compare']:
+                results['gunicorn'].append(self.gunicorn(False, options))
+        if options['json']:
+            with open(options['json'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f'Wrote {options["json"]}')
+
+    def cold_start(self, runs):
+        totals, loads, rss = [], [], []
+        for _ in range(runs):
+            started = time.perf_counter()
+            output = subprocess.run([sys.executable, '-c', LOAD_APP], env=self.env, capture_output=True, text=True)
+            totals.append(time.perf_counter() - started)
+            if output.returncode:
+                raise CommandError(f'Loading the app failed:\n{output.stderr}')
+            sample = json.loads(output.stdout.strip().splitlines()[-1])
+            loads.append(sample['load'])
+            rss.append(sample['rss_kb'])
+        result = {
+            'process_seconds': statistics.median(totals),
+            'app_load_seconds': statistics.median(loads),
+            'rss_kb': statistics.median(rss),
+        }
+        self.stdout.write(
+            f'cold start ({self.env["DJANGO_SETTINGS_MODULE"]}, median of {runs}): '
+            f'process {result["process_seconds"] * 1000:.0f}ms, app load {result["app_load_seconds"] * 1000:.0f}ms, '
+            f'RSS {mb(result["rss_kb"])}'
+        )
+        return result
+
+    def imports(self, top):
+        output = subprocess.run([sys.executable, '-X', 'importtime', '-c', LOAD_APP], env=self.env,
+                                capture_output=True, text=True)
+        by_package = Counter()
+        for line in output.stderr.splitlines():
+            if not line.startswith('import time:') or 'self [us]' in line:
+                continue
+            self_us, _, name = line[len('import time:'):].split('|')
+            by_package[name.strip().split('.')[0]] += int(self_us)
+        total = sum(by_package.values()) or 1
+        self.stdout.write(f'imports: {total / 1000:.0f}ms in total (self time, by top-level package)')
+        for package, micros in by_package.most_common(top):
+            self.stdout.write(f'  {package:<24} {micros / 1000:7.1f}ms {micros * 100 / total:5.1f}%')
+        return [{'package': package, 'ms': micros / 1000} for package, micros in by_package.most_common(top)]
+
+    def gunicorn(self, preload, options):
+        port = free_port()
+        url = f'http://localhost:{port}{options["url"]}'
+        started = time.perf_counter()
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '--config', os.path.join(settings.BASE_DIR, 'gunicorn.conf.py'),
+             '--bind', f'127.0.0.1:{port}', '--workers', str(options['workers'])],
+            cwd=settings.BASE_DIR, env={**self.env, 'GUNICORN_PRELOAD': '1' if preload else '0'},
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            deadline = time.monotonic() + 60
+            while True:
+                if server.poll() is not None:
+                    raise CommandError('gunicorn exited during startup; run it by hand to see why.')
+                if time.monotonic() > deadline:
+                    raise CommandError('gunicorn did not start within 60 seconds.')
+                if len(children(server.pid)) >= options['workers']:
+                    try:
+                        fetch(url)
+                        break
+                    except OSError:
+                        pass
+                time.sleep(0.05)
+            ready = time.perf_counter() - started
+
+            statuses = Counter(fetch(url) for _ in range(options['requests']))
+            master = memory(server.pid)
+            workers = [memory(pid) for pid in children(server.pid)]
+        finally:
+            server.terminate()
+            server.wait()
+
+        total_pss = master['pss_kb'] + sum(worker['pss_kb'] for worker in workers)
+        label = 'preload' if preload else 'no preload'
+        codes = ', '.join(f'{code}: {n}' for code, n in sorted(statuses.items()))
+        self.stdout.write(
+            f'gunicorn, {len(workers)} workers, {label}: first response after {ready * 1000:.0f}ms; '
+            f'{options["requests"]} x {options["url"]} -> {codes}'
+        )
+        self.stdout.write(f'  master    RSS {mb(master["rss_kb"])} PSS {mb(master["pss_kb"])} USS {mb(master["uss_kb"])}')
+        for index, worker in enumerate(workers):
+            self.stdout.write(f'  worker {index}  RSS {mb(worker["rss_kb"])} PSS {mb(worker["pss_kb"])} '
+                              f'USS {mb(worker["uss_kb"])}')
+        self.stdout.write(f'  total PSS {mb(total_pss)} (memory actually used by the server)')
+        return {
+            'preload': preload,
+            'ready_seconds': ready,
+            'statuses': dict(statuses),
+            'master': master,
+            'workers': workers,
+            'total_pss_kb': total_pss,
+        }
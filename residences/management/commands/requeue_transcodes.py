@@ -0,0 +1,57 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.utils import timezone
+
+from residences.models import Video
+from residences.transcoding import transcode
+
+
+class Command(BaseCommand):
+    help = ('Transcode videos left pending or processing for VIDEO_TRANSCODE_STALE_MINUTES (their job was lost '
+            'when its web process stopped), and with --failed retry failed ones. Jobs run in this process, one '
+            'at a time, so it suits cron or a release phase.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stale-minutes', type=float, default=settings.VIDEO_TRANSCODE_STALE_MINUTES,
+                            help='How long a pending/processing video must have been idle.')
+        parser.add_argument('--failed', action='store_true', help='Also retry videos whose transcode failed.')
+        parser.add_argument('--limit', type=int, default=None, help='Transcode at most this many videos.')
+        parser.add_argument('--dry-run', action='store_true', help='Only list the videos that would be transcoded.')
+
+    def handle(self, *args, **options):
+        if not settings.VIDEO_TRANSCODE_ENABLED and not options['dry_run']:
+            raise CommandError('Transcoding is disabled (VIDEO_TRANSCODE_ENABLED=0).')
+
+        cutoff = timezone.now() - timedelta(minutes=options['stale_minutes'])
+        # Rows from before transcode_updated_at existed have no timestamp; treat them as stale.
+        idle = Q(transcode_updated_at__lt=cutoff) | Q(transcode_updated_at__isnull=True)
+        stale = Q(transcode_status__in=['pending', 'processing']) & idle
+        if options['failed']:
+            stale |= Q(transcode_status='failed')
+        candidates = Video.objects.filter(stale).exclude(video='')
+
+        pks = list(candidates.order_by('transcode_updated_at').values_list('pk', flat=True)[:options['limit']])
+        if options['dry_run']:
+            for pk in pks:
+                self.stdout.write(str(pk))
+            self.stdout.write(f'Would transcode {len(pks)} video(s).')
+            return
+
+        outcomes = {'ready': 0, 'failed': 0, 'skipped': 0}
+        for pk in pks:
+            # Claim the row, so a second run (or a job that turned out to be
+            # alive after all) doesn't transcode it at the same time.
+            if not candidates.filter(pk=pk).update(transcode_status='processing', transcode_updated_at=timezone.now()):
+                outcomes['skipped'] += 1
+                continue
+            transcode(pk)
+            status = Video.objects.filter(pk=pk).values_list('transcode_status', flat=True).first()
+            outcomes['ready' if status == 'ready' else 'failed'] += 1
+            self.stdout.write(f'{pk}: {status or "deleted"}')
+        self.stdout.write(
+            f'Transcoded {outcomes["ready"]} video(s); {outcomes["failed"]} failed, {outcomes["skipped"]} taken by '
+            'another run.'
+        )
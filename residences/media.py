@@ -0,0 +1,108 @@
+import hashlib
+
+from django.db import transaction
+from django.db.models.signals import post_save
+from rest_framework.exceptions import ValidationError
+
+from .blobs import acquire_blob, delete_files
+from .signals import schedule_eviction
+from .thumbnails import VARIANT_FIELDS
+
+
+def content_hash(file):
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def apply_media_changes(residence, model, field, uploads=(), remove=(), order=None, replace=False, limit=None,
+                        stored=(), digests=None):
+    """
+    Incrementally update one residence's images or videos in a single transaction.
+
+    ``uploads`` whose SHA-256 matches a kept row (or an earlier upload) are
+    skipped; new rows are inserted with one ``bulk_create``, pointing at the
+    content-addressed copy of their file (stored once, however many rows and
+    residences share it). ``digests`` gives the uploads' SHA-256 when the
+    caller has already computed them.
+    ``stored`` names files already in storage (direct uploads); they get rows
+    without being read, so they aren't de-duplicated.
+    ``remove`` lists row ids to delete, and with ``replace`` every existing row
+    whose content isn't re-uploaded is removed too. ``order`` is a list of row
+    ids giving the new display order; anything unlisted keeps its relative order
+    after them. Files nothing refers to any more are deleted from storage once
+    the transaction commits. Raises ValidationError if the result would exceed ``limit`` rows.
+    """
+    file_field = model._meta.get_field(field)
+    variants_field = VARIANT_FIELDS.get(model._meta.label, (None, None))[1]
+    if digests is None:
+        digests = [content_hash(upload) for upload in uploads]
+    hashed = list(zip(uploads, digests))
+    upload_hashes = {digest for _, digest in hashed}
+    remove = {str(pk) for pk in remove}
+    written = []
+
+    try:
+        with transaction.atomic():
+            existing = list(model.objects.select_for_update().filter(residence=residence).order_by('position'))
+            doomed = [
+                row for row in existing
+                if str(row.pk) in remove or (replace and row.content_hash not in upload_hashes)
+            ]
+            kept = [row for row in existing if row not in doomed]
+
+            seen = {row.content_hash for row in kept if row.content_hash}
+            new_rows = []
+            for upload, digest in hashed:
+                if digest in seen:
+                    continue
+                seen.add(digest)
+                row = model(residence=residence, content_hash=digest)
+                name, stored_now = acquire_blob(file_field, upload, digest)
+                getattr(row, field).name = name
+                if stored_now:
+                    written.append(name)
+                elif variants_field:
+                    # Share the variants already rendered for this file.
+                    shared = model.objects.filter(**{field: name}).exclude(**{variants_field: {}})
+                    setattr(row, variants_field, shared.values_list(variants_field, flat=True).first() or {})
+                new_rows.append(row)
+            for name in dict.fromkeys(stored):
+                row = model(residence=residence)
+                getattr(row, field).name = name
+                new_rows.append(row)
+
+            if limit is not None and len(kept) + len(new_rows) > limit:
+                raise ValidationError({'message': f'You can upload up to {limit} {field}s only.'})
+
+            if doomed:
+                # post_delete releases the files (see signals.media_file_deleted).
+                model.objects.filter(pk__in=[row.pk for row in doomed]).delete()
+
+            rank = {str(pk): index for index, pk in enumerate(order or [])}
+            ordered = sorted(kept, key=lambda row: rank.get(str(row.pk), len(rank))) + new_rows
+            moved = []
+            for position, row in enumerate(ordered):
+                if row.position != position:
+                    row.position = position
+                    if row in kept:
+                        moved.append(row)
+            if moved:
+                model.objects.bulk_update(moved, ['position'])
+
+            if new_rows:
+                model.objects.bulk_create(new_rows)
+                # bulk_create skips signals; send them so cache eviction, image
+                # variants and transcoding still run for the new rows.
+                for row in new_rows:
+                    post_save.send(sender=model, instance=row, created=True, update_fields=None, raw=False,
+                                   using=row._state.db)
+            elif moved:
+                schedule_eviction(residence.pk)
+    except Exception:
+        delete_files(file_field.storage, written)
+        raise
+
+    return ordered
@@ -0,0 +1,178 @@
+import contextvars
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+from .cache import get_cache
+
+INDEX_KEY = 'residences:metrics:index'
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+METRICS = {
+    'http_requests_total': ('counter', 'Requests served.'),
+    'http_request_duration_seconds': ('histogram', 'Wall time spent producing the response.'),
+    'db_queries_total': ('counter', 'ORM queries executed.'),
+    'db_query_seconds_total': ('counter', 'Time spent executing SQL.'),
+    'serialization_seconds_total': ('counter', 'Time spent in DRF serializers.'),
+    'storage_bytes_total': ('counter', 'Bytes read from or written to media storage.'),
+}
+
+current_stats = contextvars.ContextVar('request_stats', default=None)
+
+
+class RequestStats:
+    __slots__ = ('queries', 'sql_time', 'serialize_time', 'serialize_depth', 'bytes_read', 'bytes_written')
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.serialize_time = 0.0
+        self.serialize_depth = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+
+def record_query(execute, sql, params, many, context):
+    # Installed on every connection (see signals.py); a no-op outside requests.
+    stats = current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.sql_time += time.perf_counter() - started
+
+
+def record_storage(read=0, written=0):
+    stats = current_stats.get()
+    if stats is not None:
+        stats.bytes_read += read
+        stats.bytes_written += written
+
+
+class TimedSerializerMixin:
+    def to_representation(self, instance):
+        # Only the outermost serializer is timed, so nested ones aren't counted twice.
+        stats = current_stats.get()
+        if stats is None or stats.serialize_depth:
+            return super().to_representation(instance)
+        stats.serialize_depth = 1
+        started = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            stats.serialize_depth = 0
+            stats.serialize_time += time.perf_counter() - started
+
+
+def server_timing(stats, duration):
+    return (
+        f'total;dur={duration * 1000:.1f}, '
+        f'db;dur={stats.sql_time * 1000:.1f};desc="{stats.queries} queries", '
+        f'serialize;dur={stats.serialize_time * 1000:.1f}, '
+        f'storage;desc="read {stats.bytes_read}B, written {stats.bytes_written}B"'
+    )
+
+
+class Registry:
+    """
+    Per-process metric deltas, flushed into the shared cache.
+
+    Requests only touch process memory; every METRICS_FLUSH_INTERVAL seconds
+    the deltas are added to cache counters with ``incr`` so ``/metrics`` on any
+    worker reports totals for all of them. Times are stored as integer
+    microseconds because not every cache backend can ``incr`` floats.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = defaultdict(int)
+        self.known = set()
+        self.flushed_at = time.monotonic()
+
+    def observe(self, view, method, status, stats, duration):
+        labels = (('view', view), ('method', method))
+        bucket = next((str(bound) for bound in DURATION_BUCKETS if duration <= bound), '+Inf')
+        with self.lock:
+            pending = self.pending
+            pending[('http_requests_total', labels + (('status', str(status)),))] += 1
+            pending[('http_request_duration_seconds_bucket', labels + (('le', bucket),))] += 1
+            pending[('http_request_duration_seconds_sum', labels)] += int(duration * 1_000_000)
+            pending[('db_queries_total', labels)] += stats.queries
+            pending[('db_query_seconds_total', labels)] += int(stats.sql_time * 1_000_000)
+            pending[('serialization_seconds_total', labels)] += int(stats.serialize_time * 1_000_000)
+            if stats.bytes_read:
+                pending[('storage_bytes_total', labels + (('direction', 'read'),))] += stats.bytes_read
+            if stats.bytes_written:
+                pending[('storage_bytes_total', labels + (('direction', 'written'),))] += stats.bytes_written
+
+    def flush(self, force=False):
+        now = time.monotonic()
+        if not force and now - self.flushed_at < settings.METRICS_FLUSH_INTERVAL:
+            return
+        with self.lock:
+            pending, self.pending = self.pending, defaultdict(int)
+            self.flushed_at = now
+        if not pending:
+            return
+
+        cache = get_cache()
+        for series, value in pending.items():
+            key = series_key(series)
+            cache.add(key, 0, None)
+            cache.incr(key, value)
+        self.known.update(pending)
+        index = cache.get(INDEX_KEY) or set()
+        if not self.known <= index:
+            # Not atomic across workers, but every flush re-adds what this worker has seen.
+            cache.set(INDEX_KEY, index | self.known, None)
+
+
+registry = Registry()
+
+
+def series_key(series):
+    name, labels = series
+    return 'residences:metrics:' + name + ':' + ','.join(f'{key}={value}' for key, value in labels)
+
+
+def format_series(name, labels, value):
+    label_text = ','.join(f'{key}="{value}"' for key, value in labels)
+    return f'{name}{{{label_text}}} {value}'
+
+
+def render():
+    """Render every worker's flushed metrics in the Prometheus text format."""
+    registry.flush(force=True)
+    cache = get_cache()
+    index = sorted(cache.get(INDEX_KEY) or ())
+    values = cache.get_many([series_key(series) for series in index])
+    samples = defaultdict(dict)
+    for series in index:
+        name, labels = series
+        samples[name][labels] = values.get(series_key(series), 0)
+
+    lines = []
+    for metric, (kind, help_text) in METRICS.items():
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} {kind}')
+        if kind == 'histogram':
+            buckets = defaultdict(dict)
+            for labels, value in samples[f'{metric}_bucket'].items():
+                buckets[labels[:-1]][labels[-1][1]] = value
+            for labels, counts in sorted(buckets.items()):
+                cumulative = 0
+                for bound in [str(bound) for bound in DURATION_BUCKETS] + ['+Inf']:
+                    cumulative += counts.get(bound, 0)
+                    lines.append(format_series(f'{metric}_bucket', labels + (('le', bound),), cumulative))
+                lines.append(format_series(f'{metric}_sum', labels, samples[f'{metric}_sum'].get(labels, 0) / 1_000_000))
+                lines.append(format_series(f'{metric}_count', labels, cumulative))
+        else:
+            scale = 1_000_000 if metric.endswith('_seconds_total') else 1
+            for labels, value in sorted(samples[metric].items()):
+                lines.append(format_series(metric, labels, value / scale if scale != 1 else value))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,118 @@
+import time
+
+import brotli
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.text import compress_string
+
+from .metrics import RequestStats, current_stats, registry, server_timing
+
+
+class InstrumentationMiddleware:
+    """
+    Records wall time, query count and SQL time, serializer time and storage
+    bytes for each request.
+
+    Totals go to the per-process metrics registry (served at ``/metrics``) and,
+    with METRICS_SERVER_TIMING, to a ``Server-Timing`` header on the response.
+    Keep this first in MIDDLEWARE so the wall time covers the whole stack.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        return self.finish(request, response, stats, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        return self.finish(request, response, stats, time.perf_counter() - started)
+
+    def finish(self, request, response, stats, duration):
+        match = request.resolver_match
+        registry.observe(match.view_name if match else 'unmatched', request.method, response.status_code,
+                         stats, duration)
+        registry.flush()
+        if settings.METRICS_SERVER_TIMING:
+            response['Server-Timing'] = server_timing(stats, duration)
+        return response
+
+
+# Formats that are already compressed; recompressing them only costs CPU.
+INCOMPRESSIBLE_TYPES = ('image/', 'video/', 'audio/', 'application/zip', 'application/gzip', 'application/octet-stream')
+
+
+def accepted_encodings(header):
+    """Codings from an Accept-Encoding header, minus any refused with ``q=0``."""
+    codings = set()
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        quality = params.strip().removeprefix('q=')
+        try:
+            refused = params and float(quality) == 0
+        except ValueError:
+            refused = False
+        if coding and not refused:
+            codings.add(coding.strip().lower())
+    return codings
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Brotli or gzip for API responses of at least COMPRESSION_MIN_BYTES.
+
+    Unlike Django's GZipMiddleware, streaming responses (video, HLS segments,
+    exports) and media types that are already compressed are left alone, and
+    brotli is preferred when the client accepts it.
+    """
+
+    max_random_bytes = 100
+
+    def process_response(self, request, response):
+        if response.streaming or len(response.content) < settings.COMPRESSION_MIN_BYTES:
+            return response
+        if response.has_header('Content-Encoding') or response.get('Content-Type', '').startswith(INCOMPRESSIBLE_TYPES):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        codings = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if 'br' in codings:
+            coding, content = 'br', brotli.compress(response.content, quality=settings.COMPRESSION_BROTLI_QUALITY)
+        elif 'gzip' in codings:
+            # Random padding as in GZipMiddleware, against BREACH-style length probing.
+            coding, content = 'gzip', compress_string(response.content, max_random_bytes=self.max_random_bytes)
+        else:
+            return response
+        if len(content) >= len(response.content):
+            return response
+
+        response.content = content
+        response.headers['Content-Length'] = str(len(content))
+        response.headers['Content-Encoding'] = coding
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            # The compressed bytes differ, so the ETag may only be a weak one.
+            response.headers['ETag'] = 'W/' + etag
+        return response
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.4 on 2026-10-18 19:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('residences', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='residence',
+            index=models.Index(fields=['last_updated', 'id'], name='residence_updated_id_idx'),
+        ),
+    ]
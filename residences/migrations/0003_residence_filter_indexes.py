@@ -0,0 +1,47 @@
+# Generated by Django 5.1.4 on 2026-10-18 19:06
+
+from django.db import migrations, models
+
+
+def search_index():
+    from django.contrib.postgres.indexes import GinIndex
+    from django.contrib.postgres.search import SearchVector
+    return GinIndex(SearchVector('name', 'address', 'description', config='english'), name='residence_search_gin_idx')
+
+
+def add_search_index(apps, schema_editor):
+    # Full-text GIN index is PostgreSQL only; other backends use the icontains fallback.
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.add_index(apps.get_model('residences', 'Residence'), search_index())
+
+
+def remove_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.remove_index(apps.get_model('residences', 'Residence'), search_index())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('residences', '0002_residence_updated_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='residence',
+            index=models.Index(fields=['residence_type', 'rooms_available', 'room_price'], name='residence_type_avail_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='residence',
+            index=models.Index(fields=['rooms_available', 'number_of_rooms_available'], name='residence_avail_rooms_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='residence',
+            index=models.Index(fields=['room_price'], name='residence_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='residence',
+            index=models.Index(fields=['room_available_date'], name='residence_available_date_idx'),
+        ),
+        migrations.RunPython(add_search_index, remove_search_index),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.4 on 2026-10-18 19:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('residences', '0005_videoupload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='hls_manifest',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='poster',
+            field=models.ImageField(blank=True, null=True, upload_to='video_posters/'),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='transcode_progress',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='transcode_status',
+            field=models.CharField(blank=True, choices=[('', 'Not transcoded'), ('pending', 'Pending'), ('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], default='', max_length=10),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.4 on 2026-10-18 19:13
+
+from django.db import migrations, models
+
+
+def create_sequence(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('CREATE SEQUENCE IF NOT EXISTS residences_reference_number_seq MINVALUE 1 START 1')
+
+
+def drop_sequence(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP SEQUENCE IF EXISTS residences_reference_number_seq')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('residences', '0007_media_position_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReferenceCounter',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('value', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='customuser',
+            name='reference_number',
+            field=models.CharField(blank=True, max_length=8, null=True, unique=True),
+        ),
+        migrations.RunPython(create_sequence, drop_sequence),
+    ]
@@ -0,0 +1,83 @@
+# Generated by Django 5.1.4 on 2026-10-18 19:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+# Tier limits previously hard-coded as MAX_LIMITS in views.py.
+PLANS = [
+    ('premium', 'Premium', 5, 6, 3),
+    ('videos_subscribed', 'Videos subscription', 2, 6, 1),
+    ('images_subscribed', 'Images subscription', 1, 6, 0),
+    ('freemium', 'Freemium', 1, 3, 0),
+]
+
+
+def populate(apps, schema_editor):
+    Plan = apps.get_model('residences', 'Plan')
+    CustomUser = apps.get_model('residences', 'CustomUser')
+    Residence = apps.get_model('residences', 'Residence')
+    plans = {}
+    for code, name, residences, images, videos in PLANS:
+        plans[code], _ = Plan.objects.get_or_create(
+            code=code, defaults={'name': name, 'max_residences': residences, 'max_images': images, 'max_videos': videos},
+        )
+
+    # Same precedence as the old flag cascade.
+    CustomUser.objects.filter(is_on_premium=True).update(plan=plans['premium'])
+    CustomUser.objects.filter(plan=None, is_videos_subscribed=True).update(plan=plans['videos_subscribed'])
+    CustomUser.objects.filter(plan=None, is_images_subscribed=True).update(plan=plans['images_subscribed'])
+    CustomUser.objects.filter(plan=None).update(plan=plans['freemium'])
+
+    residence_counts = models.Subquery(
+        Residence.objects.filter(user=models.OuterRef('pk')).values('user').annotate(n=models.Count('pk')).values('n')
+    )
+    CustomUser.objects.update(residence_count=Coalesce(residence_counts, 0))
+    for model, field in (('Image', 'image_count'), ('Video', 'video_count')):
+        counts = models.Subquery(
+            apps.get_model('residences', model).objects.filter(residence=models.OuterRef('pk'))
+            .values('residence').annotate(n=models.Count('pk')).values('n')
+        )
+        Residence.objects.update(**{field: Coalesce(counts, 0)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('residences', '0008_reference_number_allocator'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Plan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.SlugField(max_length=30, unique=True)),
+                ('name', models.CharField(max_length=100)),
+                ('max_residences', models.PositiveIntegerField()),
+                ('max_images', models.PositiveIntegerField()),
+                ('max_videos', models.PositiveIntegerField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='residence_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='residence',
+            name='image_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='residence',
+            name='video_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='plan',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='residences.plan'),
+        ),
+        migrations.RunPython(populate, migrations.RunPython.noop),
+    ]
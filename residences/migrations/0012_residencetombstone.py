@@ -0,0 +1,23 @@
+# Generated by Django 5.1.4 on 2026-10-18 19:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('residences', '0011_mediablob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResidenceTombstone',
+            fields=[
+                ('residence_id', models.UUIDField(primary_key=True, serialize=False)),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['deleted_at', 'residence_id'], name='tombstone_deleted_id_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.4 on 2026-10-18 20:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('residences', '0012_residencetombstone'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='videoupload',
+            name='video',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='residences.video'),
+        ),
+    ]
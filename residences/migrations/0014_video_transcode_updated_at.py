@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 20:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('residences', '0013_videoupload_shared_video'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='transcode_updated_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
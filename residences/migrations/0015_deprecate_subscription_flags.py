@@ -0,0 +1,28 @@
+# Generated by Django 5.1.4 on 2026-10-18 20:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('residences', '0014_video_transcode_updated_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customuser',
+            name='is_images_subscribed',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='customuser',
+            name='is_on_premium',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='customuser',
+            name='is_videos_subscribed',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.4 on 2026-10-18 21:40
+
+import hashlib
+import secrets
+
+from django.conf import settings
+from django.db import migrations, models
+
+# reference_number is max_length=8 with four digits, so codes have 2-4 letters.
+LETTERS = range(2, 5)
+
+
+def store_keys(apps, schema_editor):
+    # Keys used to be derived from SECRET_KEY. Where numbers have been issued,
+    # keep that mapping (derived from the key in use now); otherwise start
+    # from random keys.
+    CustomUser = apps.get_model('residences', 'CustomUser')
+    ReferenceKey = apps.get_model('residences', 'ReferenceKey')
+    db = schema_editor.connection.alias
+    issued = CustomUser.objects.using(db).filter(reference_number__isnull=False).exists()
+    for letters in LETTERS:
+        if issued:
+            key = hashlib.sha256(f'reference-number:{letters}:{settings.SECRET_KEY}'.encode()).hexdigest()
+        else:
+            key = secrets.token_hex(32)
+        ReferenceKey.objects.using(db).get_or_create(letters=letters, defaults={'key': key})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('residences', '0015_deprecate_subscription_flags'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReferenceKey',
+            fields=[
+                ('letters', models.PositiveSmallIntegerField(primary_key=True, serialize=False)),
+                ('key', models.CharField(editable=False, max_length=64)),
+            ],
+        ),
+        migrations.RunPython(store_keys, migrations.RunPython.noop),
+    ]
@@ -1,37 +1,77 @@
 import uuid
-from django.db import models
+from django.db import models, transaction, IntegrityError
 from django.contrib.auth.models import AbstractUser
-import random
-import string
+from django.core.validators import MaxValueValidator, MinValueValidator
 
-def generate_reference_number():
-    letters = ''.join(random.choices(string.ascii_uppercase, k=2))
-    numbers = ''.join(random.choices(string.digits, k=4))
-    return letters + numbers
+from .geo import location_geohash
+
+class Plan(models.Model):
+    code = models.SlugField(max_length=30, unique=True)
+    name = models.CharField(max_length=100)
+    max_residences = models.PositiveIntegerField()
+    max_images = models.PositiveIntegerField()
+    max_videos = models.PositiveIntegerField()
+
+    def __str__(self):
+        return self.name
 
 class CustomUser(AbstractUser):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     phone = models.CharField(max_length=15, blank=True, null=True)
     profile_image = models.ImageField(upload_to='profile_images/', blank=True, null=True)
-    is_images_subscribed = models.BooleanField(default=False)
-    is_videos_subscribed = models.BooleanField(default=False)
-    is_on_premium = models.BooleanField(default=False)
-    reference_number = models.CharField(max_length=6, unique=True, null=True, blank=True)
+    profile_image_variants = models.JSONField(default=dict, blank=True, editable=False)
+    # Deprecated: quotas come from ``plan`` (migration 0009 mapped these onto it
+    # once). Not editable, so setting one can't look like it changed anything;
+    # the API reports them derived from the plan.
+    is_images_subscribed = models.BooleanField(default=False, editable=False)
+    is_videos_subscribed = models.BooleanField(default=False, editable=False)
+    is_on_premium = models.BooleanField(default=False, editable=False)
+    reference_number = models.CharField(max_length=8, unique=True, null=True, blank=True)
+    plan = models.ForeignKey(Plan, null=True, blank=True, on_delete=models.SET_NULL)
+    residence_count = models.PositiveIntegerField(default=0, editable=False)
 
     def save(self, *args, **kwargs):
-        if not self.reference_number:
+        if self.reference_number:
+            return super().save(*args, **kwargs)
+
+        # Allocated codes never repeat, but one may still match a code drawn
+        # randomly before the allocator existed; skip those and take the next.
+        for attempt in range(5):
             self.reference_number = self.generate_unique_reference_number()
-        super().save(*args, **kwargs)
+            try:
+                with transaction.atomic(using=kwargs.get('using')):
+                    return super().save(*args, **kwargs)
+            except IntegrityError:
+                taken = CustomUser.objects.filter(reference_number=self.reference_number).exclude(pk=self.pk).exists()
+                if not taken or attempt == 4:
+                    self.reference_number = None
+                    raise
 
     def generate_unique_reference_number(self):
-        reference_number = generate_reference_number()
-        while CustomUser.objects.filter(reference_number=reference_number).exists():
-            reference_number = generate_reference_number()
-        return reference_number
+        from .references import allocate_reference_number
+        return allocate_reference_number()
 
     def __str__(self):
         return self.username
 
+class ReferenceCounter(models.Model):
+    # Allocation counter for databases without native sequences (PostgreSQL uses one).
+    name = models.CharField(max_length=50, primary_key=True)
+    value = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+class ReferenceKey(models.Model):
+    # Key of the reference number permutation for codes with this many
+    # letters. Never change one: later allocations would land on numbers
+    # already issued.
+    letters = models.PositiveSmallIntegerField(primary_key=True)
+    key = models.CharField(max_length=64, editable=False)
+
+    def __str__(self):
+        return f"{self.letters} letters"
+
 class Residence(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     RESIDENCE_TYPE_CHOICES = [
@@ -47,30 +87,124 @@ class Residence(models.Model):
     rooms_include = models.TextField(null=True, blank=True)
     description = models.TextField(null=True, blank=True)
     cover_image = models.ImageField(upload_to='residence_images/', blank=True, null=True)
+    cover_image_variants = models.JSONField(default=dict, blank=True, editable=False)
     rooms_available = models.BooleanField(default=True)
     number_of_rooms_available = models.PositiveIntegerField(default=0)
     room_available_date = models.DateField(blank=True, null=True)
     last_updated = models.DateTimeField(auto_now=True)
     business_contacts = models.CharField(max_length=255, blank=True, null=True)
     business_email = models.EmailField(blank=True, null=True)
+    image_count = models.PositiveIntegerField(default=0, editable=False)
+    video_count = models.PositiveIntegerField(default=0, editable=False)
+    latitude = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-90), MaxValueValidator(90)])
+    longitude = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-180), MaxValueValidator(180)])
+    # Derived from latitude/longitude on save; range scans on its prefixes back the nearby search.
+    geohash = models.CharField(max_length=12, blank=True, db_index=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['last_updated', 'id'], name='residence_updated_id_idx'),
+            models.Index(fields=['residence_type', 'rooms_available', 'room_price'], name='residence_type_avail_price_idx'),
+            models.Index(fields=['rooms_available', 'number_of_rooms_available'], name='residence_avail_rooms_idx'),
+            models.Index(fields=['room_price'], name='residence_price_idx'),
+            models.Index(fields=['room_available_date'], name='residence_available_date_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.geohash = location_geohash(self.latitude, self.longitude)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'geohash'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name
 
+class ResidenceTombstone(models.Model):
+    # Left behind by a deleted residence so the change feed can report the deletion.
+    residence_id = models.UUIDField(primary_key=True)
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['deleted_at', 'residence_id'], name='tombstone_deleted_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"Residence {self.residence_id} deleted at {self.deleted_at}"
+
 class Image(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     residence = models.ForeignKey(Residence, related_name='images', on_delete=models.CASCADE)
     image = models.ImageField(upload_to='extra_images/', blank=True)
+    variants = models.JSONField(default=dict, blank=True, editable=False)
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True, editable=False)
+    position = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['position']
 
     def __str__(self):
         return f"Image for {self.residence.name}"
 
+class MediaBlob(models.Model):
+    # One stored file per distinct upload content; Image/Video rows with the
+    # same SHA-256 share it, and it is deleted when the last of them goes.
+    content_hash = models.CharField(max_length=64, primary_key=True)
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField(default=0)
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} references)"
+
 class Video(models.Model):
+    TRANSCODE_STATUS_CHOICES = [
+        ('', 'Not transcoded'),
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    ]
+
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     residence = models.ForeignKey(Residence, related_name='videos', on_delete=models.CASCADE)
     video = models.FileField(upload_to='residence_videos/', blank=True)
+    transcode_status = models.CharField(max_length=10, choices=TRANSCODE_STATUS_CHOICES, default='', blank=True)
+    transcode_progress = models.PositiveSmallIntegerField(default=0)
+    # Last status or progress write; a pending/processing row that stops moving was lost with its worker.
+    transcode_updated_at = models.DateTimeField(null=True, blank=True, editable=False)
+    hls_manifest = models.CharField(max_length=255, blank=True)
+    poster = models.ImageField(upload_to='video_posters/', blank=True, null=True)
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True, editable=False)
+    position = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['position']
 
     def __str__(self):
         return f"Video for {self.residence.name}"
 
 
+
+class VideoUpload(models.Model):
+    STATUS_CHOICES = [
+        ('uploading', 'Uploading'),
+        ('complete', 'Complete'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    residence = models.ForeignKey(Residence, related_name='video_uploads', on_delete=models.CASCADE)
+    filename = models.CharField(max_length=255)
+    length = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='uploading')
+    # Uploads of content the residence already has resolve to that video, so several may share one.
+    video = models.ForeignKey(Video, null=True, blank=True, on_delete=models.SET_NULL)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Upload of {self.filename} for {self.residence.name}"
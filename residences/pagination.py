@@ -0,0 +1,13 @@
+from rest_framework.pagination import CursorPagination
+
+
+class IdCursorPagination(CursorPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('id',)
+
+
+class ResidenceCursorPagination(IdCursorPagination):
+    # Keyset on (last_updated, id), newest first; backed by residence_updated_id_idx.
+    ordering = ('-last_updated', '-id')
@@ -0,0 +1,149 @@
+from decimal import Decimal
+
+from django.db.models import Avg, Count, F, Max, Min, Q, Sum, Value
+from django.db.models.functions import Coalesce, Least
+from rest_framework.exceptions import ValidationError
+
+from .cache import get_cache
+from .models import CustomUser, Plan, Residence
+
+PLANS_KEY = 'residences:plans'
+DEFAULT_PLAN = 'freemium'
+
+
+class QuotaExceeded(ValidationError):
+    def __init__(self, message):
+        super().__init__({'message': message})
+
+
+def get_plans():
+    # Plans are a handful of rows that rarely change; keep them cached and
+    # evict on save (see signals.py) so quota checks don't query them.
+    cache = get_cache()
+    plans = cache.get(PLANS_KEY)
+    if plans is None:
+        plans = {plan.pk: plan for plan in Plan.objects.all()}
+        cache.set(PLANS_KEY, plans, None)
+    return plans
+
+
+async def aget_plans():
+    cache = get_cache()
+    plans = await cache.aget(PLANS_KEY)
+    if plans is None:
+        plans = {plan.pk: plan async for plan in Plan.objects.all()}
+        await cache.aset(PLANS_KEY, plans, None)
+    return plans
+
+
+def evict_plans():
+    get_cache().delete(PLANS_KEY)
+
+
+def get_plan(user, plans=None):
+    if plans is None:
+        plans = get_plans()
+    if user.plan_id in plans:
+        return plans[user.plan_id]
+    return next(plan for plan in plans.values() if plan.code == DEFAULT_PLAN)
+
+
+def check_media_limits(plan, images=0, videos=0):
+    if images > plan.max_images:
+        raise QuotaExceeded(f'You can upload up to {plan.max_images} images only.')
+    if videos > plan.max_videos:
+        if plan.max_videos == 0:
+            raise QuotaExceeded('You cannot upload videos with your current subscription.')
+        raise QuotaExceeded(f'You can upload up to {plan.max_videos} videos only.')
+
+
+def enforce_quota(user, residence=None, images=0, videos=0):
+    """
+    Check ``user``'s plan limits with a single conditional UPDATE.
+
+    Creating (``residence`` is None) checks the denormalized residence counter
+    and locks the user row; editing locks the residence row instead. The lock
+    is held until the surrounding transaction commits, so concurrent requests
+    queue and re-check against the updated counters. ``images``/``videos`` are
+    the media counts the request will leave the residence with.
+    """
+    plan = get_plan(user)
+    check_media_limits(plan, images, videos)
+    if residence is None:
+        locked = CustomUser.objects.filter(pk=user.pk, residence_count__lt=plan.max_residences).update(
+            residence_count=F('residence_count')
+        )
+        if not locked:
+            raise QuotaExceeded(f'You have reached the maximum limit of {plan.max_residences} residences.')
+    else:
+        Residence.objects.filter(pk=residence.pk).update(image_count=F('image_count'))
+    return plan
+
+
+def reserve_residences(user, count):
+    """
+    Claim up to ``count`` residence slots for a bulk insert, which skips the
+    post_save signal that normally bumps the counter. Locks the user row until
+    the surrounding transaction commits and returns the number granted.
+    """
+    plan = get_plan(user)
+    current = CustomUser.objects.select_for_update().filter(pk=user.pk).values_list('residence_count', flat=True).get()
+    granted = max(0, min(count, plan.max_residences - current))
+    if granted:
+        CustomUser.objects.filter(pk=user.pk).update(residence_count=F('residence_count') + granted)
+    return granted
+
+
+def price(value):
+    return None if value is None else str(Decimal(value).quantize(Decimal('0.01')))
+
+
+def owner_dashboard(user):
+    """
+    Listing totals and remaining plan allowance for ``user``, from one
+    aggregate query over their residences (media counts come from the
+    per-residence counters) plus the cached plans.
+
+    ``rooms.total`` adds up ``number_of_rooms_available`` over every listing;
+    ``rooms.available`` only over listings marked available. Remaining images
+    and videos are the free slots left across all the owner's residences.
+    """
+    plan = get_plan(user)
+    totals = Residence.objects.filter(user=user).aggregate(
+        residences=Count('pk'),
+        available_residences=Count('pk', filter=Q(rooms_available=True)),
+        rooms_total=Coalesce(Sum('number_of_rooms_available'), 0),
+        rooms_available=Coalesce(Sum('number_of_rooms_available', filter=Q(rooms_available=True)), 0),
+        min_price=Min('room_price'),
+        max_price=Max('room_price'),
+        avg_price=Avg('room_price'),
+        images=Coalesce(Sum('image_count'), 0),
+        videos=Coalesce(Sum('video_count'), 0),
+        # Capped per residence, in case a plan change left some above the limit.
+        images_used=Coalesce(Sum(Least('image_count', Value(plan.max_images))), 0),
+        videos_used=Coalesce(Sum(Least('video_count', Value(plan.max_videos))), 0),
+    )
+    return {
+        'residences': totals['residences'],
+        'available_residences': totals['available_residences'],
+        'rooms': {'total': totals['rooms_total'], 'available': totals['rooms_available']},
+        'room_price': {
+            'min': price(totals['min_price']),
+            'max': price(totals['max_price']),
+            'avg': price(totals['avg_price']),
+        },
+        'media': {'images': totals['images'], 'videos': totals['videos']},
+        'plan': {
+            'code': plan.code,
+            'name': plan.name,
+            'max_residences': plan.max_residences,
+            'max_images': plan.max_images,
+            'max_videos': plan.max_videos,
+        },
+        'remaining': {
+            # The counter enforce_quota checks, so this matches what a new submission will see.
+            'residences': max(plan.max_residences - user.residence_count, 0),
+            'images': totals['residences'] * plan.max_images - totals['images_used'],
+            'videos': totals['residences'] * plan.max_videos - totals['videos_used'],
+        },
+    }
@@ -0,0 +1,111 @@
+import hashlib
+import hmac
+import math
+import secrets
+import string
+
+from django.conf import settings
+from django.db import connections
+
+DIGITS = 4
+FEISTEL_ROUNDS = 4
+SEQUENCE_NAME = 'residences_reference_number_seq'
+
+# Permutation keys by (database alias, letters); they never change once stored.
+_keys = {}
+
+
+class ReferenceNumbersExhausted(Exception):
+    pass
+
+
+def generation_size(letters):
+    return 26 ** letters * 10 ** DIGITS
+
+
+def permute(value, domain, key):
+    """
+    Keyed bijection on ``range(domain)``: a Feistel network over an m x m grid
+    with cycle-walking for the values that land outside the domain.
+    """
+    m = math.isqrt(domain - 1) + 1
+    while True:
+        left, right = divmod(value, m)
+        for round_ in range(FEISTEL_ROUNDS):
+            digest = hmac.new(key, f'{round_}:{right}'.encode(), hashlib.sha256).digest()
+            left, right = right, (left + int.from_bytes(digest[:8], 'big')) % m
+        value = left * m + right
+        if value < domain:
+            return value
+
+
+def encode(value, letters):
+    prefix, number = divmod(value, 10 ** DIGITS)
+    chars = []
+    for _ in range(letters):
+        prefix, index = divmod(prefix, 26)
+        chars.append(string.ascii_uppercase[index])
+    return ''.join(reversed(chars)) + f'{number:0{DIGITS}d}'
+
+
+def permutation_key(letters, using='default'):
+    """
+    Key of the permutation for codes with ``letters`` letters. It is stored
+    in the database rather than derived from SECRET_KEY, so rotating that
+    doesn't reshuffle the mapping onto numbers already issued.
+    """
+    key = _keys.get((using, letters))
+    if key is None:
+        from .models import ReferenceKey
+        row, created = ReferenceKey.objects.using(using).get_or_create(
+            letters=letters, defaults={'key': secrets.token_hex(32)},
+        )
+        key = bytes.fromhex(row.key)
+        # A key created inside the caller's transaction could still be rolled back.
+        if not created:
+            _keys[using, letters] = key
+    return key
+
+
+def reference_for(sequence_value, using='default'):
+    """
+    Map the n-th allocation to its reference number.
+
+    The first 6.76M allocations use the original two letters + four digits
+    format. After that the space expands one letter at a time (three letters
+    give 175M more codes) up to REFERENCE_NUMBER_MAX_LETTERS, after which
+    ReferenceNumbersExhausted is raised.
+    """
+    letters = 2
+    offset = sequence_value
+    while offset >= generation_size(letters):
+        offset -= generation_size(letters)
+        letters += 1
+        if letters > settings.REFERENCE_NUMBER_MAX_LETTERS:
+            raise ReferenceNumbersExhausted(f'All reference numbers up to {letters - 1} letters are allocated.')
+    return encode(permute(offset, generation_size(letters), permutation_key(letters, using)), letters)
+
+
+def next_sequence_value(using='default'):
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        # nextval() never blocks on concurrent allocations and isn't rolled back.
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT nextval(%s)', [SEQUENCE_NAME])
+            return cursor.fetchone()[0] - 1
+
+    # Single atomic statement, so concurrent allocations queue on the row lock
+    # instead of racing a read-modify-write.
+    from .models import ReferenceCounter
+    table = connection.ops.quote_name(ReferenceCounter._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(f'UPDATE {table} SET value = value + 1 WHERE name = %s RETURNING value', ['reference_number'])
+        row = cursor.fetchone()
+    if row is None:
+        ReferenceCounter.objects.using(using).get_or_create(name='reference_number')
+        return next_sequence_value(using)
+    return row[0] - 1
+
+
+def allocate_reference_number(using='default'):
+    return reference_for(next_sequence_value(using), using)
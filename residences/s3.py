@@ -0,0 +1,8 @@
+from storages.backends.s3 import S3Storage
+
+from .storage import InstrumentedStorageMixin
+
+
+class InstrumentedS3Storage(InstrumentedStorageMixin, S3Storage):
+    # Kept apart from residences.storage so boto3 is only imported when MEDIA_STORAGE=s3.
+    pass
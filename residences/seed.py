@@ -0,0 +1,59 @@
+import datetime
+import random
+import uuid
+from decimal import Decimal
+
+from .geo import location_geohash
+from .models import CustomUser, Residence, Image, Video
+
+# Synthetic residences are scattered within about 30km of Braamfontein.
+SEED_CENTRE = (-26.1929, 28.0305)
+SEED_SPREAD = 0.27
+
+
+def seed_residences(count, images_per_residence=3, videos_per_residence=1, owners=None, batch_size=1000):
+    """
+    Bulk-insert ``count`` synthetic residences with media rows for benchmarks.
+
+    Media rows point at placeholder file names; nothing is written to storage.
+    """
+    if owners is None:
+        owners = max(1, count // 5)
+    prefix = uuid.uuid4().hex[:8]
+    users = CustomUser.objects.bulk_create(
+        [CustomUser(username=f'seed-{prefix}-{i}') for i in range(owners)],
+        batch_size=batch_size,
+    )
+
+    today = datetime.date.today()
+    residences = [
+        Residence(
+            user=users[i % owners],
+            name=f'Residence {i}',
+            address=f'{i} Main Road, Braamfontein',
+            residence_type=random.choice(['standard', 'bachelor']),
+            room_price=Decimal(random.randint(1500, 9000)),
+            rooms_include='Bed, desk, wifi',
+            description='Synthetic residence used for benchmarks.',
+            cover_image='residence_images/seed.jpg',
+            rooms_available=random.random() < 0.7,
+            number_of_rooms_available=random.randint(0, 20),
+            room_available_date=today + datetime.timedelta(days=random.randint(0, 180)),
+            latitude=SEED_CENTRE[0] + random.uniform(-SEED_SPREAD, SEED_SPREAD),
+            longitude=SEED_CENTRE[1] + random.uniform(-SEED_SPREAD, SEED_SPREAD),
+        )
+        for i in range(count)
+    ]
+    for residence in residences:
+        residence.geohash = location_geohash(residence.latitude, residence.longitude)
+    Residence.objects.bulk_create(residences, batch_size=batch_size)
+
+    Image.objects.bulk_create(
+        [Image(residence=r, image='extra_images/seed.jpg') for r in residences for _ in range(images_per_residence)],
+        batch_size=batch_size,
+    )
+    Video.objects.bulk_create(
+        [Video(residence=r, video='residence_videos/seed.mp4') for r in residences for _ in range(videos_per_residence)],
+        batch_size=batch_size,
+    )
+    return residences
@@ -1,14 +1,70 @@
+from django.core.files.storage import default_storage
+from django.urls import reverse
 from rest_framework import serializers
-from .models import CustomUser, Residence, Image, Video
+from .models import CustomUser, Residence, Image, Video, VideoUpload
+from .metrics import TimedSerializerMixin
+from .quotas import get_plan
+from .thumbnails import VARIANT_SIZES
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """
+    Renders stored image variants as URLs plus ``srcset`` strings per format.
+    """
+
+    def to_representation(self, value):
+        if not value:
+            return {}
+        request = self.context.get('request')
+
+        def url(name):
+            url = default_storage.url(name)
+            return request.build_absolute_uri(url) if request is not None else url
+
+        data = {}
+        srcset = {'webp': [], 'jpeg': []}
+        for name in VARIANT_SIZES:
+            variant = value.get(name)
+            if not variant:
+                continue
+            data[name] = {'width': variant['width'], 'height': variant['height'],
+                          'webp': url(variant['webp']), 'jpeg': url(variant['jpeg'])}
+            for fmt in srcset:
+                srcset[fmt].append(f"{data[name][fmt]} {variant['width']}w")
+        data['srcset'] = {fmt: ', '.join(entries) for fmt, entries in srcset.items()}
+        return data
+
+class PlanFlagField(serializers.Field):
+    """
+    Deprecated subscription flag, read-only: true when the user is on the
+    plan that replaced it. Change the user's plan instead.
+    """
+
+    def __init__(self, plan_code, **kwargs):
+        self.plan_code = plan_code
+        super().__init__(source='*', read_only=True, **kwargs)
+
+    def to_representation(self, user):
+        return get_plan(user, self.context.get('plans')).code == self.plan_code
+
+class CustomUserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    profile_image_variants = ImageVariantsField()
+    plan = serializers.SerializerMethodField()
+    is_images_subscribed = PlanFlagField('images_subscribed')
+    is_videos_subscribed = PlanFlagField('videos_subscribed')
+    is_on_premium = PlanFlagField('premium')
 
-class CustomUserSerializer(serializers.ModelSerializer):
     class Meta:
         model = CustomUser
-        fields = ['id', 'username', 'email', 'first_name', 'last_name', 'phone', 'profile_image', 'password', 'reference_number',
-                'is_images_subscribed', 'is_videos_subscribed', 'is_on_premium'
+        fields = ['id', 'username', 'email', 'first_name', 'last_name', 'phone', 'profile_image', 'profile_image_variants',
+                'password', 'reference_number', 'is_images_subscribed', 'is_videos_subscribed', 'is_on_premium',
+                'plan', 'residence_count'
         ]
         extra_kwargs = {'password': {'write_only': True}}
 
+    def get_plan(self, obj):
+        # Async views pass the plans in context, having loaded them without blocking.
+        return get_plan(obj, self.context.get('plans')).code
+
     def create(self, validated_data):
         user = CustomUser.objects.create_user(**validated_data)
         return user
@@ -22,24 +78,69 @@ class CustomUserSerializer(serializers.ModelSerializer):
         instance.save()
         return instance
 
-class ImageSerializer(serializers.ModelSerializer):
+class ImageSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    variants = ImageVariantsField()
+
     class Meta:
         model = Image
-        fields = ['id', 'image']
+        fields = ['id', 'image', 'variants']
+
+class VideoSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    hls_url = serializers.SerializerMethodField()
 
-class VideoSerializer(serializers.ModelSerializer):
     class Meta:
         model = Video
-        fields = ['id', 'video']
+        fields = ['id', 'video', 'poster', 'transcode_status', 'transcode_progress', 'hls_url']
+        read_only_fields = ['poster', 'transcode_status', 'transcode_progress']
+
+    def get_hls_url(self, obj):
+        if obj.transcode_status != 'ready':
+            return None
+        url = reverse('stream_video_hls', args=[obj.pk])
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request is not None else url
+
+def requested_fields(request):
+    """
+    Return the set of field names asked for with ``?fields=a,b``, or None.
+    """
+    if request is None:
+        return None
+    fields = request.query_params.get('fields')
+    if not fields:
+        return None
+    return {name.strip() for name in fields.split(',') if name.strip()}
 
-class ResidenceSerializer(serializers.ModelSerializer):
+class ResidenceSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     images = ImageSerializer(many=True, read_only=True)
     videos = VideoSerializer(many=True, read_only=True)
+    cover_image_variants = ImageVariantsField()
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is None and self.context.get('request') is not None and self.context['request'].method == 'GET':
+            fields = requested_fields(self.context['request'])
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
 
     class Meta:
         model = Residence
         fields = [
             'id', 'user', 'name', 'address', 'residence_type', 'room_price', 'rooms_include', 'description',
-            'cover_image', 'rooms_available', 'number_of_rooms_available', 'room_available_date', 'last_updated',
-            'business_contacts', 'business_email', 'images', 'videos'
+            'cover_image', 'cover_image_variants', 'rooms_available', 'number_of_rooms_available', 'room_available_date', 'last_updated',
+            'business_contacts', 'business_email', 'latitude', 'longitude', 'images', 'videos'
         ]
+
+    def validate(self, attrs):
+        location = [attrs.get(name, getattr(self.instance, name, None)) for name in ('latitude', 'longitude')]
+        if location.count(None) == 1:
+            raise serializers.ValidationError('Provide both latitude and longitude, or neither.')
+        return attrs
+
+class VideoUploadSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    class Meta:
+        model = VideoUpload
+        fields = ['id', 'residence', 'filename', 'length', 'offset', 'status', 'video', 'created_at', 'updated_at']
+        read_only_fields = ['offset', 'status', 'video', 'created_at', 'updated_at']
@@ -0,0 +1,139 @@
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import evict_residence
+from .metrics import record_query
+from .models import CustomUser, Plan, Residence, Image, Video
+from .quotas import evict_plans
+from .authentication import forget_token, forget_user
+from rest_framework.authtoken.models import Token
+from .blobs import delete_files, release_blob
+from .changes import record_deletion
+from .thumbnails import delete_variants, needs_variants, schedule_variants
+from .transcoding import delete_directory, hls_prefix, schedule_transcode
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    # Every connection, including the async ORM's worker threads, reports
+    # queries to the current request's metrics.
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def schedule_eviction(residence_id):
+    # Evict after commit so a concurrent read can't re-cache the old rows.
+    transaction.on_commit(partial(evict_residence, residence_id))
+
+
+@receiver([post_save, post_delete], sender=Residence)
+def residence_changed(sender, instance, **kwargs):
+    schedule_eviction(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Image)
+@receiver([post_save, post_delete], sender=Video)
+def media_changed(sender, instance, **kwargs):
+    schedule_eviction(instance.residence_id)
+
+
+@receiver(post_save, sender=Residence)
+@receiver(post_save, sender=Image)
+@receiver(post_save, sender=CustomUser)
+def image_saved(sender, instance, raw=False, **kwargs):
+    if not raw and needs_variants(instance):
+        schedule_variants(instance)
+
+
+@receiver(post_save, sender=Video)
+def video_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw and instance.video and settings.VIDEO_TRANSCODE_ENABLED:
+        schedule_transcode(instance)
+
+
+@receiver(post_save, sender=Residence)
+def residence_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        CustomUser.objects.filter(pk=instance.user_id).update(residence_count=F('residence_count') + 1)
+        forget_user(instance.user_id)
+
+
+@receiver(post_delete, sender=Residence)
+def residence_deleted(sender, instance, **kwargs):
+    CustomUser.objects.filter(pk=instance.user_id, residence_count__gt=0).update(residence_count=F('residence_count') - 1)
+    forget_user(instance.user_id)
+    record_deletion(instance.pk)
+
+
+MEDIA_COUNTERS = {Image: 'image_count', Video: 'video_count'}
+
+
+@receiver(post_save, sender=Image)
+@receiver(post_save, sender=Video)
+def media_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        field = MEDIA_COUNTERS[sender]
+        Residence.objects.filter(pk=instance.residence_id).update(**{field: F(field) + 1})
+
+
+@receiver(post_delete, sender=Image)
+@receiver(post_delete, sender=Video)
+def media_deleted(sender, instance, **kwargs):
+    field = MEDIA_COUNTERS[sender]
+    Residence.objects.filter(pk=instance.residence_id, **{f'{field}__gt': 0}).update(**{field: F(field) - 1})
+
+
+def delete_media(storage, names, variants, hls):
+    delete_files(storage, names)
+    delete_variants(storage, variants)
+    if hls:
+        delete_directory(storage, hls)
+
+
+@receiver(post_delete, sender=Image)
+@receiver(post_delete, sender=Video)
+def media_file_deleted(sender, instance, **kwargs):
+    # Covers every way rows go, including a residence's cascade: the shared
+    # file (and its variants) goes with its last reference, while the
+    # poster and HLS ladder always belong to this row alone.
+    field_file = instance.image if sender is Image else instance.video
+    names, variants, hls = [], {}, None
+    if field_file.name and release_blob(field_file.name):
+        names.append(field_file.name)
+        variants = getattr(instance, 'variants', {})
+    if sender is Video:
+        if instance.poster:
+            names.append(instance.poster.name)
+        hls = hls_prefix(instance)
+    transaction.on_commit(partial(delete_media, field_file.storage, names, variants, hls))
+
+
+@receiver(post_delete, sender=Residence)
+def cover_file_deleted(sender, instance, **kwargs):
+    # Covers aren't content-addressed, but seeded residences share one file;
+    # keep it while another residence still points at it.
+    cover = instance.cover_image
+    if not cover.name or Residence.objects.filter(cover_image=cover.name).exists():
+        return
+    transaction.on_commit(partial(delete_media, cover.storage, [cover.name], instance.cover_image_variants, None))
+
+
+@receiver([post_save, post_delete], sender=Plan)
+def plan_changed(sender, **kwargs):
+    evict_plans()
+
+
+@receiver([post_save, post_delete], sender=CustomUser)
+def user_changed(sender, instance, **kwargs):
+    forget_user(instance.pk)
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    forget_token(instance.key)
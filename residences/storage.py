@@ -0,0 +1,123 @@
+import os
+import sys
+import uuid
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.http import HttpResponseRedirect
+
+from .metrics import record_storage
+
+
+class CountingFile(File):
+    def read(self, *args, **kwargs):
+        data = super().read(*args, **kwargs)
+        record_storage(read=len(data))
+        return data
+
+
+class InstrumentedStorageMixin:
+    """Counts bytes read and written through a storage backend into the request's metrics."""
+
+    def _open(self, name, mode='rb'):
+        file = super()._open(name, mode)
+        return CountingFile(file, name=file.name)
+
+    def _save(self, name, content):
+        name = super()._save(name, content)
+        record_storage(written=content.size)
+        return name
+
+
+class InstrumentedFileSystemStorage(InstrumentedStorageMixin, FileSystemStorage):
+    pass
+
+
+def is_s3(storage):
+    # The S3 backend (and boto3) is only imported when MEDIA_STORAGE=s3 configures it,
+    # so a storage can't be one unless the module is loaded.
+    s3 = sys.modules.get('storages.backends.s3')
+    return s3 is not None and isinstance(storage, s3.S3Storage)
+
+
+def local_path(storage, name):
+    """Filesystem path of ``name``, or None when the storage is remote."""
+    try:
+        return storage.path(name)
+    except NotImplementedError:
+        return None
+
+
+def walk_storage(storage, prefix, after=''):
+    """
+    Yield ``(name, size, modified)`` for every file under ``prefix``, in name order.
+
+    Only names after ``after`` are listed, so a walk can resume where an
+    earlier one stopped. Local directories are read one at a time and S3 is
+    paged through, so memory doesn't grow with the number of files.
+    """
+    if is_s3(storage):
+        location = storage.location.strip('/')
+        offset = len(location) + 1 if location else 0
+        objects = storage.bucket.objects.filter(
+            Prefix=storage._normalize_name(prefix),
+            Marker=storage._normalize_name(after) if after > prefix else '',
+        )
+        for summary in objects:
+            yield summary.key[offset:], summary.size, summary.last_modified
+        return
+
+    try:
+        entries = list(os.scandir(storage.path(prefix)))
+    except FileNotFoundError:
+        return
+    # A directory sorts as its name plus '/', where its files fall in a flat listing.
+    entries.sort(key=lambda entry: entry.name + '/' if entry.is_dir() else entry.name)
+    for entry in entries:
+        if entry.is_dir():
+            path = f'{prefix}{entry.name}/'
+            if path < after and not after.startswith(path):
+                continue
+            yield from walk_storage(storage, path, after)
+        else:
+            name = prefix + entry.name
+            if name > after:
+                stat = entry.stat()
+                yield name, stat.st_size, datetime.fromtimestamp(stat.st_mtime, timezone.utc)
+
+
+def storage_redirect(storage, name):
+    # Remote storage serves ranges itself; the (possibly signed) URL must not be cached.
+    response = HttpResponseRedirect(storage.url(name))
+    response['Cache-Control'] = 'no-store'
+    return response
+
+
+def direct_upload_key(field, user, filename):
+    """Storage key a user may upload ``field`` content to directly."""
+    extension = os.path.splitext(filename)[1].lower()[:10]
+    return f'{field.upload_to}direct/{user.pk}/{uuid.uuid4().hex}{extension}'
+
+
+def owns_direct_upload(field, user, key):
+    return key.startswith(f'{field.upload_to}direct/{user.pk}/') and '..' not in key
+
+
+def presigned_upload(storage, key, content_type, max_bytes):
+    """
+    Presigned POST letting a client upload ``key`` straight to the bucket.
+
+    Returns None when the storage backend can't issue one (local disk).
+    """
+    if not is_s3(storage):
+        return None
+    client = storage.bucket.meta.client
+    return client.generate_presigned_post(
+        Bucket=storage.bucket_name,
+        Key=storage._normalize_name(key),
+        Fields={'Content-Type': content_type},
+        Conditions=[{'Content-Type': content_type}, ['content-length-range', 1, max_bytes]],
+        ExpiresIn=settings.DIRECT_UPLOAD_EXPIRE,
+    )
@@ -0,0 +1,274 @@
+import asyncio
+import io
+import itertools
+import mimetypes
+import os
+import re
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+from .metrics import record_storage
+
+RANGE_RE = re.compile(r'^\s*(\d*)\s*-\s*(\d*)\s*$')
+MAX_RANGES = 16
+BLOCK_SIZE = 64 * 1024
+
+
+class RangeFile:
+    """
+    File wrapper that exposes a single byte range of an open file.
+
+    Reads stop at the end of the range, while ``fileno()`` still points at the
+    real file so servers with ``wsgi.file_wrapper`` support (gunicorn) can hand
+    the range to ``os.sendfile`` without copying it through Python.
+    """
+
+    def __init__(self, file, start, length):
+        self._file = file
+        self._start = start
+        self._end = start + length
+        self.name = file.name
+        file.seek(start)
+
+    def read(self, size=-1):
+        remaining = self._end - self._file.tell()
+        if remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        return self._file.read(size)
+
+    def tell(self):
+        return self._file.tell() - self._start
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            position = self._start + offset
+        elif whence == io.SEEK_CUR:
+            position = self._file.tell() + offset
+        else:
+            position = self._end + offset
+        self._file.seek(position)
+        return self.tell()
+
+    def seekable(self):
+        return True
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def close(self):
+        self._file.close()
+
+
+def parse_range_header(header, size):
+    """
+    Parse a ``Range: bytes=...`` header against a file of ``size`` bytes.
+
+    Returns ``None`` when the header should be ignored (missing, malformed or
+    not a byte range), an empty list when no range is satisfiable, or a sorted
+    list of coalesced ``(start, end)`` pairs with inclusive ends.
+    """
+    if not header:
+        return None
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or not spec:
+        return None
+
+    ranges = []
+    for part in spec.split(','):
+        match = RANGE_RE.match(part)
+        if not match:
+            return None
+        first, last = match.groups()
+        if not first and not last:
+            return None
+        if not first:
+            # Suffix range: the final N bytes.
+            suffix = int(last)
+            if suffix == 0:
+                continue
+            start, end = max(size - suffix, 0), size - 1
+        else:
+            start = int(first)
+            end = int(last) if last else size - 1
+            if last and end < start:
+                return None
+            if start >= size:
+                continue
+            end = min(end, size - 1)
+        ranges.append((start, end))
+
+    if len(ranges) > MAX_RANGES:
+        return None
+
+    ranges.sort()
+    coalesced = []
+    for start, end in ranges:
+        if coalesced and start <= coalesced[-1][1] + 1:
+            coalesced[-1] = (coalesced[-1][0], max(coalesced[-1][1], end))
+        else:
+            coalesced.append((start, end))
+    return coalesced
+
+
+def file_etag(stat):
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def if_range_passes(request, etag, last_modified):
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"'):
+        # Only strong validators may be used with If-Range.
+        return if_range == etag
+    if_range_date = parse_http_date_safe(if_range)
+    return if_range_date is not None and if_range_date == last_modified
+
+
+def offload_response(path, name, content_type):
+    backend = settings.VIDEO_SENDFILE_BACKEND
+    response = HttpResponse(content_type=content_type)
+    if backend == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = settings.VIDEO_ACCEL_REDIRECT_PREFIX.rstrip('/') + '/' + name.lstrip('/')
+    elif backend == 'x-sendfile':
+        response['X-Sendfile'] = path
+    else:
+        raise ValueError(f'Unknown VIDEO_SENDFILE_BACKEND: {backend!r}')
+    return response
+
+
+def multipart_stream(path, ranges, headers, closing):
+    with open(path, 'rb') as f:
+        for (start, end), header in zip(ranges, headers):
+            yield header
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(BLOCK_SIZE, remaining))
+                if not chunk:
+                    return
+                remaining -= len(chunk)
+                yield chunk
+        yield closing
+
+
+async def aread_range(path, start, length):
+    # Blocking file calls run in the default executor so the event loop keeps
+    # serving other streams while this one waits on the disk.
+    f = await asyncio.to_thread(open, path, 'rb')
+    try:
+        await asyncio.to_thread(f.seek, start)
+        remaining = length
+        while remaining > 0:
+            chunk = await asyncio.to_thread(f.read, min(BLOCK_SIZE, remaining))
+            if not chunk:
+                return
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+async def amultipart_stream(path, ranges, headers, closing):
+    for (start, end), header in zip(ranges, headers):
+        yield header
+        async for chunk in aread_range(path, start, end - start + 1):
+            yield chunk
+    yield closing
+
+
+async def aiter_sync(iterator, batch_size=64):
+    # Under ASGI Django buffers synchronous iterators in full; pull this one in
+    # batches on the sync thread (where its DB cursor lives) instead.
+    iterator = iter(iterator)
+    while True:
+        batch = await sync_to_async(lambda: list(itertools.islice(iterator, batch_size)))()
+        if not batch:
+            return
+        for item in batch:
+            yield item
+
+
+def streaming_body(iterator):
+    return aiter_sync(iterator) if settings.SERVER_MODE == 'asgi' else iterator
+
+
+def range_response(path, start, length, asynchronous, **kwargs):
+    if not asynchronous:
+        return FileResponse(RangeFile(open(path, 'rb'), start, length), **kwargs)
+    # Under ASGI, Django buffers synchronous iterators in full before sending
+    # them, so stream from an async generator instead.
+    response = StreamingHttpResponse(aread_range(path, start, length), **kwargs)
+    response['Content-Length'] = length
+    return response
+
+
+def serve_file(request, path, name=None, content_type=None, asynchronous=False):
+    """
+    Serve ``path`` with byte-range, ETag and Last-Modified support.
+
+    ``name`` is the storage-relative name used to build X-Accel-Redirect
+    locations when ``VIDEO_SENDFILE_BACKEND`` offloads the transfer. Async views
+    pass ``asynchronous=True`` to get a body that streams without blocking the
+    event loop.
+    """
+    stat = os.stat(path)
+    size = stat.st_size
+    etag = file_etag(stat)
+    last_modified = int(stat.st_mtime)
+    content_type = content_type or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    filename = os.path.basename(path)
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    if settings.VIDEO_SENDFILE_BACKEND:
+        # The front-end server handles ranges and conditionals itself.
+        response = offload_response(path, name or filename, content_type)
+    else:
+        ranges = None
+        if request.method in ('GET', 'HEAD') and if_range_passes(request, etag, last_modified):
+            ranges = parse_range_header(request.META.get('HTTP_RANGE'), size)
+
+        if ranges == []:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+        elif ranges is None:
+            response = range_response(path, 0, size, asynchronous, content_type=content_type)
+        elif len(ranges) == 1:
+            start, end = ranges[0]
+            response = range_response(path, start, end - start + 1, asynchronous,
+                                      status=206, content_type=content_type)
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        else:
+            boundary = uuid.uuid4().hex
+            headers = [
+                (f'\r\n--{boundary}\r\nContent-Type: {content_type}\r\n'
+                 f'Content-Range: bytes {start}-{end}/{size}\r\n\r\n').encode('ascii')
+                for start, end in ranges
+            ]
+            closing = f'\r\n--{boundary}--'.encode('ascii')
+            length = sum(len(h) for h in headers) + sum(end - start + 1 for start, end in ranges) + len(closing)
+            stream = amultipart_stream if asynchronous else multipart_stream
+            response = StreamingHttpResponse(stream(path, ranges, headers, closing), status=206,
+                                             content_type=f'multipart/byteranges; boundary={boundary}')
+            response['Content-Length'] = length
+
+        if request.method != 'HEAD' and response.has_header('Content-Length'):
+            record_storage(read=int(response['Content-Length']))
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Content-Disposition'] = f'inline; filename="{filename}"'
+    return response
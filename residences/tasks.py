@@ -0,0 +1,38 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.db import close_old_connections, transaction
+
+_executors = {}
+
+
+def get_executor(name, max_workers):
+    if name not in _executors:
+        _executors[name] = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+    return _executors[name]
+
+
+def run_in_background(job):
+    try:
+        job()
+    finally:
+        # Worker threads hold their own DB connections; don't leak them between jobs.
+        close_old_connections()
+
+
+def run_after_commit(name, job, max_workers, run_async=True):
+    """
+    Run ``job`` once the current transaction commits, on the ``name`` thread
+    pool when ``run_async`` is set, otherwise inline.
+    """
+    if run_async:
+        transaction.on_commit(partial(get_executor(name, max_workers).submit, run_in_background, job))
+    else:
+        transaction.on_commit(job)
+
+
+def wait_for_background_jobs():
+    """Block until every queued background job has finished (used by benchmarks before teardown)."""
+    while _executors:
+        _, executor = _executors.popitem()
+        executor.shutdown(wait=True)
@@ -1,6 +1,216 @@
-from django.test import TestCase
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 
-# Create your tests here.
-from django.core.management.utils import get_random_secret_key
+from asgiref.sync import async_to_sync
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections
+from django.test import AsyncRequestFactory, TestCase, TransactionTestCase, override_settings
+from rest_framework.authtoken.models import Token
 
-print(get_random_secret_key())
\ No newline at end of file
+from .cache import get_cache
+from .models import CustomUser, Residence, Video
+from .references import ReferenceNumbersExhausted, generation_size, permute, reference_for
+from .seed import seed_residences
+from .views import get_user_details_async
+
+# Queries each endpoint may issue, whatever the catalogue size, with a cold
+# cache and then with the response cache warm.
+QUERY_BUDGETS = {
+    'residence-list': (3, 0),
+    'residence-detail': (3, 0),
+    'residence-list-sparse': (1, 1),
+    'owner-dashboard': (3, 1),
+}
+
+
+class QueryBudgetTests(TestCase):
+    def test_query_budgets(self):
+        seeded = 0
+        for size in (10, 100, 1000):
+            residences = seed_residences(size - seeded)
+            seeded = size
+            urls = {
+                'residence-list': '/api/residences/',
+                'residence-detail': f'/api/residences/{residences[0].pk}/',
+                'residence-list-sparse': '/api/residences/?fields=id,name,cover_image,room_price',
+                'owner-dashboard': '/api/user/me/dashboard/',
+            }
+            token = Token.objects.get_or_create(user=residences[0].user)[0]
+            headers = {'owner-dashboard': {'HTTP_AUTHORIZATION': f'Token {token.key}'}}
+            for endpoint, url in urls.items():
+                # Each endpoint starts cold: seeding uses bulk_create, which
+                # bypasses invalidation, and the list fills the payloads the
+                # detail view reads.
+                get_cache().clear()
+                for phase, budget in zip(('cold', 'warm'), QUERY_BUDGETS[endpoint]):
+                    with self.subTest(endpoint=endpoint, phase=phase, size=size), self.assertNumQueries(budget):
+                        response = self.client.get(url, **headers.get(endpoint, {}))
+                        self.assertEqual(response.status_code, 200)
+
+
+class ReferenceNumberTests(TestCase):
+    def test_permute_is_a_bijection(self):
+        for domain in (1, 7, 100, 1000):
+            values = [permute(value, domain, b'key') for value in range(domain)]
+            self.assertEqual(sorted(values), list(range(domain)))
+
+    def test_generations(self):
+        first, last = reference_for(0), reference_for(generation_size(2) - 1)
+        self.assertRegex(first, r'^[A-Z]{2}\d{4}$')
+        self.assertRegex(last, r'^[A-Z]{2}\d{4}$')
+        self.assertRegex(reference_for(generation_size(2)), r'^[A-Z]{3}\d{4}$')
+
+    def test_mapping_survives_a_secret_key_change(self):
+        codes = [reference_for(value) for value in (0, 1, generation_size(2))]
+        with override_settings(SECRET_KEY='rotated'):
+            self.assertEqual([reference_for(value) for value in (0, 1, generation_size(2))], codes)
+
+    @override_settings(REFERENCE_NUMBER_MAX_LETTERS=2)
+    def test_exhausted(self):
+        with self.assertRaises(ReferenceNumbersExhausted):
+            reference_for(generation_size(2))
+
+    def test_users_get_distinct_numbers(self):
+        users = [CustomUser.objects.create_user(username=f'user-{index}') for index in range(50)]
+        codes = [user.reference_number for user in users]
+        self.assertNotIn(None, codes)
+        self.assertEqual(len(set(codes)), len(codes))
+
+
+class ReferenceAllocatorConcurrencyTests(TransactionTestCase):
+    workers = 16
+    registrations = 200
+
+    def test_concurrent_registrations_get_unique_numbers(self):
+        prefix = uuid.uuid4().hex[:8]
+        start = threading.Barrier(self.workers)
+
+        def register(index):
+            try:
+                if index < self.workers:
+                    start.wait()
+                return CustomUser.objects.create_user(username=f'{prefix}-{index}', password=None).reference_number
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            codes = list(pool.map(register, range(self.registrations)))
+
+        stored = CustomUser.objects.filter(username__startswith=prefix).values_list('reference_number', flat=True)
+        self.assertNotIn(None, codes)
+        self.assertEqual(len(set(codes)), self.registrations)
+        self.assertCountEqual(codes, stored)
+
+
+class ResidenceFilterTests(TestCase):
+    def test_non_finite_prices_are_rejected(self):
+        for name in ('min_price', 'max_price'):
+            for value in ('NaN', 'sNaN', 'Infinity', '-Infinity'):
+                with self.subTest(name=name, value=value):
+                    response = self.client.get('/api/residences/', {name: value})
+                    self.assertEqual(response.status_code, 400)
+                    self.assertIn(name, response.json())
+
+
+class TemporaryMediaMixin:
+    """Media files go to a directory deleted after each test."""
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+        self.user = CustomUser.objects.create_user(username='owner')
+
+    def residence(self, cover=None):
+        return Residence.objects.create(
+            user=self.user, name='Residence', address='1 Main Road', residence_type='standard',
+            room_price=2500, cover_image=cover,
+        )
+
+
+class ResidenceFileCleanupTests(TemporaryMediaMixin, TestCase):
+
+    def test_deleting_a_residence_removes_its_cover(self):
+        cover = default_storage.save('residence_images/cover.jpg', ContentFile(b'cover'))
+        variants = {'thumb': {'webp': default_storage.save('variants/thumb.webp', ContentFile(b'webp')),
+                              'jpeg': default_storage.save('variants/thumb.jpg', ContentFile(b'jpeg'))}}
+        residence = self.residence(cover)
+        Residence.objects.filter(pk=residence.pk).update(cover_image_variants=variants)
+        residence.refresh_from_db()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            residence.delete()
+
+        for name in [cover, *variants['thumb'].values()]:
+            self.assertFalse(default_storage.exists(name), name)
+
+    def test_shared_cover_outlives_one_residence(self):
+        cover = default_storage.save('residence_images/shared.jpg', ContentFile(b'cover'))
+        first, second = self.residence(cover), self.residence(cover)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(default_storage.exists(cover))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(default_storage.exists(cover))
+
+
+@override_settings(VIDEO_TRANSCODE_ENABLED=False, VIDEO_SENDFILE_BACKEND=None)
+class VideoStreamTests(TemporaryMediaMixin, TestCase):
+    def test_head_reports_length_and_ranges(self):
+        name = default_storage.save('residence_videos/tour.mp4', ContentFile(b'x' * 1000))
+        video = Video.objects.create(residence=self.residence(), video=name)
+
+        for headers, code, length in (({}, 200, '1000'), ({'Range': 'bytes=0-99'}, 206, '100')):
+            with self.subTest(headers=headers):
+                response = self.client.head(f'/api/stream_video/{video.pk}/', headers=headers)
+                self.assertEqual(response.status_code, code)
+                self.assertEqual(response['Accept-Ranges'], 'bytes')
+                self.assertEqual(response['Content-Length'], length)
+                self.assertEqual(b''.join(response), b'')
+
+
+class UserDetailsTests(TestCase):
+    def test_async_view_matches_sync_view(self):
+        token = Token.objects.create(user=CustomUser.objects.create_user(username='owner'))
+        for headers in (
+            {'Authorization': f'Token {token.key}'},
+            {'Authorization': f'Token {token.key}', 'Accept': 'application/msgpack'},
+            {},
+            {'Authorization': 'Token invalid'},
+        ):
+            with self.subTest(headers=headers):
+                expected = self.client.get('/api/user/me/', headers=headers)
+                request = AsyncRequestFactory().get('/api/user/me/', headers=headers)
+                response = async_to_sync(get_user_details_async)(request)
+                self.assertEqual(response.status_code, expected.status_code)
+                self.assertEqual(response['Content-Type'], expected['Content-Type'])
+                self.assertEqual(response.content, expected.content)
+
+
+class MetricsAccessTests(TestCase):
+    def test_anonymous_requests_are_refused(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Bearer')
+
+    @override_settings(METRICS_TOKEN='scrape-token')
+    def test_bearer_token(self):
+        self.assertEqual(self.client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code, 401)
+        self.assertEqual(self.client.get('/metrics', headers={'Authorization': 'Bearer scrape-token'}).status_code, 200)
+
+    def test_staff_session(self):
+        user = CustomUser.objects.create_user(username='member')
+        self.client.force_login(user)
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        CustomUser.objects.filter(pk=user.pk).update(is_staff=True)
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    @override_settings(METRICS_PUBLIC=True)
+    def test_public_opt_in(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
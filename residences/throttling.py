@@ -0,0 +1,113 @@
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+from .cache import get_cache
+
+_hashing_slots = {}
+_hashing_slots_lock = threading.Lock()
+
+
+class CacheRateThrottle(SimpleRateThrottle):
+    """
+    Fixed-window rate limit counted with ``add``/``incr`` in the residence cache.
+
+    Unlike SimpleRateThrottle's read-modify-write request history, the
+    increment is atomic on shared backends (Redis, memcached), so a burst
+    spread across workers can't slip past the limit.
+    """
+
+    @property
+    def cache(self):
+        return get_cache()
+
+    def get_rate(self):
+        # Read at request time so rate changes in settings apply.
+        return api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        key = self.get_cache_key(request, view)
+        if key is None:
+            return True
+
+        self.now = time.time()
+        window = int(self.now // self.duration)
+        self.key = f'{key}:{window}'
+        self.cache.add(self.key, 0, self.duration)
+        try:
+            count = self.cache.incr(self.key)
+        except ValueError:
+            # Expired between add and incr.
+            self.cache.add(self.key, 1, self.duration)
+            count = 1
+        self.window_end = (window + 1) * self.duration
+        return count <= self.num_requests
+
+    def wait(self):
+        return self.window_end - self.now
+
+
+class AuthIPThrottle(CacheRateThrottle):
+    scope = 'auth-ip'
+
+    def get_cache_key(self, request, view):
+        return f'residences:throttle:{self.scope}:{self.get_ident(request)}'
+
+
+class AuthUsernameThrottle(CacheRateThrottle):
+    scope = 'auth-username'
+
+    def get_cache_key(self, request, view):
+        username = request.data.get('username')
+        if not isinstance(username, str) or not username:
+            return None
+        digest = hashlib.sha256(username.casefold().encode()).hexdigest()
+        return f'residences:throttle:{self.scope}:{digest}'
+
+
+class HashingBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many sign-ins in progress, try again shortly.'
+    default_code = 'hashing_busy'
+    wait = 1
+
+
+def hashing_slots(limit):
+    # One semaphore per limit, so a changed setting (tests, benchmarks) takes effect.
+    with _hashing_slots_lock:
+        if limit not in _hashing_slots:
+            _hashing_slots[limit] = threading.BoundedSemaphore(limit)
+        return _hashing_slots[limit]
+
+
+@contextmanager
+def hashing_slot():
+    """
+    Hold one of this process's HASHING_CONCURRENCY password-hashing slots for the block.
+
+    The limit is per process, so it bounds the CPU a worker's threads spend
+    hashing without capping sign-ins fleet-wide: capacity grows with workers
+    and instances. Waits up to HASHING_WAIT_TIMEOUT seconds for a free slot,
+    then raises HashingBusy.
+    """
+    limit = settings.HASHING_CONCURRENCY
+    if not limit:
+        yield
+        return
+
+    slots = hashing_slots(limit)
+    if not slots.acquire(timeout=settings.HASHING_WAIT_TIMEOUT):
+        raise HashingBusy()
+    try:
+        yield
+    finally:
+        slots.release()
@@ -0,0 +1,102 @@
+import io
+import logging
+import os
+from functools import partial
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image as PILImage, ImageOps
+
+from .tasks import run_after_commit
+
+logger = logging.getLogger(__name__)
+
+# Longest edge in pixels for each variant; images are never upscaled.
+VARIANT_SIZES = {
+    'thumb': 160,
+    'card': 640,
+    'full': 1600,
+}
+
+# (model label, source image field, JSON field holding the variants)
+VARIANT_FIELDS = {
+    'residences.Residence': ('cover_image', 'cover_image_variants'),
+    'residences.Image': ('image', 'variants'),
+    'residences.CustomUser': ('profile_image', 'profile_image_variants'),
+}
+
+
+def encode(image, fmt):
+    buf = io.BytesIO()
+    if fmt == 'jpeg':
+        image.save(buf, 'JPEG', quality=82, optimize=True, progressive=True)
+    else:
+        image.save(buf, 'WEBP', quality=80, method=4)
+    return buf.getvalue()
+
+
+def generate_variants(field_file):
+    """
+    Render every size in VARIANT_SIZES as WebP and progressive JPEG.
+
+    Orientation is applied from EXIF before encoding and no metadata is
+    written to the variants. Returns the JSON stored on the model.
+    """
+    storage = field_file.storage
+    stem = os.path.splitext(os.path.basename(field_file.name))[0]
+    with field_file.open('rb') as f:
+        source = PILImage.open(f)
+        # Let the JPEG decoder downscale while reading instead of decoding full size.
+        source.draft('RGB', (max(VARIANT_SIZES.values()),) * 2)
+        source = ImageOps.exif_transpose(source).convert('RGB')
+
+    variants = {'source': field_file.name}
+    for name, edge in VARIANT_SIZES.items():
+        image = source.copy()
+        image.thumbnail((edge, edge), PILImage.LANCZOS)
+        variant = {'width': image.width, 'height': image.height}
+        for fmt in ('webp', 'jpeg'):
+            path = f'variants/{stem}-{name}.{"jpg" if fmt == "jpeg" else fmt}'
+            variant[fmt] = storage.save(path, ContentFile(encode(image, fmt)))
+        variants[name] = variant
+    return variants
+
+
+def delete_variants(storage, variants):
+    for name in VARIANT_SIZES:
+        for fmt in ('webp', 'jpeg'):
+            path = variants.get(name, {}).get(fmt)
+            if path:
+                storage.delete(path)
+
+
+def process(label, pk):
+    source_field, variants_field = VARIANT_FIELDS[label]
+    try:
+        instance = apps.get_model(label).objects.filter(pk=pk).first()
+        if instance is None:
+            return
+        field_file = getattr(instance, source_field)
+        old = getattr(instance, variants_field) or {}
+        variants = generate_variants(field_file) if field_file else {}
+        setattr(instance, variants_field, variants)
+        # Saving through the model fires post_save, which evicts cached payloads.
+        instance.save(update_fields=[variants_field])
+        delete_variants(field_file.storage, old)
+    except Exception:
+        logger.exception('Failed to build image variants for %s %s', label, pk)
+
+
+def needs_variants(instance):
+    source_field, variants_field = VARIANT_FIELDS[instance._meta.label]
+    field_file = getattr(instance, source_field)
+    variants = getattr(instance, variants_field) or {}
+    return (field_file.name or None) != variants.get('source')
+
+
+def schedule_variants(instance):
+    # Pillow releases the GIL while decoding, resizing and encoding, so a small
+    # thread pool keeps the work off the request thread without extra processes.
+    run_after_commit('variants', partial(process, instance._meta.label, instance.pk),
+                     settings.IMAGE_VARIANTS_WORKERS, settings.IMAGE_VARIANTS_ASYNC)
@@ -0,0 +1,206 @@
+import json
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from functools import partial
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import evict_residence, get_cache, residence_key
+from .models import Video
+from .storage import local_path
+from .tasks import run_after_commit
+
+logger = logging.getLogger(__name__)
+
+# (name, height, video bitrate, audio bitrate) from lowest to highest.
+HLS_LADDER = [
+    ('360p', 360, 800_000, 96_000),
+    ('720p', 720, 2_800_000, 128_000),
+]
+SEGMENT_SECONDS = 6
+PROGRESS_INTERVAL = 2.0
+
+
+def hls_prefix(video):
+    return f'hls/{video.pk}/'
+
+
+def local_source(field_file, work_dir):
+    # ffmpeg needs a local file; download it first when storage is remote.
+    path = local_path(field_file.storage, field_file.name)
+    if path is not None:
+        return path
+    path = os.path.join(work_dir, 'source' + os.path.splitext(field_file.name)[1])
+    with field_file.storage.open(field_file.name, 'rb') as src, open(path, 'wb') as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+    return path
+
+
+def delete_hls(storage, video):
+    delete_directory(storage, hls_prefix(video))
+
+
+def delete_directory(storage, prefix):
+    try:
+        _, files = storage.listdir(prefix)
+    except FileNotFoundError:
+        return
+    for filename in files:
+        storage.delete(prefix + filename)
+
+
+def publish_hls(storage, video, out_dir):
+    """Copy the playlists and segments into storage, replacing any earlier ladder."""
+    prefix = hls_prefix(video)
+    delete_hls(storage, video)
+    for filename in sorted(os.listdir(out_dir)):
+        with open(os.path.join(out_dir, filename), 'rb') as f:
+            storage.save(prefix + filename, File(f))
+    return prefix + 'master.m3u8'
+
+
+def set_transcode_status(video, **fields):
+    """
+    Write transcode fields with a plain UPDATE (so the post_save handlers
+    don't run again) and evict the residence's cached payloads once it commits.
+    """
+    Video.objects.filter(pk=video.pk).update(transcode_updated_at=timezone.now(), **fields)
+    transaction.on_commit(partial(evict_residence, video.residence_id))
+
+
+def probe(path):
+    output = subprocess.run(
+        [settings.FFPROBE_BINARY, '-v', 'error', '-select_streams', 'v:0',
+         '-show_entries', 'stream=width,height:format=duration', '-of', 'json', path],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    info = json.loads(output)
+    stream = info['streams'][0]
+    return stream['width'], stream['height'], float(info['format'].get('duration') or 0)
+
+
+def ladder_for(height):
+    # Never upscale, but always produce at least the lowest rung.
+    rungs = [rung for rung in HLS_LADDER if rung[1] <= height]
+    return rungs or HLS_LADDER[:1]
+
+
+def run_ffmpeg(args, on_progress):
+    """
+    Run ffmpeg with ``-progress`` output and report encoded seconds as it goes.
+    """
+    process = subprocess.Popen(
+        [settings.FFMPEG_BINARY, '-y', '-nostats', '-loglevel', 'error', '-progress', 'pipe:1', *args],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+    )
+    for line in process.stdout:
+        key, _, value = line.strip().partition('=')
+        if key == 'out_time_us' and value.isdigit():
+            on_progress(int(value) / 1_000_000)
+    stderr = process.stderr.read()
+    if process.wait() != 0:
+        raise RuntimeError(f'ffmpeg exited with {process.returncode}: {stderr.strip()}')
+
+
+def encode_rendition(source, out_dir, name, width, height, video_bitrate, audio_bitrate, on_progress):
+    run_ffmpeg([
+        '-i', source,
+        '-map', '0:v:0', '-map', '0:a:0?',
+        '-vf', f'scale={width}:{height},format=yuv420p',
+        '-c:v', 'libx264', '-preset', 'veryfast', '-profile:v', 'main',
+        '-b:v', str(video_bitrate), '-maxrate', str(int(video_bitrate * 1.07)), '-bufsize', str(video_bitrate * 2),
+        '-g', str(SEGMENT_SECONDS * 30), '-sc_threshold', '0',
+        '-c:a', 'aac', '-b:a', str(audio_bitrate), '-ac', '2',
+        '-f', 'hls', '-hls_time', str(SEGMENT_SECONDS), '-hls_playlist_type', 'vod',
+        '-hls_segment_filename', os.path.join(out_dir, f'{name}_%03d.ts'),
+        os.path.join(out_dir, f'{name}.m3u8'),
+    ], on_progress)
+
+
+def extract_poster(source, duration, work_dir):
+    path = os.path.join(work_dir, 'poster.jpg')
+    run_ffmpeg(['-ss', str(min(1.0, duration / 2)), '-i', source, '-frames:v', '1', '-q:v', '3', path], lambda _: None)
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def write_master_playlist(out_dir, renditions):
+    lines = ['#EXTM3U', '#EXT-X-VERSION:3']
+    for name, width, height, video_bitrate, audio_bitrate in renditions:
+        lines.append(f'#EXT-X-STREAM-INF:BANDWIDTH={video_bitrate + audio_bitrate},RESOLUTION={width}x{height}')
+        lines.append(f'{name}.m3u8')
+    with open(os.path.join(out_dir, 'master.m3u8'), 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def transcode(video_id):
+    """
+    Build the HLS ladder and poster frame for one video, tracking progress on the row.
+
+    Encoding happens in a scratch directory; the results are then saved
+    through the video's storage, so this works with local disk or a bucket.
+    """
+    video = Video.objects.filter(pk=video_id).first()
+    if video is None or not video.video:
+        return
+    set_transcode_status(video, transcode_status='processing', transcode_progress=0)
+    storage = video.video.storage
+    work_dir = tempfile.mkdtemp(prefix='transcode-')
+    out_dir = os.path.join(work_dir, 'hls')
+    try:
+        source = local_source(video.video, work_dir)
+        src_width, src_height, duration = probe(source)
+        renditions = []
+        for name, height, video_bitrate, audio_bitrate in ladder_for(src_height):
+            width = round(src_width * height / src_height / 2) * 2
+            renditions.append((name, width, height, video_bitrate, audio_bitrate))
+
+        os.makedirs(out_dir)
+        total = max(duration, 0.001) * len(renditions)
+        last_report = [0.0]
+
+        for index, (name, width, height, video_bitrate, audio_bitrate) in enumerate(renditions):
+            def on_progress(seconds, done=index * duration):
+                now = time.monotonic()
+                if now - last_report[0] >= PROGRESS_INTERVAL:
+                    last_report[0] = now
+                    percent = min(99, int((done + seconds) * 100 / total))
+                    Video.objects.filter(pk=video_id).update(transcode_progress=percent, transcode_updated_at=timezone.now())
+                    # Refresh the residence's payload but leave list pages be:
+                    # retiring every cached page each tick would defeat the cache.
+                    get_cache().delete(residence_key(video.residence_id))
+
+            encode_rendition(source, out_dir, name, width, height, video_bitrate, audio_bitrate, on_progress)
+
+        write_master_playlist(out_dir, renditions)
+        poster = extract_poster(source, duration, work_dir)
+        manifest = publish_hls(storage, video, out_dir)
+
+        video.refresh_from_db()
+        video.poster.save(f'{video.pk}.jpg', ContentFile(poster), save=False)
+        video.hls_manifest = manifest
+        video.transcode_status = 'ready'
+        video.transcode_progress = 100
+        video.transcode_updated_at = timezone.now()
+        video.save(update_fields=['poster', 'hls_manifest', 'transcode_status', 'transcode_progress',
+                                  'transcode_updated_at'])
+    except Exception:
+        logger.exception('Failed to transcode video %s', video_id)
+        delete_hls(storage, video)
+        set_transcode_status(video, transcode_status='failed')
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def schedule_transcode(video):
+    set_transcode_status(video, transcode_status='pending', transcode_progress=0)
+    run_after_commit('transcode', partial(transcode, video.pk), settings.VIDEO_TRANSCODE_WORKERS,
+                     settings.VIDEO_TRANSCODE_ASYNC)
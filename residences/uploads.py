@@ -0,0 +1,74 @@
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.utils import timezone
+
+BLOCK_SIZE = 64 * 1024
+
+
+class AssembledFile(File):
+    """
+    Completed upload on local disk. ``temporary_file_path`` lets
+    FileSystemStorage move it into place instead of copying it.
+    """
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def part_path(upload):
+    return os.path.join(settings.VIDEO_UPLOAD_TEMP_DIR, f'{upload.pk}.part')
+
+
+def create_part(upload):
+    os.makedirs(settings.VIDEO_UPLOAD_TEMP_DIR, exist_ok=True)
+    open(part_path(upload), 'wb').close()
+
+
+def write_chunk(upload, stream, limit):
+    """
+    Copy at most ``limit`` bytes from ``stream`` into the part file at the
+    upload's current offset, one block at a time. Returns the bytes written,
+    which may be short if the client disconnected mid-chunk.
+    """
+    written = 0
+    with open(part_path(upload), 'r+b') as f:
+        f.seek(upload.offset)
+        while written < limit:
+            block = stream.read(min(BLOCK_SIZE, limit - written))
+            if not block:
+                break
+            f.write(block)
+            written += len(block)
+        f.truncate()
+    return written
+
+
+def open_assembled(upload):
+    return AssembledFile(open(part_path(upload), 'rb'), name=upload.filename)
+
+
+def discard_part(upload):
+    try:
+        os.remove(part_path(upload))
+    except FileNotFoundError:
+        pass
+
+
+def expired(queryset):
+    """Uploads in ``queryset`` that have had no chunk for VIDEO_UPLOAD_EXPIRE_HOURS."""
+    cutoff = timezone.now() - timedelta(hours=settings.VIDEO_UPLOAD_EXPIRE_HOURS)
+    return queryset.filter(status='uploading', updated_at__lt=cutoff)
+
+
+def discard_expired(queryset):
+    """Delete the expired uploads in ``queryset`` and their part files; returns how many."""
+    discarded = 0
+    for upload in expired(queryset).only('pk'):
+        # Re-check the expiry on delete, in case a chunk arrived meanwhile.
+        if expired(queryset).filter(pk=upload.pk).delete()[0]:
+            discard_part(upload)
+            discarded += 1
+    return discarded
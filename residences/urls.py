@@ -1,6 +1,12 @@
 from rest_framework.routers import DefaultRouter
+from django.conf import settings
 from django.urls import path
-from .views import CustomUserViewSet, ResidenceViewSet, ImageViewSet, VideoViewSet, register, login_view, logout_view, get_user_details, stream_video, submit_residence_form
+from .views import CustomUserViewSet, ResidenceViewSet, ImageViewSet, VideoViewSet, register, login_view, logout_view, get_user_details, get_owner_dashboard, stream_video, stream_video_hls, submit_residence_form, \
+    create_video_upload, video_upload_detail, finalize_video_upload, create_direct_upload, get_user_details_async, stream_video_async, stream_video_hls_async, \
+    stream_residence_changes
+
+if settings.SERVER_MODE == 'asgi':
+    get_user_details, stream_video, stream_video_hls = get_user_details_async, stream_video_async, stream_video_hls_async
 
 router = DefaultRouter()
 router.register(r'users', CustomUserViewSet)
@@ -15,6 +21,18 @@ urlpatterns += [
     path('login/', login_view, name='login'),
     path('logout/', logout_view, name='logout'),
     path('user/me/', get_user_details, name='get_user_details'),
+    path('user/me/dashboard/', get_owner_dashboard, name='get_owner_dashboard'),
     path('submit-residence/', submit_residence_form, name='submit_residence_form'),
     path('stream_video/<uuid:video_id>/', stream_video, name='stream_video'),
+    path('stream_video/<uuid:video_id>/hls/', stream_video_hls, name='stream_video_hls'),
+    path('stream_video/<uuid:video_id>/hls/<str:name>', stream_video_hls, name='stream_video_hls_file'),
+    path('uploads/direct/', create_direct_upload, name='create_direct_upload'),
+    path('uploads/videos/', create_video_upload, name='create_video_upload'),
+    path('uploads/videos/<uuid:upload_id>/', video_upload_detail, name='video_upload_detail'),
+    path('uploads/videos/<uuid:upload_id>/finalize/', finalize_video_upload, name='finalize_video_upload'),
 ]
+
+# Each open stream would hold a sync worker for up to CHANGES_STREAM_MAX_SECONDS,
+# so the stream is only served in ASGI mode; WSGI clients poll residences/changes/.
+if settings.SERVER_MODE == 'asgi':
+    urlpatterns.append(path('residences/changes/stream/', stream_residence_changes, name='stream_residence_changes'))
@@ -1,43 +1,137 @@
 from django.shortcuts import render
 from rest_framework import viewsets, status
 from rest_framework.response import Response
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import action, api_view, permission_classes, throttle_classes
 from rest_framework.authtoken.models import Token
 from rest_framework.permissions import AllowAny, IsAuthenticated, IsAuthenticatedOrReadOnly
 from django.contrib.auth import authenticate, login, logout
-from .models import CustomUser, Residence, Image, Video
-from .serializers import CustomUserSerializer, ResidenceSerializer, ImageSerializer, VideoSerializer
+from .models import CustomUser, Residence, Image, Video, VideoUpload
+from .serializers import CustomUserSerializer, ResidenceSerializer, ImageSerializer, VideoSerializer, VideoUploadSerializer, requested_fields
+from .pagination import ResidenceCursorPagination
+from .filters import filter_residences, nearby_params, parse_param, parse_positive
+from .changes import ChangeStream, change_feed, feed_position, format_timestamp, parse_cursor, tombstone_horizon
+from .geo import nearest
+from .streaming import serve_file, streaming_body
+from .bulk import CSV_TYPES, NDJSON_TYPES, export_csv, export_ndjson, export_rows, import_residences, read_rows
+from .storage import direct_upload_key, local_path, owns_direct_upload, presigned_upload, storage_redirect
+from .media import apply_media_changes, content_hash
+from .authentication import aauthenticate, remember_token
+from .metrics import render as render_metrics
+from .renderers import render_response
+from .throttling import AuthIPThrottle, AuthUsernameThrottle, hashing_slot
+from .quotas import aget_plans, check_media_limits, enforce_quota, get_plan, owner_dashboard
+from .uploads import create_part, discard_expired, discard_part, open_assembled, write_chunk
+from .cache import cached_list_response, conditional_response, get_cache, residence_key, residence_payloads
+from django.db import transaction
+from django.db.models import prefetch_related_objects
 import logging
-from django.http import StreamingHttpResponse, HttpResponse
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_safe
+from rest_framework.exceptions import AuthenticationFailed, NotAuthenticated, ValidationError
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from django.utils import timezone
+from django.utils._os import safe_join
+import asyncio
+from datetime import timedelta
+import hmac
+import mimetypes
 import os
+import posixpath
+import uuid
 
 logger = logging.getLogger(__name__)
 
-MAX_LIMITS = {
-    'premium': {'residences': 5, 'images': 6, 'videos': 3},
-    'videos_subscribed': {'residences': 2, 'images': 6, 'videos': 1},
-    'images_subscribed': {'residences': 1, 'images': 6, 'videos': 0},
-    'freemium': {'residences': 1, 'images': 3, 'videos': 0}
+MAX_VIDEO_BYTES = 250 * 1024 * 1024
+MAX_IMAGE_BYTES = 20 * 1024 * 1024
+
+# Direct-upload kinds: (model, field, content type prefix, size limit).
+DIRECT_UPLOAD_FIELDS = {
+    'image': (Image, 'image', 'image/', MAX_IMAGE_BYTES),
+    'video': (Video, 'video', 'video/', MAX_VIDEO_BYTES),
+    'cover_image': (Residence, 'cover_image', 'image/', MAX_IMAGE_BYTES),
 }
 
+def get_list(data, key):
+    if hasattr(data, 'getlist'):
+        return data.getlist(key)
+    value = data.get(key, [])
+    return value if isinstance(value, list) else [value]
+
+def direct_upload_keys(request, kind, keys):
+    # Only keys presigned for this user that were actually uploaded may be attached.
+    model, field_name, _, max_bytes = DIRECT_UPLOAD_FIELDS[kind]
+    field = model._meta.get_field(field_name)
+    for key in keys:
+        if not owns_direct_upload(field, request.user, key) or not field.storage.exists(key):
+            raise ValidationError({'message': f'Unknown upload: {key}'})
+        if field.storage.size(key) > max_bytes:
+            raise ValidationError({'message': f'Upload {key} is larger than {max_bytes // (1024 * 1024)} MB.'})
+    return keys
+
 def handle_images(residence, images):
-    Image.objects.filter(residence=residence).delete()
-    for image in images:
-        Image.objects.create(residence=residence, image=image)
+    # Replace the residence's images; files that are re-uploaded unchanged keep their rows.
+    apply_media_changes(residence, Image, 'image', uploads=images, replace=True)
 
 def handle_videos(residence, videos):
-    Video.objects.filter(residence=residence).delete()
-    for video in videos:
-        Video.objects.create(residence=residence, video=video)
+    apply_media_changes(residence, Video, 'video', uploads=videos, replace=True)
 
 class CustomUserViewSet(viewsets.ModelViewSet):
     queryset = CustomUser.objects.all()
     serializer_class = CustomUserSerializer
 
 class ResidenceViewSet(viewsets.ModelViewSet):
-    queryset = Residence.objects.all()
+    queryset = Residence.objects.select_related('user').prefetch_related('images', 'videos')
     serializer_class = ResidenceSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    pagination_class = ResidenceCursorPagination
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            queryset = filter_residences(queryset, self.request.query_params)
+        fields = requested_fields(self.request) if self.request.method == 'GET' else None
+        if fields is not None:
+            # Skip prefetching media that a sparse fieldset leaves out.
+            queryset = queryset.prefetch_related(None).prefetch_related(
+                *[name for name in ('images', 'videos') if name in fields]
+            )
+        return queryset
+
+    def serialize_residences(self, residences):
+        prefetch_related_objects(residences, 'images', 'videos')
+        return self.get_serializer(residences, many=True).data
+
+    def list(self, request, *args, **kwargs):
+        if requested_fields(request) is not None:
+            return super().list(request, *args, **kwargs)
+
+        def build():
+            queryset = self.filter_queryset(self.get_queryset().prefetch_related(None))
+            page = self.paginate_queryset(queryset)
+            data = residence_payloads(page, request.build_absolute_uri('/'), self.serialize_residences)
+            return self.get_paginated_response(data).data
+
+        return cached_list_response(request, build)
+
+    def retrieve(self, request, *args, **kwargs):
+        if requested_fields(request) is not None:
+            return super().retrieve(request, *args, **kwargs)
+
+        base_url = request.build_absolute_uri('/')
+        try:
+            pk = uuid.UUID(str(kwargs[self.lookup_url_kwarg or self.lookup_field]))
+        except ValueError:
+            pk = None
+        entry = get_cache().get(residence_key(pk)) if pk else None
+        if entry and base_url in entry:
+            return conditional_response(request, entry[base_url])
+
+        instance = self.get_object()
+        data = residence_payloads([instance], base_url, self.serialize_residences)[0]
+        return conditional_response(request, data)
 
     def update(self, request, *args, **kwargs):
         partial = kwargs.pop('partial', False)
@@ -47,20 +141,184 @@ class ResidenceViewSet(viewsets.ModelViewSet):
         if 'cover_image' not in request.FILES:
             data['cover_image'] = instance.cover_image
 
-        serializer = self.get_serializer(instance, data=data, partial=partial)
-        serializer.is_valid(raise_exception=True)
-        self.perform_update(serializer)
-
         images = request.FILES.getlist('images')
         videos = request.FILES.getlist('videos')
 
-        if images:
-            handle_images(instance, images)
-        if videos:
-            handle_videos(instance, videos)
+        with transaction.atomic():
+            enforce_quota(request.user, residence=instance, images=len(images), videos=len(videos))
+            serializer = self.get_serializer(instance, data=data, partial=partial)
+            serializer.is_valid(raise_exception=True)
+            self.perform_update(serializer)
+
+            if images:
+                handle_images(instance, images)
+            if videos:
+                handle_videos(instance, videos)
+
+        if images or videos:
+            # Drop the prefetched media so the response reflects the new rows.
+            instance._prefetched_objects_cache = {}
 
         return Response(serializer.data)
 
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            enforce_quota(self.request.user)
+            serializer.save(user=self.request.user)
+
+    @action(detail=False, methods=['get'])
+    def nearby(self, request):
+        """
+        Residences within ``radius_km`` of ``lat``/``lng``, nearest first, up to
+        ``limit`` of them; the list filters apply too. Each result carries its
+        ``distance_km``. Residences without coordinates are never included.
+        """
+        lat, lng, radius, limit = nearby_params(request.query_params)
+        queryset = filter_residences(Residence.objects.all(), request.query_params)
+        found = nearest(queryset, lat, lng, radius, limit)
+
+        residences = self.get_queryset().prefetch_related(None).in_bulk([pk for _, pk in found])
+        ordered = [residences[pk] for _, pk in found if pk in residences]
+        if requested_fields(request) is None:
+            data = residence_payloads(ordered, request.build_absolute_uri('/'), self.serialize_residences)
+        else:
+            data = self.serialize_residences(ordered)
+        distances = {pk: distance for distance, pk in found}
+        results = [{**item, 'distance_km': round(distances[residence.pk], 3)} for residence, item in zip(ordered, data)]
+        return Response({'results': results})
+
+    @action(detail=False, methods=['get'])
+    def changes(self, request):
+        """
+        Residences changed or deleted since ``?since=`` (an ISO timestamp), oldest
+        first: ``changes`` holds their payloads and ``deleted`` their tombstones.
+        Poll the ``next`` link for what changes after that; until something
+        does it returns the same body, or 304 to ``If-None-Match``. ``has_more``
+        means another page is ready now. A ``since`` older than the tombstones
+        kept gets 410: re-fetch the list instead.
+        """
+        since, after = feed_position(request.query_params)
+        if since is not None and since < tombstone_horizon():
+            return Response({'message': 'since is too old to report deletions; re-fetch the residence list.'},
+                            status=status.HTTP_410_GONE)
+        limit = parse_param(request.query_params, 'limit', parse_positive(int, settings.CHANGES_MAX_RESULTS))
+        settled = True
+
+        def build():
+            nonlocal settled
+            events, next_since, next_after, more = change_feed(
+                self.get_queryset().prefetch_related(None), since, after, limit or settings.CHANGES_DEFAULT_RESULTS
+            )
+            # The position stops short of events still inside the settle window.
+            settled = not events or (next_since, next_after) == events[-1][:2]
+            changed = [residence for _, _, kind, residence in events if kind == 'change']
+            if requested_fields(request) is None:
+                data = residence_payloads(changed, request.build_absolute_uri('/'), self.serialize_residences)
+            else:
+                data = self.serialize_residences(changed)
+            next_url = request.build_absolute_uri()
+            if next_since is not None:
+                next_url = replace_query_param(next_url, 'since', format_timestamp(next_since))
+            next_url = (replace_query_param(next_url, 'after', next_after) if next_after
+                        else remove_query_param(next_url, 'after'))
+            return {
+                'changes': data,
+                'deleted': [
+                    {'id': str(pk), 'deleted_at': format_timestamp(timestamp)}
+                    for timestamp, pk, kind, _ in events if kind == 'delete'
+                ],
+                'next': next_url,
+                'has_more': more,
+            }
+
+        # Cached per URL until a residence changes, so idle polls don't reach the
+        # database. A page with unsettled events isn't: its next link would stay
+        # behind them until the next change or the TTL.
+        return cached_list_response(request, build, cacheable=lambda: settled)
+
+    @action(detail=False, methods=['post'], url_path='import', permission_classes=[IsAuthenticated])
+    def bulk_import(self, request):
+        """
+        Create residences for the current user from a CSV (``text/csv``) or
+        NDJSON (``application/x-ndjson``) request body, streamed a line at a time.
+        Returns the number created and per-row errors.
+        """
+        content_type = request.content_type.split(';')[0].strip().lower()
+        if content_type not in CSV_TYPES + NDJSON_TYPES:
+            return Response({'message': 'Send the rows as text/csv or application/x-ndjson.'}, status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+        created, errors = import_residences(request.user, read_rows(request._request, content_type))
+        return Response({'created': created, 'errors': errors},
+                        status=status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Stream listings as NDJSON, or CSV with ``?output=csv``, without loading
+        them into memory. ``?owner=me`` or ``?owner=<user id>`` limits the dump to
+        one owner; the list filters apply too.
+        """
+        queryset = filter_residences(Residence.objects.all(), request.query_params).order_by('-last_updated', '-id')
+        owner = request.query_params.get('owner')
+        if owner == 'me':
+            if not request.user.is_authenticated:
+                return Response({'message': 'Log in to export your own listings.'}, status=status.HTTP_401_UNAUTHORIZED)
+            queryset = queryset.filter(user=request.user)
+        elif owner:
+            try:
+                queryset = queryset.filter(user=uuid.UUID(owner))
+            except ValueError:
+                return Response({'owner': f'Invalid value: {owner!r}'}, status=status.HTTP_400_BAD_REQUEST)
+
+        storage = Residence._meta.get_field('cover_image').storage
+        rows = export_rows(queryset, lambda name: request.build_absolute_uri(storage.url(name)))
+        if request.query_params.get('output') == 'csv':
+            response = StreamingHttpResponse(streaming_body(export_csv(rows)), content_type='text/csv; charset=utf-8')
+            response['Content-Disposition'] = 'attachment; filename="residences.csv"'
+        else:
+            response = StreamingHttpResponse(streaming_body(export_ndjson(rows)), content_type='application/x-ndjson')
+            response['Content-Disposition'] = 'attachment; filename="residences.ndjson"'
+        return response
+
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
+    def media(self, request, pk=None):
+        """
+        Add, remove and reorder individual images and videos.
+
+        Accepts ``images``/``videos`` files, ``image_keys``/``video_keys`` and
+        ``cover_image_key`` from direct uploads, ``remove_images``/``remove_videos``
+        ids and ``image_order``/``video_order`` id lists.
+        """
+        residence = self.get_object()
+        if residence.user_id != request.user.pk:
+            return Response({'message': 'You can only edit your own residences.'}, status=status.HTTP_403_FORBIDDEN)
+
+        videos = request.FILES.getlist('videos')
+        for video in videos:
+            if video.size > MAX_VIDEO_BYTES:
+                return Response({'message': 'Each video must not exceed 250 MB in size.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        image_keys = direct_upload_keys(request, 'image', get_list(request.data, 'image_keys'))
+        video_keys = direct_upload_keys(request, 'video', get_list(request.data, 'video_keys'))
+        cover_image_key = request.data.get('cover_image_key')
+        if cover_image_key:
+            direct_upload_keys(request, 'cover_image', [cover_image_key])
+
+        with transaction.atomic():
+            plan = enforce_quota(request.user, residence=residence)
+            apply_media_changes(residence, Image, 'image', uploads=request.FILES.getlist('images'),
+                                remove=get_list(request.data, 'remove_images'), stored=image_keys,
+                                order=get_list(request.data, 'image_order') or None, limit=plan.max_images)
+            apply_media_changes(residence, Video, 'video', uploads=videos,
+                                remove=get_list(request.data, 'remove_videos'), stored=video_keys,
+                                order=get_list(request.data, 'video_order') or None, limit=plan.max_videos)
+            if cover_image_key:
+                residence.cover_image.name = cover_image_key
+                residence.save(update_fields=['cover_image', 'last_updated'])
+
+        residence._prefetched_objects_cache = {}
+        return Response(self.get_serializer(residence).data)
+
 class ImageViewSet(viewsets.ModelViewSet):
     queryset = Image.objects.all()
     serializer_class = ImageSerializer
@@ -71,31 +329,42 @@ class VideoViewSet(viewsets.ModelViewSet):
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([AuthIPThrottle, AuthUsernameThrottle])
 def register(request):
     serializer = CustomUserSerializer(data=request.data)
     if serializer.is_valid():
-        user = serializer.save()
+        with hashing_slot():
+            user = serializer.save()
         token, created = Token.objects.get_or_create(user=user)
+        remember_token(token, user)
         return Response({'token': token.key}, status=status.HTTP_201_CREATED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([AuthIPThrottle, AuthUsernameThrottle])
 def login_view(request):
     username = request.data.get('username')
     password = request.data.get('password')
-    user = authenticate(request, username=username, password=password)
+    # Also covers the upgrade to the current hasher on a successful login.
+    with hashing_slot():
+        user = authenticate(request, username=username, password=password)
     if user is not None:
-        login(request, user)
+        if hasattr(request, 'session'):
+            # Signs in the admin site too; production runs without sessions unless it is enabled.
+            login(request, user)
         token, created = Token.objects.get_or_create(user=user)
+        remember_token(token, user)
         return Response({'token': token.key}, status=status.HTTP_200_OK)
     return Response({'error': 'Invalid credentials'}, status=status.HTTP_400_BAD_REQUEST)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def logout_view(request):
-    request.user.auth_token.delete()
-    logout(request)
+    # Deleting the token evicts its cache entry (signals.token_deleted), revoking it at once.
+    Token.objects.filter(user=request.user).delete()
+    if hasattr(request, 'session'):
+        logout(request)
     return Response(status=status.HTTP_200_OK)
 
 @api_view(['GET'])
@@ -104,73 +373,373 @@ def get_user_details(request):
     serializer = CustomUserSerializer(request.user)
     return Response(serializer.data, status=status.HTTP_200_OK)
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_owner_dashboard(request):
+    return Response(owner_dashboard(request.user), status=status.HTTP_200_OK)
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def submit_residence_form(request):
     user = request.user
-    user_residences_count = Residence.objects.filter(user=user).count()
-
-    if user.is_on_premium:
-        subscription = 'premium'
-    elif user.is_videos_subscribed:
-        subscription = 'videos_subscribed'
-    elif user.is_images_subscribed:
-        subscription = 'images_subscribed'
-    else:
-        subscription = 'freemium'
-
-    max_residences = MAX_LIMITS[subscription]['residences']
-    max_images = MAX_LIMITS[subscription]['images']
-    max_videos = MAX_LIMITS[subscription]['videos']
-
-    if user_residences_count >= max_residences:
-        return Response({'message': f'You have reached the maximum limit of {max_residences} residences.'}, status=status.HTTP_400_BAD_REQUEST)
-
-    images = request.FILES.getlist('images')
-    videos = request.FILES.getlist('videos')
 
-    if len(images) > max_images:
-        return Response({'message': f'You can upload up to {max_images} images only.'}, status=status.HTTP_400_BAD_REQUEST)
+    with transaction.atomic():
+        # Locks the user's row until commit, so concurrent submissions can't overshoot the plan.
+        plan = enforce_quota(user)
 
-    if len(videos) > max_videos:
-        return Response({'message': f'You cannot upload videos with your current subscription.'}, status=status.HTTP_400_BAD_REQUEST)
-
-    for video in videos:
-        if video.size > 250 * 1024 * 1024:  # 250 MB limit
-            return Response({'message': 'Each video must not exceed 250 MB in size.'}, status=status.HTTP_400_BAD_REQUEST)
-        # Placeholder for video duration check (if needed)
+        images = request.FILES.getlist('images')
+        videos = request.FILES.getlist('videos')
+        check_media_limits(plan, len(images), len(videos))
+
+        for video in videos:
+            if video.size > MAX_VIDEO_BYTES:  # 250 MB limit
+                return Response({'message': 'Each video must not exceed 250 MB in size.'}, status=status.HTTP_400_BAD_REQUEST)
+            # Placeholder for video duration check (if needed)
+
+        serializer = ResidenceSerializer(data=request.data)
+        if serializer.is_valid():
+            residence = serializer.save(user=user)
+            handle_images(residence, images)
+            handle_videos(residence, videos)
+
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        else:
+            return Response({'errors': serializer.errors, 'message': 'Validation failed. Check the provided data.'}, status=status.HTTP_400_BAD_REQUEST)
+
+HLS_CONTENT_TYPES = {
+    '.m3u8': 'application/vnd.apple.mpegurl',
+    '.ts': 'video/mp2t',
+}
 
-    serializer = ResidenceSerializer(data=request.data)
-    if serializer.is_valid():
-        residence = serializer.save()
-        handle_images(residence, images)
-        handle_videos(residence, videos)
+def hls_response(request, video, name, asynchronous=False):
+    content_type = HLS_CONTENT_TYPES.get(os.path.splitext(name)[1])
+    if content_type is None:
+        return None
+    storage = video.video.storage
+    manifest_path = local_path(storage, video.hls_manifest)
+    if manifest_path is not None:
+        try:
+            path = safe_join(os.path.dirname(manifest_path), name)
+        except SuspiciousFileOperation:
+            return None
+        if not os.path.isfile(path):
+            return None
+        return serve_file(request, path, name=os.path.relpath(path, settings.MEDIA_ROOT), content_type=content_type,
+                          asynchronous=asynchronous)
+
+    storage_name = posixpath.join(posixpath.dirname(video.hls_manifest), name)
+    if not storage.exists(storage_name):
+        return None
+    if content_type == HLS_CONTENT_TYPES['.m3u8']:
+        # Playlists are proxied so their relative segment URIs resolve back here
+        # (and get signed) instead of pointing at the bare bucket.
+        with storage.open(storage_name) as f:
+            return HttpResponse(f.read(), content_type=content_type)
+    return storage_redirect(storage, storage_name)
+
+@api_view(['GET', 'HEAD'])
+@permission_classes([IsAuthenticatedOrReadOnly])
+def stream_video_hls(request, video_id, name='master.m3u8'):
+    try:
+        video = Video.objects.get(id=video_id, transcode_status='ready')
+    except Video.DoesNotExist:
+        return Response({'error': 'Video not found'}, status=status.HTTP_404_NOT_FOUND)
 
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
-    else:
-        return Response({'errors': serializer.errors, 'message': 'Validation failed. Check the provided data.'}, status=status.HTTP_400_BAD_REQUEST)
+    response = hls_response(request, video, name)
+    if response is None:
+        return Response({'error': 'Not found'}, status=status.HTTP_404_NOT_FOUND)
+    return response
 
-@api_view(['GET'])
+@api_view(['GET', 'HEAD'])
 @permission_classes([IsAuthenticatedOrReadOnly])
 def stream_video(request, video_id):
     try:
         video = Video.objects.get(id=video_id)
-        video_path = video.video.path
+        video_path = local_path(video.video.storage, video.video.name)
+        if video_path is None:
+            # Object storage serves the bytes (and ranges) itself.
+            return storage_redirect(video.video.storage, video.video.name)
 
         if not os.path.exists(video_path):
             return HttpResponse(status=404)
 
-        def video_stream():
-            try:
-                with open(video_path, 'rb') as f:
-                    while chunk := f.read(8192):  # Read in 8KB chunks
-                        yield chunk
-            except IOError as e:
-                logger.error(f"IOError while streaming video: {e}")
-                yield b''
-
-        response = StreamingHttpResponse(video_stream(), content_type="video/mp4")
-        response['Content-Disposition'] = f'inline; filename="{os.path.basename(video_path)}"'
-        return response
+        content_type = mimetypes.guess_type(video_path)[0] or 'video/mp4'
+        return serve_file(request, video_path, name=video.video.name, content_type=content_type)
+    except IOError as e:
+        logger.error(f"IOError while streaming video: {e}")
+        return HttpResponse(status=404)
     except Video.DoesNotExist:
         return Response({'error': 'Video not found'}, status=status.HTTP_404_NOT_FOUND)
+
+def media_response(request, name, asynchronous=False):
+    # A file under MEDIA_ROOT, or None when there's no such file.
+    try:
+        path = safe_join(settings.MEDIA_ROOT, name)
+    except SuspiciousFileOperation:
+        return None
+    if not os.path.isfile(path):
+        return None
+    return serve_file(request, path, name=name, asynchronous=asynchronous)
+
+@require_safe
+def serve_media(request, name):
+    """
+    MEDIA_URL for filesystem storage, with ranges and conditional requests
+    (handed to the front-end server when VIDEO_SENDFILE_BACKEND is set).
+    """
+    response = media_response(request, name)
+    if response is None:
+        return HttpResponse(status=404)
+    return response
+
+# Async variants of the read-only endpoints, routed in place of the views above
+# when SERVER_MODE is 'asgi' (see urls.py). Under ASGI, sync views share one
+# thread per process, so long streams there would queue behind each other.
+
+@csrf_exempt
+@require_safe
+async def get_user_details_async(request):
+    try:
+        user = await aauthenticate(request)
+        detail = NotAuthenticated.default_detail
+    except AuthenticationFailed as exc:
+        user, detail = None, exc.detail
+    if user is None:
+        response = render_response(request, {'detail': detail}, status.HTTP_401_UNAUTHORIZED)
+        response['WWW-Authenticate'] = 'Token'
+        return response
+    serializer = CustomUserSerializer(user, context={'plans': await aget_plans()})
+    return render_response(request, serializer.data)
+
+@csrf_exempt
+@require_safe
+async def stream_video_hls_async(request, video_id, name='master.m3u8'):
+    try:
+        video = await Video.objects.aget(id=video_id, transcode_status='ready')
+    except Video.DoesNotExist:
+        return JsonResponse({'error': 'Video not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    response = await asyncio.to_thread(hls_response, request, video, name, True)
+    if response is None:
+        return JsonResponse({'error': 'Not found'}, status=status.HTTP_404_NOT_FOUND)
+    return response
+
+@require_safe
+async def serve_media_async(request, name):
+    response = await asyncio.to_thread(media_response, request, name, True)
+    if response is None:
+        return HttpResponse(status=404)
+    return response
+
+@csrf_exempt
+@require_safe
+async def stream_video_async(request, video_id):
+    try:
+        video = await Video.objects.aget(id=video_id)
+    except Video.DoesNotExist:
+        return JsonResponse({'error': 'Video not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    video_path = local_path(video.video.storage, video.video.name)
+    if video_path is None:
+        return storage_redirect(video.video.storage, video.video.name)
+    try:
+        if not await asyncio.to_thread(os.path.exists, video_path):
+            return HttpResponse(status=404)
+        content_type = mimetypes.guess_type(video_path)[0] or 'video/mp4'
+        return serve_file(request, video_path, name=video.video.name, content_type=content_type, asynchronous=True)
+    except IOError as e:
+        logger.error(f"IOError while streaming video: {e}")
+        return HttpResponse(status=404)
+
+def change_stream(request):
+    """
+    The ChangeStream for a request, starting from Last-Event-ID after a
+    reconnect, else ``?since=``/``?after=``, else now.
+    """
+    last_event_id = request.headers.get('Last-Event-ID')
+    if last_event_id:
+        try:
+            since, after = parse_cursor(last_event_id)
+        except ValueError:
+            raise ValidationError({'Last-Event-ID': f'Invalid value: {last_event_id!r}'})
+    else:
+        since, after = feed_position(request.GET)
+    if since is None:
+        since = timezone.now() - timedelta(seconds=settings.CHANGES_SETTLE_SECONDS)
+    elif since < tombstone_horizon():
+        raise ValidationError({'since': 'since is too old to report deletions; re-fetch the residence list.'})
+    return ChangeStream(Residence.objects.all(), since, after)
+
+def event_stream_response(events):
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx buffering the events.
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+@require_safe
+async def stream_residence_changes(request):
+    """Server-sent ``change`` and ``delete`` events with residences' availability."""
+    try:
+        stream = change_stream(request)
+    except ValidationError as exc:
+        return JsonResponse(exc.detail, status=status.HTTP_400_BAD_REQUEST)
+    return event_stream_response(stream.aevents())
+
+def metrics_allowed(request):
+    if settings.METRICS_PUBLIC:
+        return True
+    if settings.METRICS_TOKEN:
+        scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+        if scheme.lower() == 'bearer' and hmac.compare_digest(credentials.encode(), settings.METRICS_TOKEN.encode()):
+            return True
+    user = getattr(request, 'user', None)
+    return bool(user and user.is_active and user.is_staff)
+
+@require_safe
+def metrics(request):
+    # Prometheus scrape endpoint: per-route latencies and counts aren't for the
+    # public, so it needs METRICS_TOKEN or a staff session (see settings.py).
+    if not metrics_allowed(request):
+        response = HttpResponse(status=status.HTTP_401_UNAUTHORIZED)
+        response['WWW-Authenticate'] = 'Bearer'
+        return response
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def create_direct_upload(request):
+    """
+    Presign an upload straight to object storage.
+
+    Expects ``kind`` (image, video or cover_image), ``filename``, ``content_type``
+    and ``size``. The client POSTs the file to ``url`` with ``fields``, then
+    attaches ``key`` through ``residences/<id>/media/``.
+    """
+    kind = request.data.get('kind')
+    if kind not in DIRECT_UPLOAD_FIELDS:
+        return Response({'message': f'kind must be one of: {", ".join(DIRECT_UPLOAD_FIELDS)}.'}, status=status.HTTP_400_BAD_REQUEST)
+    model, field_name, type_prefix, max_bytes = DIRECT_UPLOAD_FIELDS[kind]
+
+    filename = request.data.get('filename') or ''
+    content_type = request.data.get('content_type') or mimetypes.guess_type(filename)[0] or ''
+    if not content_type.startswith(type_prefix):
+        return Response({'message': f'content_type must be {type_prefix}*.'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        size = int(request.data.get('size'))
+    except (TypeError, ValueError):
+        return Response({'message': 'size is required.'}, status=status.HTTP_400_BAD_REQUEST)
+    if not 0 < size <= max_bytes:
+        return Response({'message': f'Files must not exceed {max_bytes // (1024 * 1024)} MB in size.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    field = model._meta.get_field(field_name)
+    key = direct_upload_key(field, request.user, filename)
+    upload = presigned_upload(field.storage, key, content_type, max_bytes)
+    if upload is None:
+        return Response({'message': 'Direct uploads need object storage (MEDIA_STORAGE=s3).'}, status=status.HTTP_501_NOT_IMPLEMENTED)
+    return Response({'key': key, 'url': upload['url'], 'fields': upload['fields'],
+                     'expires_in': settings.DIRECT_UPLOAD_EXPIRE}, status=status.HTTP_201_CREATED)
+
+def upload_response(upload, status_code=status.HTTP_200_OK):
+    response = Response(VideoUploadSerializer(upload).data, status=status_code)
+    response['Upload-Offset'] = upload.offset
+    response['Upload-Length'] = upload.length
+    return response
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def create_video_upload(request):
+    serializer = VideoUploadSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    residence = serializer.validated_data['residence']
+    length = serializer.validated_data['length']
+
+    if residence.user_id != request.user.pk:
+        return Response({'message': 'You can only upload videos to your own residences.'}, status=status.HTTP_403_FORBIDDEN)
+    if length > MAX_VIDEO_BYTES:
+        return Response({'message': 'Each video must not exceed 250 MB in size.'}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+    # Count finished videos and uploads still in flight so parallel uploads can't
+    # exceed the limit; abandoned uploads give their slot back.
+    discard_expired(residence.video_uploads.all())
+    max_videos = get_plan(request.user).max_videos
+    in_use = residence.video_count + residence.video_uploads.filter(status='uploading').count()
+    if in_use >= max_videos:
+        return Response({'message': f'You can upload up to {max_videos} videos only.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    upload = serializer.save(user=request.user)
+    create_part(upload)
+    response = upload_response(upload, status.HTTP_201_CREATED)
+    response['Location'] = request.build_absolute_uri(f'{upload.pk}/')
+    return response
+
+@api_view(['GET', 'HEAD', 'PATCH', 'DELETE'])
+@permission_classes([IsAuthenticated])
+def video_upload_detail(request, upload_id):
+    try:
+        upload = VideoUpload.objects.get(id=upload_id, user=request.user)
+    except VideoUpload.DoesNotExist:
+        return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    if request.method in ('GET', 'HEAD'):
+        return upload_response(upload)
+
+    if request.method == 'DELETE':
+        if upload.status == 'uploading':
+            discard_part(upload)
+        upload.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    if upload.status != 'uploading':
+        return Response({'error': 'Upload is already complete'}, status=status.HTTP_409_CONFLICT)
+    try:
+        offset = int(request.headers['Upload-Offset'])
+        chunk_length = int(request.headers['Content-Length'])
+    except (KeyError, ValueError):
+        return Response({'error': 'Upload-Offset and Content-Length headers are required'}, status=status.HTTP_400_BAD_REQUEST)
+    if chunk_length > settings.VIDEO_UPLOAD_MAX_CHUNK:
+        return Response({'error': f'Chunks must not exceed {settings.VIDEO_UPLOAD_MAX_CHUNK} bytes'}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+    if offset + chunk_length > upload.length:
+        return Response({'error': 'Chunk exceeds the declared upload length'}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+    with transaction.atomic():
+        # Lock the row so two PATCHes can't write at the same offset.
+        upload = VideoUpload.objects.select_for_update().get(pk=upload.pk)
+        if offset != upload.offset:
+            return upload_response(upload, status.HTTP_409_CONFLICT)
+        written = write_chunk(upload, request.stream, chunk_length) if chunk_length else 0
+        upload.offset += written
+        upload.save(update_fields=['offset', 'updated_at'])
+    return upload_response(upload)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def finalize_video_upload(request, upload_id):
+    with transaction.atomic():
+        # Lock the upload and check it again, so concurrent finalize calls add one video.
+        try:
+            upload = VideoUpload.objects.select_for_update(of=('self',)).select_related('residence').get(
+                id=upload_id, user=request.user
+            )
+        except VideoUpload.DoesNotExist:
+            return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+        if upload.status == 'complete':
+            return upload_response(upload)
+        if upload.offset != upload.length:
+            return upload_response(upload, status.HTTP_409_CONFLICT)
+
+        plan = enforce_quota(request.user, residence=upload.residence)
+        if upload.residence.video_count >= plan.max_videos:
+            # Refuse before storing moves the part file away, so the upload can still be retried.
+            return Response({'message': f'You can upload up to {plan.max_videos} videos only.'}, status=status.HTTP_400_BAD_REQUEST)
+        with open_assembled(upload) as assembled:
+            digest = content_hash(assembled)
+            # Appended after the residence's videos and stored content-addressed,
+            # like any other upload; identical content resolves to the existing video.
+            apply_media_changes(upload.residence, Video, 'video', uploads=[assembled], digests=[digest],
+                                limit=plan.max_videos)
+        upload.video = Video.objects.filter(residence=upload.residence, content_hash=digest).first()
+        upload.status = 'complete'
+        upload.save(update_fields=['video', 'status', 'updated_at'])
+    discard_part(upload)
+    return upload_response(upload)